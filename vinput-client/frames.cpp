@@ -0,0 +1,153 @@
+/*
+   VInput server - frame parsing and action scheduling
+*/
+
+/*
+ * Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <cstring>
+#include <time.h>
+#include <arpa/inet.h>
+
+#include "frames.h"
+
+FrameParser::FrameParser(): start(0), end(0)
+{}
+
+unsigned char *FrameParser::space(size_t &size)
+{
+	if (end == sizeof(buffer))
+	{
+		// Move the incomplete frame to the front
+		memmove(buffer, buffer + start, end - start);
+		end -= start;
+		start = 0;
+	}
+	size = sizeof(buffer) - end;
+	return buffer + end;
+}
+
+void FrameParser::feed(size_t bytes)
+{
+	end += bytes;
+}
+
+bool FrameParser::next(Frame &frame)
+{
+	if (end - start < FRAME_SIZE)
+	{
+		if (start == end)
+			start = end = 0;
+		return false;
+	}
+	const unsigned char *data = buffer + start;
+	uint16_t x, y;
+	memcpy(&x, data + 2, sizeof(x));
+	memcpy(&y, data + 4, sizeof(y));
+	if (data[0] == '#' and data[1] == '#')
+	{
+		// HELO: the coordinates are the resolution
+		frame.opcode = '#';
+		frame.pointer = 0;
+	}
+	else
+	{
+		frame.opcode = data[0];
+		frame.pointer = data[1];
+	}
+	frame.x = ntohs(x);
+	frame.y = ntohs(y);
+	start += FRAME_SIZE;
+	return true;
+}
+
+ActionScheduler::ActionScheduler(unsigned int pointers, perform_ptr perform, void *context):
+	pointers(pointers), performFunc(perform), context(context),
+	queues(new std::deque<Action>[pointers]), busyUntil(new uint64_t[pointers])
+{
+	for (unsigned int i=0;i<pointers;i++)
+		busyUntil[i] = 0;
+}
+
+ActionScheduler::~ActionScheduler()
+{
+	delete[] queues;
+	delete[] busyUntil;
+}
+
+uint64_t ActionScheduler::now()
+{
+	struct timespec ts;
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return static_cast<uint64_t>(ts.tv_sec)*1000 + ts.tv_nsec/1000000;
+}
+
+void ActionScheduler::perform(unsigned int pointer, const Action &action)
+{
+	unsigned int delay = (*performFunc)(context, pointer, action);
+	if (delay)
+		busyUntil[pointer] = now() + delay;
+}
+
+void ActionScheduler::push(unsigned int pointer, const Action &action)
+{
+	if (pointer >= pointers)
+		return;
+	// Later actions never overtake queued ones
+	if (queues[pointer].empty() and busyUntil[pointer] <= now())
+		perform(pointer, action);
+	else
+		queues[pointer].push_back(action);
+}
+
+void ActionScheduler::run()
+{
+	for (unsigned int i=0;i<pointers;i++)
+	{
+		while (!queues[i].empty() and busyUntil[i] <= now())
+		{
+			Action action = queues[i].front();
+			queues[i].pop_front();
+			perform(i, action);
+		}
+	}
+}
+
+int ActionScheduler::timeout() const
+{
+	uint64_t current = now(), next = 0;
+	bool found = false;
+	for (unsigned int i=0;i<pointers;i++)
+	{
+		if (queues[i].empty())
+			continue;
+		if (!found or busyUntil[i] < next)
+			next = busyUntil[i];
+		found = true;
+	}
+	if (!found)
+		return -1;
+	return next > current ? static_cast<int>(next - current) : 0;
+}
+
+size_t ActionScheduler::pending() const
+{
+	size_t count = 0;
+	for (unsigned int i=0;i<pointers;i++)
+		count += queues[i].size();
+	return count;
+}
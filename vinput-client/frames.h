@@ -0,0 +1,114 @@
+/*
+ * Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#ifndef __FRAMES_H__
+#define __FRAMES_H__
+
+#include <deque>
+#include <stdint.h>
+#include <sys/types.h>
+
+#define FRAME_SIZE 6
+
+/**
+ * One frame of the vinput protocol: opcode, pointer number and the
+ * coordinates. A HELO ("##", width, height) has the opcode '#'.
+ */
+struct Frame {
+	unsigned char opcode, pointer;
+	uint16_t x, y;
+};
+
+/**
+ * Splits the byte stream of a server into frames, however the reads cut
+ * it: feed() takes what recv() returned, next() returns the complete
+ * frames in order and keeps an incomplete one for the next feed().
+ */
+class FrameParser {
+	public:
+		FrameParser();
+		/**
+		 * Returns where the next recv() should write to and how many bytes
+		 * fit there.
+		 */
+		unsigned char *space(size_t &size);
+		/**
+		 * Takes bytes recv() wrote to space().
+		 */
+		void feed(size_t bytes);
+		/**
+		 * Decodes the next complete frame; returns false if there is none.
+		 */
+		bool next(Frame &frame);
+	private:
+		unsigned char buffer[64*FRAME_SIZE*16];
+		size_t start, end;
+};
+
+/**
+ * Something the client does with one of its pointers.
+ */
+struct Action {
+	unsigned char opcode;
+	uint16_t x, y;
+};
+
+/**
+ * Carries out the actions of every pointer in order, keeping a delay
+ * after presses and releases so the X server sees them separately,
+ * without blocking the other pointers or the receive loop: actions of a
+ * pointer that is waiting are queued and carried out by run() once it
+ * is due. The receive loop polls its socket with timeout() as timeout.
+ */
+class ActionScheduler {
+	public:
+		/**
+		 * perform(context, pointer, action) carries out an action and
+		 * returns the milliseconds the pointer has to wait afterwards.
+		 */
+		typedef unsigned int (*perform_ptr) (void*, unsigned int, const Action&);
+		ActionScheduler(unsigned int pointers, perform_ptr perform, void *context);
+		~ActionScheduler();
+		/**
+		 * Carries out an action at once, or queues it while the pointer
+		 * is waiting.
+		 */
+		void push(unsigned int pointer, const Action &action);
+		/**
+		 * Carries out the queued actions that are due.
+		 */
+		void run();
+		/**
+		 * Returns the milliseconds until the next queued action is due,
+		 * -1 if nothing is queued.
+		 */
+		int timeout() const;
+		/**
+		 * Returns the number of queued actions.
+		 */
+		size_t pending() const;
+	private:
+		static uint64_t now();
+		void perform(unsigned int pointer, const Action &action);
+		unsigned int pointers;
+		perform_ptr performFunc;
+		void *context;
+		std::deque<Action> *queues;
+		uint64_t *busyUntil;
+};
+
+#endif
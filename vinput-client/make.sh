@@ -2,4 +2,4 @@
 
 cd `dirname $0`
 rm mpx-client
-g++ *.cpp $CPPFLAGS -lXi -Wall -o mpx-client -D MPX
+g++ *.cpp $CPPFLAGS -lXi -lrt -Wall -o mpx-client -D MPX
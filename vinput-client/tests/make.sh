@@ -0,0 +1,5 @@
+#!/bin/sh
+
+# Builds and runs the tests of the client parts that need no X server
+cd `dirname $0`
+g++ test-frames.cpp ../frames.cpp $CPPFLAGS -lrt -Wall -o test-frames && ./test-frames
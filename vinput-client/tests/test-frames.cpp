@@ -0,0 +1,155 @@
+/*
+   VInput client - tests of the frame parsing and action scheduling
+*/
+
+/*
+ * Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <cstdio>
+#include <cstring>
+#include <vector>
+
+#include "../frames.h"
+
+static int failures = 0;
+
+#define CHECK(condition) \
+	if (!(condition)) \
+	{ \
+		fprintf(stderr, "%s:%i: %s failed\n", __FILE__, __LINE__, #condition); \
+		failures++; \
+	}
+
+// Appends a frame as the server sends it
+static void encode(std::vector<unsigned char> &data, unsigned char opcode,
+                   unsigned char pointer, uint16_t x, uint16_t y)
+{
+	unsigned char frame[FRAME_SIZE] = {opcode, pointer,
+	                                   (unsigned char)(x >> 8), (unsigned char)x,
+	                                   (unsigned char)(y >> 8), (unsigned char)y};
+	data.insert(data.end(), frame, frame + FRAME_SIZE);
+}
+
+// Feeds data to parser in pieces of at most piece bytes; returns the frames
+static std::vector<Frame> parse(FrameParser &parser,
+                                const std::vector<unsigned char> &data,
+                                size_t piece)
+{
+	std::vector<Frame> frames;
+	Frame frame;
+	for (size_t offset=0;offset<data.size();)
+	{
+		size_t size;
+		unsigned char *space = parser.space(size);
+		if (size > piece)
+			size = piece;
+		if (size > data.size() - offset)
+			size = data.size() - offset;
+		memcpy(space, &data[offset], size);
+		parser.feed(size);
+		offset += size;
+		while (parser.next(frame))
+			frames.push_back(frame);
+	}
+	return frames;
+}
+
+static void test_frame_parser()
+{
+	std::vector<unsigned char> data;
+	encode(data, '#', '#', 1280, 720);
+	// More frames than the buffer holds, so its end is reached with a
+	// frame cut in two
+	for (unsigned int i=0;i<5000;i++)
+		encode(data, "d.u"[i % 3], i % 7, i, 65535 - i);
+	size_t pieces[] = {1, 5, 7, 4096, 100000};
+	for (size_t p=0;p<sizeof(pieces)/sizeof(pieces[0]);p++)
+	{
+		FrameParser parser;
+		std::vector<Frame> frames = parse(parser, data, pieces[p]);
+		CHECK(frames.size() == 5001);
+		if (frames.size() != 5001)
+			continue;
+		CHECK(frames[0].opcode == '#' and frames[0].pointer == 0);
+		CHECK(frames[0].x == 1280 and frames[0].y == 720);
+		bool same = true;
+		for (unsigned int i=0;i<5000;i++)
+		{
+			const Frame &frame = frames[i+1];
+			same = same and frame.opcode == "d.u"[i % 3] and
+			       frame.pointer == i % 7 and frame.x == i and
+			       frame.y == 65535 - i;
+		}
+		CHECK(same);
+		Frame frame;
+		CHECK(!parser.next(frame));
+	}
+}
+
+struct Performed {
+	unsigned int pointer;
+	unsigned char opcode;
+};
+
+// Records the actions; presses and releases keep the pointer waiting
+static unsigned int perform(void *context, unsigned int pointer,
+                            const Action &action)
+{
+	Performed performed = {pointer, action.opcode};
+	static_cast<std::vector<Performed>*>(context)->push_back(performed);
+	return action.opcode == '.' ? 0 : 100000;
+}
+
+static void test_action_scheduler()
+{
+	std::vector<Performed> performed;
+	ActionScheduler scheduler(2, perform, &performed);
+	CHECK(scheduler.timeout() == -1);
+	Action motion = {'.', 1, 2}, press = {'d', 1, 2}, release = {'u', 1, 2};
+	scheduler.push(0, motion);
+	scheduler.push(0, press);
+	// Pointer 0 waits after the press, pointer 1 does not
+	scheduler.push(0, motion);
+	scheduler.push(0, release);
+	scheduler.push(1, motion);
+	scheduler.push(1, press);
+	scheduler.push(2, press);
+	scheduler.run();
+	CHECK(performed.size() == 4);
+	if (performed.size() == 4)
+	{
+		CHECK(performed[0].pointer == 0 and performed[0].opcode == '.');
+		CHECK(performed[1].pointer == 0 and performed[1].opcode == 'd');
+		CHECK(performed[2].pointer == 1 and performed[2].opcode == '.');
+		CHECK(performed[3].pointer == 1 and performed[3].opcode == 'd');
+	}
+	CHECK(scheduler.pending() == 2);
+	CHECK(scheduler.timeout() > 0);
+}
+
+int main()
+{
+	test_frame_parser();
+	test_action_scheduler();
+	if (failures)
+	{
+		fprintf(stderr, "%i checks failed\n", failures);
+		return 1;
+	}
+	printf("OK\n");
+	return 0;
+}
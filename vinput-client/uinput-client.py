@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ This program is the Python reference client: it connects to a vinput
+ server and feeds its touches into one uinput pointer device per pointer
+ number, writing each device once per received batch (see
+ vinputserver.uinput). Unlike mpx-client it does not set up XInput2
+ master devices.
+
+ Usage: uinput-client.py [-d] [-c POINTERS] [--max-rate=N] [ADDRESS]
+        ADDRESS is written like the stream addresses of the servers' -l
+        (default: 127.0.0.1:1243)
+        --max-rate asks the server for at most N motion updates per
+        second (0: as many as the client takes, see
+        vinputserver.ratelimit)
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+
+ License:
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+########## Defaults ##########
+
+DEBUG = False
+DEF_SERVER = '127.0.0.1:1243'
+
+##############################
+
+import sys, socket
+
+from vinputserver import common
+from vinputserver.common import debug_output, parse_addr, SHM_FAMILY
+from vinputserver.uinput import UInputClient, DEF_POINTERS
+from vinputserver.ratelimit import encode_rate_request
+
+def main():
+	'''main program - connects to the server and runs the client'''
+	global DEBUG
+	common.DEBUG = DEBUG
+	pointers = DEF_POINTERS
+	server = DEF_SERVER
+	max_rate = None
+	args = sys.argv[1:]
+	try:
+		while len(args) > 0:
+			if args[0] in ('-d', '--debug'):
+				DEBUG = common.DEBUG = True
+				args.pop(0)
+			elif args[0] == '-c':
+				pointers = int(args[1])
+				if pointers <= 0:
+					raise ValueError, 'invalid pointer count'
+				args.pop(0)
+				args.pop(0)
+			elif args[0].startswith('--max-rate='):
+				max_rate = int(args[0][11:])
+				if not 0 <= max_rate <= 0xffff:
+					raise ValueError, 'invalid rate'
+				args.pop(0)
+			elif args[0].startswith('-'):
+				print >> sys.stderr, 'Unknown parameter "%s". Aborted.' \
+				                     % args[0]
+				sys.exit(1)
+			else:
+				server = args.pop(0)
+		family, sock_type, sock_prot, addr = parse_addr(server)
+		if family == SHM_FAMILY or sock_type != socket.SOCK_STREAM:
+			raise ValueError, 'the server needs a stream socket'
+	except IndexError:
+		print >> sys.stderr, 'Parameter "%s" needs an argument. Aborted.' \
+		                     % args[0]
+		sys.exit(1)
+	except ValueError:
+		print >> sys.stderr, 'Invalid syntax for parameter "%s". Aborted.' \
+		                     % (args and args[0] or server)
+		sys.exit(1)
+	sock = socket.socket(family, sock_type, sock_prot)
+	try:
+		sock.connect(addr)
+	except socket.error, e:
+		print >> sys.stderr, 'Could not connect to server: %s' % e.args[-1]
+		sys.exit(3)
+	if max_rate is not None:
+		sock.sendall(encode_rate_request(max_rate))
+	client = UInputClient(sock, pointers)
+	try:
+		client.run()
+	except KeyboardInterrupt:
+		pass
+	except (OSError, IOError), e:
+		print >> sys.stderr, 'uinput error: %s' % e
+	finally:
+		debug_output('%i frames in %i batches, %i writes, %i bytes'
+		             % client.stats())
+		client.close()
+		sock.close()
+
+if __name__ == '__main__':
+	main()
@@ -26,17 +26,24 @@
 #include <cstdio>
 #include <iostream>
 #include <stdlib.h>
+#include <cerrno>
+#include <cstring>
+#include <poll.h>
 #include <netinet/in.h>
 #include <sys/socket.h>
 #include <arpa/inet.h>
 
 #include "uinput.h"
+#include "frames.h"
 #ifdef MPX
 #include "xinput.h"
 #endif
 
-int Debug=0, Mpx=1;
+int Debug=0, Mpx=1, DryRun=0;
 std::string addrStr="127.0.0.1";
+int port=1243;
+// Motion updates per second asked of the server (-1: all, 0: inferred)
+int maxRate=-1;
 
 volatile static sig_atomic_t killed = 0;
 void schedule_terminate (int param)
@@ -69,6 +76,58 @@ inline int myrecv(int sock, unsigned char *buffer, size_t bufsize, int flags = 0
 }
 
 #define POINTER_COUNT 4
+// Milliseconds a pointer waits after a press or release, so the X server
+// sees the position before the button and every click as one
+#define CLICK_DELAY 20
+
+/**
+ * Carries out an action with a pointer (see ActionScheduler); 'c' clicks
+ * after the move of a '!'. Without a device (--dry-run), the action is
+ * printed instead.
+ */
+unsigned int performAction(void *context, unsigned int pointernum, const Action &action)
+{
+	UInputAbsPointer *pointer = static_cast<UInputAbsPointer**>(context)[pointernum];
+	if (DryRun)
+	{
+		if (action.opcode != 'c')
+			printf("ACTION %c POINTER %u [ %hu, %hu ]\n", action.opcode, pointernum, action.x, action.y);
+		pointer = 0;
+	}
+	switch (action.opcode)
+	{
+		case '.':
+			if (pointer) pointer->moveTo(action.x, action.y);
+			return 0;
+		case '!':
+			if (pointer) pointer->moveTo(action.x, action.y);
+			return CLICK_DELAY;
+		case 'c':
+			if (pointer) pointer->click();
+			return 0;
+		case 'd':
+			if (pointer) pointer->press();
+			return CLICK_DELAY;
+		case 'D':
+			if (pointer)
+			{
+				pointer->moveTo(action.x, action.y);
+				pointer->press();
+			}
+			return CLICK_DELAY;
+		case 'u':
+			if (pointer) pointer->release();
+			return CLICK_DELAY;
+		case 'U':
+			if (pointer)
+			{
+				pointer->moveTo(action.x, action.y);
+				pointer->release();
+			}
+			return CLICK_DELAY;
+	}
+	return 0;
+}
 
 void mainLoop(int sock)
 {
@@ -76,25 +135,32 @@ void mainLoop(int sock)
 	uint8_t devcount = POINTER_COUNT;
 	UInputAbsPointer *uinputs[POINTER_COUNT];
 	Display *display = 0;
-	UInputAbsPointer *pointer = 0;
 	
-	unsigned char buffer[7];
+	FrameParser parser;
+	Frame frame;
+	unsigned char *space;
+	size_t size;
 	int bytes;
 	
-	// Warte auf HELO
-	bytes = myrecv(sock, buffer, sizeof(buffer) - 1, 0);
-	if (bytes == -1)
+	// Warte auf HELO; die Frames danach können im selben Paket kommen
+	while (!parser.next(frame))
 	{
-		perror("recv() fehlgeschlagen");
- 		return;
+		space = parser.space(size);
+		bytes = myrecv(sock, space, size, 0);
+		if (bytes == -1)
+		{
+			perror("recv() fehlgeschlagen");
+			return;
+		}
+		else if (bytes == 0)
+			return;
+		parser.feed(bytes);
 	}
-	else if (bytes == 0)
-		return;
-	else if ((bytes >= 6) and (buffer[0] == '#') and (buffer[1] == '#'))
+	if (frame.opcode == '#')
 	{
 		// Got HELO
-		width = ntohs(*(reinterpret_cast<uint16_t*>(&buffer[2])));
-		height = ntohs(*(reinterpret_cast<uint16_t*>(&buffer[4])));
+		width = frame.x;
+		height = frame.y;
 	}
 	else
 	{
@@ -108,7 +174,7 @@ void mainLoop(int sock)
 		std::string name = "MTC Touchpoint ";
 		name += i2str(i);
 		// Erzeuge UInput-Gerät
-		uinputs[i] = new UInputAbsPointer(name, width, height);
+		uinputs[i] = DryRun ? 0 : new UInputAbsPointer(name, width, height);
 	}
 	
 	// Verbinde zu X-Display
@@ -148,73 +214,69 @@ void mainLoop(int sock)
 	#endif
 	
 	// Befehlsschleife
-	while (!killed)
+	ActionScheduler scheduler(POINTER_COUNT, &performAction, uinputs);
+	struct pollfd pfd;
+	pfd.fd = sock;
+	pfd.events = POLLIN;
+	bool connected = true;
+	while (!killed and (connected or scheduler.pending()))
 	{
-		bytes = myrecv(sock, buffer, sizeof(buffer) - 1, 0);
-		buffer[bytes] = 0;
-		if (bytes == -1)
+		// Wait for data, but no longer than until the next queued action
+		// is due
+		pfd.revents = 0;
+		if (poll(&pfd, connected ? 1 : 0, scheduler.timeout()) == -1 and errno != EINTR)
 		{
-			perror("recv() fehlgeschlagen");
+			perror("poll() fehlgeschlagen");
 			break;
 		}
-		if (bytes == 0)
-			break;
-
-		/*while (bytes < 6)
+		if (connected and (pfd.revents & (POLLIN | POLLHUP | POLLERR)))
 		{
-			int i = recv(sock, buffer+bytes, sizeof(buffer-bytes) - 1, 0);
-			if (i <= 0) break;
-			bytes += i;
-			buffer[bytes] = 0;
-		}*/
-		
-		if (bytes >= 6)
-		{
-			unsigned char opcode = buffer[0], pointernum = buffer[1];
-			uint16_t xcoord = ntohs(*(reinterpret_cast<uint16_t*>(&buffer[2]))),
-						ycoord = ntohs(*(reinterpret_cast<uint16_t*>(&buffer[4])));
-			if (Debug) printf("ACTION %c POINTER %hhu [ %hu, %hu ]\n", opcode, pointernum, xcoord, ycoord);
-			if (pointernum < POINTER_COUNT)
+			space = parser.space(size);
+			bytes = myrecv(sock, space, size, 0);
+			if (bytes == -1)
 			{
-				pointer = uinputs[pointernum];
+				if (errno == EINTR)
+					continue;
+				perror("recv() fehlgeschlagen");
+				break;
 			}
-			else continue;
+			if (bytes == 0)
+				// Carry out the queued actions before quitting
+				connected = false;
+			else
+				parser.feed(bytes);
 			
-			if (opcode == '.')
-				pointer->moveTo(xcoord, ycoord);
-			else if (opcode == '!')
-			{
-				pointer->moveTo(xcoord, ycoord);
-				usleep(20000);
-				pointer->click();
-			}
-			else if (opcode == 'd')
+			// Every complete frame of the data read so far
+			while (parser.next(frame))
 			{
-				pointer->press();
-				usleep(20000);
-			}
-			else if (opcode == 'D')
-			{
-				pointer->moveTo(xcoord, ycoord);
-				pointer->press();
-				usleep(20000);
+				if (Debug) printf("ACTION %c POINTER %hhu [ %hu, %hu ]\n", frame.opcode, frame.pointer, frame.x, frame.y);
+				if (frame.opcode == '#')
+				{
+					// The devices keep the resolution of the first HELO
+					std::cerr << "Ignoring new resolution " << frame.x << "x" << frame.y << std::endl;
+					continue;
+				}
+				if (frame.pointer >= POINTER_COUNT)
+					continue;
+				if (!strchr(".!dDuU", frame.opcode) or frame.opcode == 0)
+				{
+					printf("Unknown opcode '%c' received.\n", frame.opcode);
+					continue;
+				}
+				Action action = { frame.opcode, frame.x, frame.y };
+				scheduler.push(frame.pointer, action);
+				if (frame.opcode == '!')
+				{
+					// Click CLICK_DELAY ms after the move
+					action.opcode = 'c';
+					scheduler.push(frame.pointer, action);
+				}
 			}
-			else if (opcode == 'u')
-			{
-				pointer->release();
-				usleep(20000);
-			}
-			else if (opcode == 'U')
-			{
-				pointer->moveTo(xcoord, ycoord);
-				pointer->release();
-				usleep(20000);
-			}
-			else { printf("Unknown opcode '%c' received.\n", opcode); }
 		}
-		else
-			std::cerr << "Received invalid data: " << buffer << std::endl;
+		scheduler.run();
 	}
+	if (DryRun)
+		fflush(stdout);
 	
 	
 	for (i=POINTER_COUNT-1;i>0;i--)
@@ -267,6 +329,37 @@ int main(int argc, char**argv)
 			Debug=1;
 			std::cerr << "Debug" << std::endl;
 		}
+		if (strcmp(argv[i], "--dry-run") == 0)
+		{
+			// No devices: print the actions
+			DryRun=1;
+			Mpx=0;
+		}
+		if (strcmp(argv[i], "--port") == 0)
+		{
+			if(i+1 < argc) {
+				port=atoi(argv[i+1]);
+				i++;
+			} else {
+				std::cerr << "Missing parameter for --port!" << std::endl;
+				exit(1);
+			}
+		}
+		if (strcmp(argv[i], "--max-rate") == 0)
+		{
+			if(i+1 < argc) {
+				maxRate=atoi(argv[i+1]);
+				i++;
+			} else {
+				std::cerr << "Missing parameter for --max-rate!" << std::endl;
+				exit(1);
+			}
+			if (maxRate < 0 or maxRate > 0xffff)
+			{
+				std::cerr << "Invalid parameter for --max-rate!" << std::endl;
+				exit(1);
+			}
+		}
 		if (strcmp(argv[i], "--addr") == 0)
 		{
 			if(i+1 < argc) {
@@ -300,7 +393,7 @@ int main(int argc, char**argv)
 	// Clear structure
 	memset(&addr, 0, sizeof(struct sockaddr_in));
 	addr.sin_family = AF_INET;
-	addr.sin_port = htons(1243);
+	addr.sin_port = htons(port);
 	addr.sin_addr.s_addr = inet_addr(addrStr.c_str());
 	if(Debug)
 		std::cerr << "Listening to " + addrStr << std::endl;
@@ -309,6 +402,15 @@ int main(int argc, char**argv)
 		perror("Could not connect to server!");
 		return 3;
 	}
+	if (maxRate >= 0)
+	{
+		// Rate request: "#F", 16-bit updates per second
+		unsigned char request[4] = { '#', 'F',
+			static_cast<unsigned char>(maxRate >> 8),
+			static_cast<unsigned char>(maxRate & 0xff) };
+		if (send(s, request, sizeof(request), 0) != sizeof(request))
+			perror("Could not send the rate request");
+	}
 	
 	mainLoop(s);
 	close(s);
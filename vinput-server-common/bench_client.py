@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ Checks the uinput client (vinput-client) under bursty load.
+
+ A local test server sends touches of four pointers in bursts of many
+ frames, cut at random points so frames are split across reads. The
+ client runs with --dry-run and prints every action it carries out; each
+ pointer has to get all its frames in the order they were sent. The time
+ the client needed is compared to the CLICK_DELAY waits after the
+ presses and releases of the busiest pointer, and to the time sleeping
+ after every press of every pointer would take.
+
+ Usage: bench_client.py [client binary] [events] [burst size]
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import os, sys, time, random, socket, subprocess
+
+from vinputserver.protocol import encode_helo, FrameEncoder
+
+POINTERS = 4
+# Milliseconds the client waits after a press or release
+CLICK_DELAY = 20
+# Chance of a touch starting or ending with an event
+PRESS_RATE = 0.02
+DEF_CLIENT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          '..', 'vinput-client', 'mpx-client')
+
+def events(count):
+	'''Returns random touches of all pointers'''
+	rand = random.Random(0)
+	down = [False]*POINTERS
+	result = []
+	for index in xrange(count):
+		pointer = rand.randrange(POINTERS)
+		xcoord, ycoord = index & 0xffff, rand.randrange(720)
+		if rand.random() < PRESS_RATE:
+			opcode = 'u' if down[pointer] else 'd'
+			down[pointer] = not down[pointer]
+		else:
+			opcode = '.'
+		result.append((opcode, pointer, xcoord, ycoord))
+	return result
+
+def serve(listener, batch, burst):
+	'''Sends the batch to the client in bursts cut at random points'''
+	rand = random.Random(1)
+	conn, _ = listener.accept()
+	data = encode_helo(1280, 720)
+	encoder = FrameEncoder()
+	for index in xrange(0, len(batch), burst):
+		data += encoder.encode(batch[index:index+burst]).tobytes()
+		# Keep a piece of a frame for the next burst
+		cut = rand.randrange(max(len(data) - 6, 1), len(data) + 1)
+		conn.sendall(data[:cut])
+		data = data[cut:]
+		time.sleep(rand.random()*0.002)
+	conn.sendall(data)
+	conn.close()
+
+def main():
+	binary = sys.argv[1] if len(sys.argv) > 1 else DEF_CLIENT
+	count = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+	burst = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+	batch = events(count)
+	listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	listener.bind(('127.0.0.1', 0))
+	listener.listen(1)
+	start = time.time()
+	client = subprocess.Popen([binary, '--dry-run', '--addr', '127.0.0.1',
+	                           '--port', str(listener.getsockname()[1])],
+	                          stdout=subprocess.PIPE)
+	serve(listener, batch, burst)
+	output = client.communicate()[0]
+	elapsed = time.time() - start
+	received = [[] for _ in xrange(POINTERS)]
+	for line in output.splitlines():
+		if line.startswith('ACTION '):
+			fields = line.replace('[', '').replace(']', '').replace(',', '')\
+			             .split()
+			received[int(fields[3])].append((fields[1], int(fields[3]),
+			                                 int(fields[4]), int(fields[5])))
+	lost = reordered = 0
+	waits = [0]*POINTERS
+	for pointer in xrange(POINTERS):
+		sent = [event for event in batch if event[1] == pointer]
+		waits[pointer] = len([event for event in sent if event[0] != '.'])
+		lost += max(len(sent) - len(received[pointer]), 0)
+		reordered += len([1 for expected, got in zip(sent, received[pointer])
+		                  if expected != got])
+	print '%i events in bursts of %i: %i lost, %i out of order' % (count,
+		burst, lost, reordered)
+	print '%.2f s, busiest pointer waits %.2f s, sleeping after every ' \
+	      'press would take %.2f s' % (elapsed,
+		max(waits)*CLICK_DELAY/1000.0, sum(waits)*CLICK_DELAY/1000.0)
+	if lost or reordered or client.returncode:
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
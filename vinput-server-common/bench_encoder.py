@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ Micro-benchmark of the frame encoding: the old i2s based string building
+ against vinputserver.protocol (single frames and FrameEncoder batches).
+
+ Usage: bench_encoder.py [frames per batch] [repetitions]
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import sys, timeit
+
+from vinputserver.common import i2s
+from vinputserver.protocol import encode_frame, FrameEncoder
+
+def i2s_frame(opcode, pointer, xcoord=0, ycoord=0):
+	'''The encoding ServerSocketThread.send used before vinputserver.protocol'''
+	if isinstance(opcode, (int, long)):
+		opcode = chr(opcode)
+	if isinstance(pointer, (int, long)):
+		pointer = chr(pointer % 256)
+	return opcode+pointer+i2s(xcoord, 2)+i2s(ycoord, 2)
+
+def main():
+	batch = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+	repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+	events = [('.', i % 10, (37*i) % 1280, (91*i) % 720) for i in xrange(batch)]
+	encoder = FrameEncoder()
+
+	# All variants have to produce the same bytes
+	reference = ''.join([i2s_frame(*event) for event in events])
+	assert ''.join([encode_frame(*event) for event in events]) == reference
+	assert encoder.encode(events).tobytes() == reference
+
+	variants = [
+		('i2s', lambda: ''.join([i2s_frame(*event) for event in events])),
+		('struct', lambda: ''.join([encode_frame(*event) for event in events])),
+		('struct batch', lambda: encoder.encode(events)),
+	]
+	print '%i frames per batch, %i batches' % (batch, repeat)
+	baseline = None
+	for name, function in variants:
+		seconds = min(timeit.repeat(function, number=repeat, repeat=3))
+		per_frame = seconds/(repeat*batch)*1e9
+		if baseline is None:
+			baseline = per_frame
+		print '%-14s %8.1f ns/frame  %5.1fx' % (name, per_frame,
+		                                         baseline/per_frame)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ Measures decoding the input_event records of an evdev touch device.
+
+ A synthetic multitouch protocol B stream (touches moving in every
+ report) is decoded once record by record, like reading one input_event
+ per call, and once in chunks with decode_events(). Then the whole stream
+ goes through a MultitouchDecoder and a TouchSender into a server that
+ only counts the events; the CPU time per report is printed.
+
+ Usage: bench_evdev.py [reports] [touches]
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import sys, time, struct, random
+
+from vinputserver.uinput import EV_SYN, EV_ABS, SYN_REPORT, INPUT_EVENT_SIZE
+from vinputserver.evdev import decode_events, MultitouchDecoder, \
+                              DEF_READ_EVENTS, ABS_MT_SLOT, \
+                              ABS_MT_POSITION_X, ABS_MT_POSITION_Y, \
+                              ABS_MT_TRACKING_ID
+from vinputserver.touches import TouchSender
+
+_RECORD = struct.Struct('@llHHi')
+
+class CountingServer(object):
+	'''Stands in for the output thread'''
+	latency = tracer = None
+
+	def __init__(self):
+		self.events = 0
+
+	def send(self, opcode, pointer, xcoord, ycoord):
+		self.events += 1
+
+	def flush(self):
+		pass
+
+def stream(reports, touches):
+	'''Returns the records of touches starting, moving and ending'''
+	rand = random.Random(0)
+	records = []
+	def add(type_, code, value):
+		records.append(_RECORD.pack(0, len(records), type_, code, value))
+	for report in xrange(reports):
+		for slot in xrange(touches):
+			add(EV_ABS, ABS_MT_SLOT, slot)
+			if report == 0:
+				add(EV_ABS, ABS_MT_TRACKING_ID, slot)
+			elif report == reports - 1:
+				add(EV_ABS, ABS_MT_TRACKING_ID, -1)
+				continue
+			add(EV_ABS, ABS_MT_POSITION_X, rand.randrange(4096))
+			add(EV_ABS, ABS_MT_POSITION_Y, rand.randrange(4096))
+		add(EV_SYN, SYN_REPORT, 0)
+	return ''.join(records)
+
+def main():
+	reports = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+	touches = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+	data = stream(reports, touches)
+	chunk = DEF_READ_EVENTS*INPUT_EVENT_SIZE
+	print '%i reports of %i touches, %i records' % (reports, touches,
+		len(data)//INPUT_EVENT_SIZE)
+	cpu = time.clock()
+	for offset in xrange(0, len(data), INPUT_EVENT_SIZE):
+		_RECORD.unpack_from(data, offset)
+	single = time.clock() - cpu
+	cpu = time.clock()
+	for offset in xrange(0, len(data), chunk):
+		decode_events(data[offset:offset+chunk])
+	bulk = time.clock() - cpu
+	print 'decoding: %.2f us/report per record, %.2f us/report in bulk ' \
+	      '(%.1fx)' % (single/reports*1e6, bulk/reports*1e6,
+	                   single/max(bulk, 1e-9))
+	server = CountingServer()
+	decoder = MultitouchDecoder(TouchSender(server, touches))
+	cpu = time.clock()
+	for offset in xrange(0, len(data), chunk):
+		decoder.feed(decode_events(data[offset:offset+chunk]))
+	cpu = time.clock() - cpu
+	print 'decoding and sending: %.2f us/report, %i events' % (
+		cpu/reports*1e6, server.events)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ Measures the motion filters of vinputserver.filters.
+
+ A synthetic finger moves on a circle; the simulated camera samples it at
+ a fixed rate, delivers every position with a delay and adds Gaussian
+ jitter. For each filter stage the CPU time per event and the error
+ against the true current position of the finger are reported: the mean
+ error includes the lag, the jitter is the RMS of the frame-to-frame
+ change of that error.
+
+ Usage: bench_filters.py [events] [delay ms] [jitter px]
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import sys, time, math, random
+
+from vinputserver.filters import parse_filters
+
+RATE = 60.0
+RADIUS = 300.0
+# Revolutions per second
+SPEED = 0.5
+STAGES = ('one-euro', 'predict', 'one-euro,predict')
+
+def samples(count, delay, jitter):
+	'''Returns (time, observed x, observed y, true x, true y) tuples'''
+	rand = random.Random(0)
+	result = []
+	for index in xrange(count):
+		now = index/RATE
+		angle = 2*math.pi*SPEED*(now - delay)
+		true = 2*math.pi*SPEED*now
+		result.append((now, RADIUS*math.cos(angle) + rand.gauss(0, jitter),
+		               RADIUS*math.sin(angle) + rand.gauss(0, jitter),
+		               RADIUS*math.cos(true), RADIUS*math.sin(true)))
+	return result
+
+def measure(name, stage, data):
+	'''Runs a stage over the samples; prints cost, error and jitter'''
+	if stage is not None:
+		stage.down(0, data[0][1], data[0][2], data[0][0])
+	cpu = time.clock()
+	output = []
+	for now, xcoord, ycoord, _, _ in data:
+		if stage is not None:
+			xcoord, ycoord = stage.filter(0, xcoord, ycoord, now)
+		output.append((xcoord, ycoord))
+	cpu = time.clock() - cpu
+	errors = [(x - truex, y - truey) for (x, y), (_, _, _, truex, truey)
+	          in zip(output, data)]
+	mean = sum([math.hypot(*error) for error in errors])/len(errors)
+	jitter = math.sqrt(sum([(x2 - x1)**2 + (y2 - y1)**2 for (x1, y1),
+	                        (x2, y2) in zip(errors, errors[1:])])
+	                   /(len(errors) - 1))
+	print '%-20s %6.2f us/event  error %6.1f px  jitter %5.2f px' % (name,
+		cpu/len(data)*1e6, mean, jitter)
+
+def main():
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+	delay = float(sys.argv[2]) if len(sys.argv) > 2 else 30
+	jitter = float(sys.argv[3]) if len(sys.argv) > 3 else 2
+	print '%i events at %i Hz, %g ms delay, %g px jitter, %g px/s' % (count,
+		RATE, delay, jitter, 2*math.pi*RADIUS*SPEED)
+	data = samples(count, delay/1000.0, jitter)
+	measure('raw', None, data)
+	for spec in STAGES:
+		measure(spec, parse_filters(spec), data)
+	measure('predict:%g' % delay, parse_filters('predict:%g' % delay), data)
+	spec = 'one-euro,predict:%g' % delay
+	measure(spec, parse_filters(spec), data)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ Compares server-side gesture recognition with recognition in every client.
+
+ Fingers pinch and rotate around a moving center. The server describes
+ the touches once per frame with a GestureTracker; a client without
+ gesture frames has to follow all pointers and compute the same with
+ plain Python, which every such client does again. The CPU time per frame
+ of the tracker and of N clients is printed, and the scale and rotation
+ of both are compared.
+
+ Usage: bench_gestures.py [frames] [fingers] [clients]
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import sys, time, math
+
+from vinputserver.gestures import GestureTracker, decode_gesture
+
+class ClientGestures(object):
+	'''What a client does without gesture frames: the same description'''
+
+	def __init__(self):
+		self.points = {}
+		self.reference = {}
+		self.spread = 0.0
+		self.rebase = True
+		self.scale, self.rotation = 1.0, 0.0
+		self.base_scale, self.base_rotation = 1.0, 0.0
+
+	def event(self, opcode, pointer, xcoord, ycoord):
+		if opcode == 'u':
+			del self.points[pointer]
+			self.rebase = True
+		else:
+			if pointer not in self.points:
+				self.rebase = True
+			self.points[pointer] = (xcoord, ycoord)
+
+	def frame(self):
+		points = self.points.values()
+		count = float(len(points))
+		xcenter = sum([point[0] for point in points])/count
+		ycenter = sum([point[1] for point in points])/count
+		offsets = dict([(pointer, (point[0] - xcenter, point[1] - ycenter))
+		                for pointer, point in self.points.iteritems()])
+		spread = sum([math.hypot(*offset)
+		              for offset in offsets.itervalues()])/count
+		if self.rebase:
+			self.rebase = False
+			self.reference = offsets
+			self.spread = spread
+			self.base_scale, self.base_rotation = self.scale, self.rotation
+			return
+		cross = dot = 0.0
+		for pointer, (xoffset, yoffset) in offsets.iteritems():
+			xref, yref = self.reference[pointer]
+			cross += xref*yoffset - yref*xoffset
+			dot += xref*xoffset + yref*yoffset
+		self.scale = self.base_scale*spread/self.spread
+		self.rotation = self.base_rotation + math.degrees(math.atan2(cross, dot))
+
+def frames(count, fingers):
+	'''Returns the events of each frame of a pinch and rotation'''
+	result = []
+	for frame in xrange(count):
+		phase = frame/float(count)
+		radius = 100 + 150*phase
+		angle = math.radians(90*phase)
+		xcenter, ycenter = 400 + 200*phase, 300
+		events = []
+		for finger in xrange(fingers):
+			finger_angle = angle + 2*math.pi*finger/fingers
+			events.append(('d' if frame == 0 else '.', finger,
+			               int(xcenter + radius*math.cos(finger_angle)),
+			               int(ycenter + radius*math.sin(finger_angle))))
+		result.append(events)
+	return result
+
+def main():
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+	fingers = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+	clients = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+	batch = frames(count, fingers)
+	tracker = GestureTracker(fingers)
+	cpu = time.clock()
+	for index, events in enumerate(batch):
+		for opcode, pointer, xcoord, ycoord in events:
+			if opcode == 'd':
+				tracker.down(pointer, xcoord, ycoord)
+			else:
+				tracker.motion(pointer, xcoord, ycoord)
+		gesture = tracker.frame(index/100.0)
+	server = time.clock() - cpu
+	client = ClientGestures()
+	cpu = time.clock()
+	for events in batch:
+		for event in events:
+			client.event(*event)
+		client.frame()
+	single = time.clock() - cpu
+	scale, rotation = decode_gesture(gesture)[4:6]
+	print '%i frames of %i fingers' % (count, fingers)
+	print 'server:     %6.2f us/frame, scale %.3f, rotation %.2f' % (
+		server/count*1e6, scale, rotation)
+	print '%2i clients: %6.2f us/frame, scale %.3f, rotation %.2f' % (
+		clients, single*clients/count*1e6, client.scale, client.rotation)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ Load benchmark of the device server without a touch table or libavg.
+
+ A synthetic generator moves N fingers along configurable trajectories and
+ feeds them through TouchSender (the part of the libavg server's touch
+ handler that does not depend on libavg) into a ServerSocketThread. M fake
+ clients in forked processes connect over a unix socket and parse every
+ 6 byte frame. With --worker the sockets are served by a WorkerServer
+ instead.
+
+ Reports events/s, bytes/s, server CPU time per event and the latency from
+ generating an event to a client parsing it; --json saves the results for
+ comparisons between versions.
+
+ Usage: bench_load.py [options], see bench_load.py --help
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import os, time, math, random, socket, platform, subprocess
+import cPickle, json
+from optparse import OptionParser
+
+from vinputserver.protocol import FRAME_SIZE, decode_frame
+from vinputserver.server import ServerSocketThread, FLUSH_FRAME
+from vinputserver.worker import WorkerServer
+from vinputserver.touches import TouchSender
+from vinputserver.cursorids import MAX_CURSORCOUNT
+
+TRAJECTORIES = ('circle', 'line', 'random')
+RESOLUTION = (1280, 720)
+
+class SyntheticTouches(object):
+	'''
+	SyntheticTouches(fingers, trajectory, touch_length, seed) -> generator
+	of touch events for a number of fingers.
+
+	Every finger touches down, follows its trajectory for touch_length
+	seconds, lifts and touches down again with a new touch id.
+	'''
+
+	def __init__(self, fingers, trajectory, touch_length, seed):
+		self.trajectory = trajectory
+		self.touch_length = touch_length
+		self._random = random.Random(seed)
+		self._next_id = 0
+		# finger -> [touch id, start time, x, y, parameters]
+		self._fingers = [self._new_touch(0.0) for _ in xrange(fingers)]
+
+	def _new_touch(self, now):
+		rnd = self._random
+		width, height = RESOLUTION
+		self._next_id += 1
+		x, y = rnd.uniform(0, width), rnd.uniform(0, height)
+		params = (rnd.uniform(20, height/4.0), rnd.uniform(0.5, 3.0),
+		          rnd.uniform(0, 2*math.pi))
+		return [self._next_id, now, x, y, params, True]
+
+	def _position(self, finger, now):
+		'''Returns the position of a finger at a time'''
+		touchid, start, x, y, (size, speed, phase), new = finger
+		width, height = RESOLUTION
+		t = now - start
+		if self.trajectory == 'circle':
+			angle = phase + 2*math.pi*speed*t
+			x, y = x + size*math.cos(angle), y + size*math.sin(angle)
+		elif self.trajectory == 'line':
+			x = x + size*math.sin(2*math.pi*speed*t)
+		else:
+			x += self._random.gauss(0, 5)
+			y += self._random.gauss(0, 5)
+			finger[2], finger[3] = x, y
+		return (int(min(max(x, 0), width - 1)),
+		        int(min(max(y, 0), height - 1)))
+
+	def events(self, now):
+		'''
+		x.events(now) -> list of (kind, touch id, x, y)
+		Returns one event for every finger: 'down', 'motion' or 'up'.
+		'''
+		events = []
+		for index, finger in enumerate(self._fingers):
+			x, y = self._position(finger, now)
+			if finger[5]:
+				finger[5] = False
+				events.append(('down', finger[0], x, y))
+			elif now - finger[1] >= self.touch_length:
+				events.append(('up', finger[0], x, y))
+				self._fingers[index] = self._new_touch(now)
+			else:
+				events.append(('motion', finger[0], x, y))
+		return events
+
+class _SampledServer(object):
+	'''Passes events on to a server, keeping the time of every n-th one'''
+
+	def __init__(self, server, stride):
+		self.server = server
+		self.stride = stride
+		self.latency = self.tracer = None
+		self.count = 0
+		self.times = []
+
+	def send(self, opcode, pointer, xcoord, ycoord):
+		if not self.count % self.stride:
+			self.times.append(time.time())
+		self.count += 1
+		self.server.send(opcode, pointer, xcoord, ycoord)
+
+	def flush(self):
+		self.server.flush()
+
+def client(address, stride, ready_fd, result_fd):
+	'''Fake client process: parses all frames and reports what it got'''
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	deadline = time.time() + 5.0
+	while True:
+		try:
+			sock.connect(address)
+			break
+		except socket.error:
+			# The server is not listening yet
+			if time.time() >= deadline:
+				os._exit(1)
+			time.sleep(0.01)
+	buf = ''
+	while len(buf) < 6:
+		buf += sock.recv(6 - len(buf))
+	os.write(ready_fd, 'R')
+	frames = size = invalid = 0
+	times = []
+	buf = ''
+	cpu = os.times()
+	while True:
+		data = sock.recv(65536)
+		if not data:
+			break
+		now = time.time()
+		size += len(data)
+		buf += data
+		end = len(buf) - len(buf) % FRAME_SIZE
+		for offset in xrange(0, end, FRAME_SIZE):
+			opcode, pointer, xcoord, ycoord = decode_frame(buf, offset)
+			if opcode not in '.du':
+				invalid += 1
+			if not frames % stride:
+				times.append(now)
+			frames += 1
+		buf = buf[end:]
+	cpu = sum(os.times()[:2]) - sum(cpu[:2])
+	os.write(result_fd, cPickle.dumps({'frames': frames, 'bytes': size,
+	                                   'invalid': invalid, 'cpu': cpu,
+	                                   'times': times}, 2))
+	os._exit(0)
+
+def percentiles(values):
+	'''Returns p50, p90, p99 and max of a list of values in microseconds'''
+	if not values:
+		return None
+	values = sorted(values)
+	pick = lambda p: values[min(len(values) - 1, int(len(values)*p))]*1e6
+	return {'p50': pick(0.50), 'p90': pick(0.90), 'p99': pick(0.99),
+	        'max': values[-1]*1e6}
+
+def git_version():
+	'''Returns the git revision of the tree, if known'''
+	try:
+		process = subprocess.Popen(['git', 'describe', '--always', '--dirty'],
+		                           stdout=subprocess.PIPE,
+		                           stderr=open(os.devnull, 'w'),
+		                           cwd=os.path.dirname(os.path.abspath(__file__)))
+		return process.communicate()[0].strip() or None
+	except OSError:
+		return None
+
+def run(options):
+	'''Runs the benchmark and returns the results'''
+	address = '\0vinput-bench-load-%i' % os.getpid()
+	# Fork the fake clients before there are any server side sockets they
+	# could inherit; they connect once the server listens
+	children = []
+	for _ in xrange(options.clients):
+		ready_r, ready_w = os.pipe()
+		result_r, result_w = os.pipe()
+		pid = os.fork()
+		if pid == 0:
+			os.close(ready_r)
+			os.close(result_r)
+			client(address, options.sample, ready_w, result_w)
+		os.close(ready_w)
+		os.close(result_w)
+		children.append((pid, ready_r, result_r))
+	server_class = WorkerServer if options.worker else ServerSocketThread
+	server = server_class(RESOLUTION, address, socket.AF_UNIX,
+	                      max_buffer=1 << 24, max_lag=0, flush_mode=FLUSH_FRAME)
+	server.start()
+	for pid, ready_r, result_r in children:
+		if os.read(ready_r, 1) != 'R':
+			raise RuntimeError, 'fake client %i could not connect' % pid
+		os.close(ready_r)
+	sampled = _SampledServer(server, options.sample)
+	touches = TouchSender(sampled, min(options.fingers, MAX_CURSORCOUNT))
+	generator = SyntheticTouches(options.fingers, options.trajectory,
+	                             options.touch_length, options.seed)
+	handlers = {'down': touches.down, 'motion': touches.motion,
+	            'up': touches.up}
+	# Rate 0: as fast as possible, one event per finger and frame
+	per_frame = options.rate/float(options.frame_rate) if options.rate else 1
+	frame_time = 1.0/options.frame_rate if options.rate else 0
+	credit = 0.0
+	touch_events = 0
+	cpu = os.times()
+	start = time.time()
+	next_frame = start
+	while True:
+		now = time.time()
+		if now - start >= options.duration:
+			break
+		credit += per_frame
+		while credit >= 1:
+			credit -= 1
+			for kind, touchid, xcoord, ycoord in generator.events(now - start):
+				handlers[kind](touchid, xcoord, ycoord)
+				touch_events += 1
+		touches.frame(now)
+		if frame_time:
+			next_frame += frame_time
+			delay = next_frame - time.time()
+			if delay > 0:
+				time.sleep(delay)
+	send_time = time.time() - start
+	# Wait until everything is written, then let the clients see EOF
+	while server.queue_depth() or \
+	      sum([stats[3] for stats in server.client_stats()]):
+		time.sleep(0.01)
+	if options.worker:
+		# The worker writes the rest and closes the clients when stopped
+		server.close()
+	cpu = sum(os.times()[:2]) - sum(cpu[:2])
+	elapsed = time.time() - start
+	server.close_clients()
+	received = []
+	for pid, ready_r, result_r in children:
+		data = ''
+		while True:
+			chunk = os.read(result_r, 1 << 20)
+			if not chunk:
+				break
+			data += chunk
+		os.close(result_r)
+		os.waitpid(pid, 0)
+		received.append(cPickle.loads(data))
+	counters = server.counters()
+	server.close()
+	latencies = []
+	for result in received:
+		times = result.pop('times')
+		latencies.extend([recv - sent for recv, sent
+		                  in zip(times, sampled.times)])
+	frames = sampled.count
+	return {
+		'version': git_version(),
+		'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+		'python': platform.python_version(),
+		'host': platform.node(),
+		'config': dict(options.__dict__),
+		'touch_events': touch_events,
+		'frames': frames,
+		'events_per_second': frames/send_time,
+		'bytes_per_second': sum([r['bytes'] for r in received])/elapsed,
+		'server_cpu_per_event_us': cpu/max(frames, 1)*1e6,
+		'client_cpu_per_frame_us': sum([r['cpu'] for r in received])
+		                           /max(sum([r['frames'] for r in received]), 1)*1e6,
+		'latency_us': percentiles(latencies),
+		'clients': received,
+		'coalesced': counters['coalesced'],
+		'dropped': counters['dropped'],
+	}
+
+def main():
+	parser = OptionParser(usage='%prog [options]')
+	parser.add_option('-f', '--fingers', type='int', default=10,
+	                  help='number of simultaneous fingers [%default]')
+	parser.add_option('-r', '--rate', type='float', default=200,
+	                  help='events per finger and second, 0 for as fast as '
+	                       'possible [%default]')
+	parser.add_option('--frame-rate', type='float', default=60,
+	                  help='frames (flushes) per second [%default]')
+	parser.add_option('-t', '--trajectory', choices=TRAJECTORIES,
+	                  default='circle',
+	                  help='one of %s [%%default]' % ', '.join(TRAJECTORIES))
+	parser.add_option('--touch-length', type='float', default=1.0,
+	                  help='seconds until a finger lifts [%default]')
+	parser.add_option('-c', '--clients', type='int', default=2,
+	                  help='number of fake clients [%default]')
+	parser.add_option('-d', '--duration', type='float', default=5.0,
+	                  help='seconds to generate events [%default]')
+	parser.add_option('--sample', type='int', default=10,
+	                  help='measure the latency of every n-th frame '
+	                       '[%default]')
+	parser.add_option('--worker', action='store_true', default=False,
+	                  help='run the socket fan-out in a worker process; '
+	                       'the server CPU time is then that of the input '
+	                       'process only')
+	parser.add_option('--seed', type='int', default=0,
+	                  help='seed of the generator [%default]')
+	parser.add_option('-o', '--json', metavar='FILE',
+	                  help='write the results as JSON to FILE')
+	options, args = parser.parse_args()
+	if args or options.fingers <= 0 or options.clients <= 0 or \
+	   options.frame_rate <= 0 or options.sample <= 0:
+		parser.error('invalid arguments')
+	result = run(options)
+	print '%i fingers, %i clients, %s, %.1f s' % (options.fingers,
+		options.clients, options.trajectory, options.duration)
+	print '%12.0f events/s' % result['events_per_second']
+	print '%12.0f bytes/s to all clients' % result['bytes_per_second']
+	print '%12.2f us server CPU/event' % result['server_cpu_per_event_us']
+	print '%12.2f us client CPU/frame' % result['client_cpu_per_frame_us']
+	if result['latency_us']:
+		print '     latency p50 %(p50).1f us  p90 %(p90).1f us  ' \
+		      'p99 %(p99).1f us  max %(max).1f us' % result['latency_us']
+	if result['coalesced'] or result['dropped']:
+		print 'clients lagged: %i frames coalesced, %i dropped, latencies ' \
+		      'are not exact' % (result['coalesced'], result['dropped'])
+	if options.json:
+		with open(options.json, 'w') as output:
+			json.dump(result, output, indent=1, sort_keys=True)
+
+if __name__ == '__main__':
+	main()
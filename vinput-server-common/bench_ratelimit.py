@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ Shows the per-client rate limits on a mixed set of clients.
+
+ Forked clients connect over TCP with small socket buffers: one takes
+ every frame, one declares 30 updates per second like a projector, one
+ asks for an inferred rate and reads slower than the full stream comes
+ in, like a slow link.
+ A 200 Hz tracker moves four fingers and touches and releases now and
+ then. For each client the motion updates per second, the bytes and the
+ touches and releases it got are reported, as well as the server CPU time.
+
+ Usage: bench_ratelimit.py [seconds] [input rate]
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import os, sys, time, random, socket
+
+from vinputserver.server import ServerSocketThread, FLUSH_FRAME
+from vinputserver.protocol import FRAME_SIZE, decode_frame
+from vinputserver.ratelimit import encode_rate_request
+
+RESOLUTION = (1280, 720)
+FINGERS = 4
+# Chance of a finger touching or releasing in a frame
+PRESS_RATE = 0.01
+# Socket buffer sizes of the server and the clients
+SOCKET_BUFFER = 4096
+# name, rate request (None: none), bytes read every 10 ms (None: all)
+CLIENTS = (
+	('full', None, None),
+	('30 Hz', 30, None),
+	('slow', 0, 30),
+)
+
+def client(address, request, chunk, result_w):
+	'''Client process: counts the frames until the server closes'''
+	sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER)
+	while True:
+		try:
+			sock.connect(address)
+			break
+		except socket.error:
+			time.sleep(0.01)
+	if request is not None:
+		sock.send(encode_rate_request(request))
+	data = ''
+	while True:
+		received = sock.recv(chunk or 65536)
+		if not received:
+			break
+		data += received
+		if chunk is not None:
+			time.sleep(0.01)
+	motion = presses = 0
+	# The first frame is the HELO
+	for offset in xrange(FRAME_SIZE, len(data) - len(data) % FRAME_SIZE,
+	                     FRAME_SIZE):
+		if decode_frame(data, offset)[0] == '.':
+			motion += 1
+		else:
+			presses += 1
+	os.write(result_w, '%i %i %i\n' % (motion, presses, len(data)))
+	os._exit(0)
+
+def main():
+	seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+	rate = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+	listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	# The accepted sockets inherit the buffer size
+	listener.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER)
+	listener.bind(('127.0.0.1', 0))
+	listener.listen(len(CLIENTS))
+	address = listener.getsockname()
+	children = []
+	for name, request, chunk in CLIENTS:
+		result_r, result_w = os.pipe()
+		pid = os.fork()
+		if pid == 0:
+			os.close(result_r)
+			listener.close()
+			client(address, request, chunk, result_w)
+		os.close(result_w)
+		children.append((name, pid, result_r))
+	server = ServerSocketThread(RESOLUTION, address, socket.AF_INET,
+	                            max_lag=0, flush_mode=FLUSH_FRAME,
+	                            listen_sock=listener)
+	server.start()
+	while server.accepts < len(children):
+		time.sleep(0.01)
+	# Give the clients time to send their requests
+	time.sleep(0.2)
+	rand = random.Random(0)
+	fingers = [[rand.randrange(RESOLUTION[0]), rand.randrange(RESOLUTION[1]),
+	            False] for _ in xrange(FINGERS)]
+	frames = int(seconds*rate)
+	presses = 0
+	cpu = os.times()
+	start = time.time()
+	for frame in xrange(frames):
+		for pointer, finger in enumerate(fingers):
+			finger[0] = (finger[0] + rand.randint(-5, 5)) % RESOLUTION[0]
+			finger[1] = (finger[1] + rand.randint(-5, 5)) % RESOLUTION[1]
+			server.send('.', pointer, finger[0], finger[1])
+			if rand.random() < PRESS_RATE or \
+			   (frame == frames - 1 and finger[2]):
+				finger[2] = not finger[2]
+				server.send('d' if finger[2] else 'u', pointer, finger[0],
+				            finger[1])
+				presses += 1
+		server.flush()
+		delay = start + (frame + 1.0)/rate - time.time()
+		if delay > 0:
+			time.sleep(delay)
+	# Let the last tick and the slow client's backlog go out
+	time.sleep(0.1)
+	while sum([stats[3] for stats in server.client_stats()]):
+		time.sleep(0.01)
+	cpu = sum(os.times()[:2]) - sum(cpu[:2])
+	counters = server.counters()
+	server.close()
+	print '%i frames of %i fingers at %i Hz, %i touches and releases' % (
+		frames, FINGERS, rate, presses)
+	for name, pid, result_r in children:
+		motion, got, size = [int(value) for value in os.read(result_r, 64)
+		                                             .split()]
+		os.close(result_r)
+		os.waitpid(pid, 0)
+		print '%-6s %7.1f updates/s per finger  %8i bytes  %i/%i touches ' \
+		      'and releases' % (name, motion/float(FINGERS)/seconds, size,
+		                        got, presses)
+	print 'server: %.2f s CPU, %i motion frames coalesced, %i dropped' % (
+		cpu, counters['coalesced'], counters['dropped'])
+
+if __name__ == '__main__':
+	main()
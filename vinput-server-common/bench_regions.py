@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ Compares full fan-out with region subscriptions on a tiled display wall.
+
+ N x N tiles with the given number of forked clients each connect over a
+ unix socket, either each getting the whole surface or each subscribing to
+ its tile. Random touches move across the surface; the server CPU time per
+ event and the bytes the clients received are reported for both cases.
+ The clients of a tile share the routed and encoded frames. With "v2"
+ the clients use protocol version 2, which the server encodes for every
+ client separately.
+
+ Usage: bench_regions.py [tiles per axis] [events] [clients per tile] [v2]
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import os, sys, time, random, socket
+
+from vinputserver.server import ServerSocketThread, FLUSH_FRAME
+from vinputserver.regions import encode_region_request
+from vinputserver.protocol2 import encode_request
+
+RESOLUTION = (3840, 2160)
+FINGERS = 10
+# Events per flush
+FRAME_EVENTS = 10
+
+def client(address, request, result_w):
+	'''Client process: counts the bytes until the server closes'''
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	while True:
+		try:
+			sock.connect(address)
+			break
+		except socket.error:
+			time.sleep(0.01)
+	if request:
+		sock.send(request)
+	size = 0
+	while True:
+		data = sock.recv(65536)
+		if not data:
+			break
+		size += len(data)
+	os.write(result_w, '%i\n' % size)
+	os._exit(0)
+
+def events(count):
+	'''Returns touches walking randomly across the surface'''
+	rand = random.Random(0)
+	width, height = RESOLUTION
+	fingers = [[rand.randrange(width), rand.randrange(height)]
+	           for _ in xrange(FINGERS)]
+	result = [('d', pointer, x, y) for pointer, (x, y) in enumerate(fingers)]
+	while len(result) < count:
+		pointer = rand.randrange(FINGERS)
+		finger = fingers[pointer]
+		finger[0] = min(max(finger[0] + rand.randint(-40, 40), 0), width - 1)
+		finger[1] = min(max(finger[1] + rand.randint(-40, 40), 0), height - 1)
+		result.append(('.', pointer, finger[0], finger[1]))
+	return result
+
+def run(name, tiles, viewers, regions, v2, batch):
+	address = '\0vinput-bench-regions-%i-%s' % (os.getpid(), name)
+	width, height = RESOLUTION[0]//tiles, RESOLUTION[1]//tiles
+	children = []
+	for index in [tile for tile in xrange(tiles*tiles)
+	              for _ in xrange(viewers)]:
+		request = encode_request(0) if v2 else ''
+		if regions:
+			request += encode_region_request(index % tiles*width,
+			                                 index//tiles*height, width, height)
+		result_r, result_w = os.pipe()
+		pid = os.fork()
+		if pid == 0:
+			os.close(result_r)
+			client(address, request, result_w)
+		os.close(result_w)
+		children.append((pid, result_r))
+	server = ServerSocketThread(RESOLUTION, address, socket.AF_UNIX,
+	                            max_buffer=1 << 26, max_lag=0,
+	                            flush_mode=FLUSH_FRAME)
+	server.start()
+	while server.accepts < len(children):
+		time.sleep(0.01)
+	# Give the clients time to send their requests
+	time.sleep(0.2)
+	cpu = os.times()
+	for index in xrange(0, len(batch), FRAME_EVENTS):
+		for event in batch[index:index+FRAME_EVENTS]:
+			server.send(*event)
+		server.flush()
+	while server.queue_depth() or \
+	      sum([stats[3] for stats in server.client_stats()]):
+		time.sleep(0.001)
+	cpu = sum(os.times()[:2]) - sum(cpu[:2])
+	server.close()
+	received = 0
+	for pid, result_r in children:
+		received += int(os.read(result_r, 64) or 0)
+		os.close(result_r)
+		os.waitpid(pid, 0)
+	print '%-8s %8.2f us server CPU/event  %10i bytes to %i clients' % (name,
+		cpu/len(batch)*1e6, received, len(children))
+	return cpu, received
+
+def main():
+	tiles = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+	count = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+	v2 = 'v2' in sys.argv[3:]
+	viewers = ([int(arg) for arg in sys.argv[3:] if arg.isdigit()] or [1])[0]
+	batch = events(count)
+	print '%ix%i tiles, %i clients each, %i events, protocol version %i' % (
+		tiles, tiles, viewers, count, 2 if v2 else 1)
+	full = run('full', tiles, viewers, False, v2, batch)
+	region = run('regions', tiles, viewers, True, v2, batch)
+	print 'regions: %.2fx the CPU time, %.2fx the bytes of full fan-out' % (
+		region[0]/max(full[0], 1e-9), region[1]/float(max(full[1], 1)))
+
+if __name__ == '__main__':
+	main()
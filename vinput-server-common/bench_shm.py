@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ Benchmark of the shared memory ring buffer transport against the AF_UNIX
+ socket path of ServerSocketThread.
+
+ A forked reader process consumes the frames; the parent sends batches of
+ frames, either as fast as possible (throughput) or one batch per
+ millisecond (latency from flush() to the reader seeing the batch).
+
+ Usage: bench_shm.py [batches] [frames per batch]
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import os, sys, time, socket, cPickle
+
+from vinputserver.protocol import FRAME_SIZE, decode_frames
+from vinputserver.server import ServerSocketThread, FLUSH_FRAME
+from vinputserver.shmring import ShmRingThread, ShmRingReader
+
+RING_NAME = 'bench-%i' % os.getpid()
+UNIX_ADDR = '\0vinput-bench-%i' % os.getpid()
+
+def unix_reader(expected):
+	'''Yields the lists of frames received over the unix socket'''
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	sock.connect(UNIX_ADDR)
+	buf = sock.recv(6)
+	yield None
+	buf = ''
+	received = 0
+	while received < expected:
+		data = sock.recv(65536)
+		if not data:
+			return
+		buf += data
+		end = len(buf) - len(buf) % FRAME_SIZE
+		frames = decode_frames(buf, 0, end)
+		buf = buf[end:]
+		received += len(frames)
+		yield frames, 0
+
+def ring_reader(expected):
+	'''Yields the lists of frames read from the ring buffer'''
+	ring = ShmRingReader(RING_NAME)
+	yield None
+	received = 0
+	while received + ring.lost < expected:
+		ring.wait(1.0)
+		lost = ring.lost
+		frames = ring.read()
+		received += len(frames)
+		yield frames, ring.lost - lost
+
+def child(reader, expected, result_fd):
+	'''Reader process: consumes frames and reports the measurements'''
+	frames_in = reader(expected)
+	frames_in.next()
+	os.write(result_fd, 'R')
+	received = lost = 0
+	seen = {}
+	start = None
+	cpu = os.times()
+	for frames, lost_now in frames_in:
+		now = time.time()
+		if start is None:
+			start = now
+		lost += lost_now
+		received += len(frames)
+		for opcode, pointer, xcoord, ycoord in frames:
+			batch = (ycoord << 16) | xcoord
+			if batch not in seen:
+				seen[batch] = now
+	end = time.time()
+	cpu = sum(os.times()[:2]) - sum(cpu[:2])
+	os.write(result_fd, cPickle.dumps((received, lost, end - (start or end),
+	                                   cpu, seen), 2))
+	os._exit(0)
+
+def run(name, transport, reader, batches, batch_size, paced):
+	'''Runs one measurement and prints the result'''
+	expected = batches*batch_size
+	transport.start()
+	time.sleep(0.2)
+	rfd, wfd = os.pipe()
+	pid = os.fork()
+	if pid == 0:
+		os.close(rfd)
+		child(reader, expected, wfd)
+	os.close(wfd)
+	os.read(rfd, 1)
+	time.sleep(0.1)
+	sent = []
+	start = time.time()
+	for batch in xrange(batches):
+		for i in xrange(batch_size):
+			# Transitions are never coalesced, so every frame arrives
+			transport.send('du'[i % 2], i % 256, batch & 0xffff, batch >> 16)
+		sent.append(time.time())
+		transport.flush()
+		if paced:
+			time.sleep(0.001)
+	send_time = time.time() - start
+	data = ''
+	while True:
+		chunk = os.read(rfd, 1 << 20)
+		if not chunk:
+			break
+		data += chunk
+	os.waitpid(pid, 0)
+	transport.close()
+	received, lost, elapsed, cpu, seen = cPickle.loads(data)
+	latencies = sorted([seen[batch] - sent[batch] for batch in seen
+	                    if batch < len(sent)])
+	if paced and latencies:
+		print '%-6s paced: p50 %7.1f us  p99 %7.1f us  max %7.1f us' % (name,
+			latencies[len(latencies)//2]*1e6,
+			latencies[min(len(latencies)-1, len(latencies)*99//100)]*1e6,
+			latencies[-1]*1e6)
+	else:
+		print '%-6s %9.0f frames/s sent  %9.0f frames/s received  ' \
+		      '%5.2f us reader CPU/frame  %i lost' % (name,
+			expected/send_time, received/max(elapsed, send_time),
+			cpu/max(received, 1)*1e6, lost)
+
+def main():
+	batches = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+	batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+	print '%i batches of %i frames' % (batches, batch_size)
+	for paced in (False, True):
+		run('unix', ServerSocketThread((1280, 720), UNIX_ADDR, socket.AF_UNIX,
+		                               max_buffer=1 << 24, max_lag=0,
+		                               flush_mode=FLUSH_FRAME),
+		    unix_reader, batches, batch_size, paced)
+		run('shm', ShmRingThread((1280, 720), RING_NAME, slots=1 << 16),
+		    ring_reader, batches, batch_size, paced)
+
+if __name__ == '__main__':
+	main()
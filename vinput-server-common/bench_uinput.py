@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ Compares batched uinput writes with one write per input_event.
+
+ The batches of a simulated server (random touches of four pointers) are
+ fed to a UInputClient whose devices write to /dev/null instead of
+ /dev/uinput. Once with the batched devices of vinputserver.uinput and
+ once with devices writing every input_event by itself, like the C++
+ client; the write calls, bytes and CPU time per frame are reported.
+
+ Usage: bench_uinput.py [frames] [frames per batch]
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import os, sys, time, random
+
+from vinputserver.protocol import encode_helo, FrameEncoder
+from vinputserver.uinput import UInputClient, PointerDevice
+
+POINTERS = 4
+
+class PerEventDevice(PointerDevice):
+	'''Writes every input_event as soon as it is added'''
+
+	def _add(self, type_, code, value):
+		PointerDevice._add(self, type_, code, value)
+		PointerDevice.flush(self)
+
+class PerEventClient(UInputClient):
+	device_class = PerEventDevice
+
+def batches(count, size):
+	'''Returns the encoded batches of random touches'''
+	rand = random.Random(0)
+	down = [False]*POINTERS
+	encoder = FrameEncoder()
+	result = [encode_helo(1280, 720)]
+	for start in xrange(0, count, size):
+		events = []
+		for _ in xrange(min(size, count - start)):
+			pointer = rand.randrange(POINTERS)
+			if rand.random() < 0.05:
+				opcode = 'u' if down[pointer] else 'd'
+				down[pointer] = not down[pointer]
+			else:
+				opcode = '.'
+			events.append((opcode, pointer, rand.randrange(1280),
+			               rand.randrange(720)))
+		result.append(encoder.encode(events).tobytes())
+	return result
+
+def null_device(name, width, height):
+	'''Stands in for open_uinput_device()'''
+	return os.open(os.devnull, os.O_WRONLY)
+
+def run(name, client_class, data):
+	client = client_class(None, POINTERS, null_device)
+	cpu = time.clock()
+	for batch in data:
+		client.feed(batch)
+	cpu = time.clock() - cpu
+	frames, count, writes, size = client.stats()
+	client.close()
+	print '%-10s %6.2f writes/frame  %5.1f bytes/frame  %6.2f us/frame' % (
+		name, writes/float(frames), size/float(frames), cpu/frames*1e6)
+	return writes
+
+def main():
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+	size = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+	print '%i frames in batches of %i' % (count, size)
+	data = batches(count, size)
+	single = run('per event', PerEventClient, data)
+	batched = run('batched', UInputClient, data)
+	print 'batched: %.1fx fewer writes' % (single/float(max(batched, 1)))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ Replays a recording made with the --record option of the device servers
+ through a ServerSocketThread, in real time, N times faster or as fast as
+ the clients take it.
+
+ Usage: replay.py [options] FILE, see replay.py --help
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import time
+from optparse import OptionParser
+from socket import SOCK_STREAM as _SOCK_STREAM
+
+from vinputserver import common
+from vinputserver.common import debug_output, parse_addr, monotonic, \
+                                SHM_FAMILY
+from vinputserver.server import ServerSocketThread
+from vinputserver.record import SessionReader
+
+DEF_LISTEN_ADDR = '1243'
+# Batches the socket thread may have queued before a replay at maximum
+# speed waits for it
+MAX_QUEUE_DEPTH = 64
+
+def replay(reader, server, speed, session=None):
+	'''
+	Sends the batches of a recording; speed 0 means as fast as possible.
+	Returns the number of frames sent.
+	'''
+	frames = 0
+	current = base = None
+	for number, offset, resolution, events in reader:
+		if session is not None and number != session:
+			continue
+		if number != current:
+			# Sessions are replayed back to back
+			current = number
+			base = monotonic() - (offset/speed if speed else 0)
+		server.resolution = resolution
+		if speed:
+			delay = base + offset/speed - monotonic()
+			if delay > 0:
+				time.sleep(delay)
+		else:
+			while server.queue_depth() > MAX_QUEUE_DEPTH:
+				time.sleep(0.001)
+		for event in events:
+			server.send(*event)
+		server.flush()
+		frames += len(events)
+	return frames
+
+def first_resolution(reader):
+	'''Returns the resolution the recording starts with'''
+	for number, offset, resolution, events in reader:
+		return resolution
+	return (0, 0)
+
+def main():
+	parser = OptionParser(usage='%prog [options] FILE')
+	parser.add_option('-l', '--listen', default=DEF_LISTEN_ADDR,
+	                  help='address to listen on, as for mpxserver.py '
+	                       '[%default]')
+	parser.add_option('-s', '--speed', default='1',
+	                  help='factor of the original speed or "max" [%default]')
+	parser.add_option('--session', type='int',
+	                  help='only replay this session (counting from 0)')
+	parser.add_option('-w', '--wait', type='int', default=1, metavar='N',
+	                  help='wait for N clients before starting [%default]')
+	parser.add_option('--loop', action='store_true',
+	                  help='start over at the end of the recording')
+	parser.add_option('-d', '--debug', action='store_true')
+	options, args = parser.parse_args()
+	if len(args) != 1:
+		parser.error('expected one recording')
+	common.DEBUG = options.debug
+	try:
+		speed = 0 if options.speed == 'max' else float(options.speed)
+		if speed < 0:
+			raise ValueError
+		family, sock_type, sock_prot, addr = parse_addr(options.listen)
+		if family == SHM_FAMILY or sock_type != _SOCK_STREAM:
+			raise ValueError
+	except ValueError:
+		parser.error('invalid speed or listen address')
+	reader = SessionReader(args[0])
+	server = ServerSocketThread(first_resolution(reader), addr, family,
+	                            sock_type, sock_prot)
+	server.start()
+	try:
+		while len(server.client_stats()) < options.wait:
+			time.sleep(0.1)
+		while True:
+			start = monotonic()
+			frames = replay(reader, server, speed, options.session)
+			# Let the socket thread write everything before measuring
+			while server.queue_depth() or \
+			      sum([stats[3] for stats in server.client_stats()]):
+				time.sleep(0.01)
+			elapsed = monotonic() - start
+			print '%i frames in %.3f s (%.0f frames/s), %i clients' \
+			      % (frames, elapsed, frames/max(elapsed, 1e-6),
+			         len(server.client_stats()))
+			debug_output('%(coalesced)i motion frames coalesced, '
+			             '%(dropped)i dropped' % server.counters())
+			if not options.loop:
+				break
+	except KeyboardInterrupt:
+		pass
+	server.close()
+	reader.close()
+
+if __name__ == '__main__':
+	main()
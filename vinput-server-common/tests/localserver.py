@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+"""
+ A ServerSocketThread driven step by step from a test, without its thread.
+
+ Clients are connected through socket pairs, and every step of the
+ socket loop (reading requests, dispatching events) is called directly,
+ so the tests need no network and no waiting.
+
+ The tests run from vinput-server-common with
+  python -m unittest discover -s tests
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import errno, select, socket
+
+from vinputserver.server import ServerSocketThread
+
+class _Listener(object):
+	'''Stands in for the listening socket: accept() returns socket pairs'''
+
+	def __init__(self):
+		self.waiting = []
+
+	def accept(self):
+		if not self.waiting:
+			raise socket.error(errno.EAGAIN, 'no connection')
+		return self.waiting.pop(0), ''
+
+	def close(self):
+		for sock in self.waiting:
+			sock.close()
+		del self.waiting[:]
+
+class LocalServer(ServerSocketThread):
+	'''
+	LocalServer(resolution, **kwargs) -> a ServerSocketThread whose steps a
+	test calls itself; kwargs go to ServerSocketThread.
+	'''
+
+	def __init__(self, resolution, **kwargs):
+		super(LocalServer, self).__init__(resolution, '', socket.AF_UNIX,
+		                                  **kwargs)
+		self._sock = _Listener()
+		self._poller = select.poll()
+
+	def connect(self):
+		'''Accepts a new client; returns its end of the connection'''
+		theirs, ours = socket.socketpair()
+		ours.setblocking(False)
+		self._sock.waiting.append(theirs)
+		self._accept()
+		return ours
+
+	def request(self, sock, data):
+		'''Sends a request from a client and lets the server read it'''
+		sock.sendall(data)
+		for client in self._clients:
+			self._read(client)
+
+	def frame(self, events):
+		'''Sends the events of one input frame to all clients'''
+		for event in events:
+			self.send(*event)
+		self.flush()
+		self.step()
+
+	def step(self):
+		'''Runs the dispatching part of one round of the socket loop'''
+		self._drain_wakeup()
+		gestures = self._take_gestures()
+		self._dispatch()
+		self._dispatch_gestures(gestures)
+
+def receive(sock):
+	'''Returns everything a client end of a connection can read now'''
+	data = ''
+	while True:
+		try:
+			chunk = sock.recv(65536)
+		except socket.error, e:
+			if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+				return data
+			raise
+		if not chunk:
+			return data
+		data += chunk
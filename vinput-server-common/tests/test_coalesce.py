@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Tests of MotionCoalescer: what the pending events of a lagging client
+ keep when motion is coalesced, taken or dropped.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import unittest
+
+from vinputserver.coalesce import MotionCoalescer, GESTURE_OPCODE, \
+                                  GESTURE_CHANGE_OPCODE, GESTURE_POINTER
+
+def coalesced(events):
+	'''Returns a MotionCoalescer with events added'''
+	pending = MotionCoalescer()
+	pending.extend(events)
+	return pending
+
+class MotionCoalescerTest(unittest.TestCase):
+
+	def test_latest_motion_wins(self):
+		pending = coalesced([('.', 0, 1, 1), ('.', 1, 5, 5), ('.', 0, 2, 2),
+		                     ('.', 0, 3, 3), ('.', 1, 6, 6)])
+		# In the place of the first motion of each pointer
+		self.assertEqual(pending.events, [('.', 0, 3, 3), ('.', 1, 6, 6)])
+		self.assertEqual((len(pending), pending.coalesced), (2, 3))
+
+	def test_touches_are_kept_in_order(self):
+		events = [('.', 0, 1, 1), ('d', 0, 1, 1), ('.', 0, 2, 2),
+		          ('u', 0, 2, 2), ('d', 0, 2, 2), ('D', 1, 0, 0),
+		          ('.', 0, 3, 3), ('.', 0, 4, 4), ('U', 1, 0, 0)]
+		pending = coalesced(events)
+		# Motion never moves across a touch or release of its pointer
+		self.assertEqual(pending.events, events[:6] + events[7:])
+		self.assertEqual(pending.coalesced, 1)
+
+	def test_take_urgent(self):
+		pending = coalesced([('.', 0, 1, 1), ('d', 1, 5, 5), ('.', 0, 2, 2),
+		                     ('.', 1, 6, 6)])
+		self.assertEqual(pending.take_urgent(), [('.', 0, 2, 2),
+		                                         ('d', 1, 5, 5)])
+		self.assertEqual(pending.take_urgent(), [])
+		pending.add(('.', 1, 7, 7))
+		self.assertEqual(pending.take(), [('.', 1, 7, 7)])
+		self.assertEqual(pending.take(), [])
+
+	def test_drop_motion(self):
+		pending = coalesced([('.', 0, 1, 1), ('.', 1, 5, 5), ('d', 0, 0, 0),
+		                     ('.', 0, 2, 2), ('u', 0, 0, 0), ('.', 1, 6, 6),
+		                     ('D', 1, 0, 0), ('.', 1, 7, 7)])
+		# 'd' and 'u' carry no position: the motion before them stays
+		self.assertEqual(pending.drop_motion(), 2)
+		self.assertEqual(pending.events, [('.', 0, 1, 1), ('d', 0, 0, 0),
+		                                  ('.', 0, 2, 2), ('u', 0, 0, 0),
+		                                  ('D', 1, 0, 0)])
+		# Motion added afterwards starts over
+		pending.add(('.', 1, 8, 8))
+		pending.add(('.', 1, 9, 9))
+		self.assertEqual(pending.events[-1], ('.', 1, 9, 9))
+		self.assertEqual(len(pending), 6)
+
+	def test_gesture_change_moves_behind(self):
+		begin = (GESTURE_OPCODE, GESTURE_POINTER, 'begin', 0)
+		first = (GESTURE_CHANGE_OPCODE, GESTURE_POINTER, 'first', 0)
+		second = (GESTURE_CHANGE_OPCODE, GESTURE_POINTER, 'second', 0)
+		pending = coalesced([begin, ('.', 0, 1, 1), first, ('.', 1, 5, 5),
+		                     ('.', 0, 2, 2), second, ('.', 1, 6, 6)])
+		# The newest change follows all events it describes
+		self.assertEqual(pending.events, [begin, ('.', 0, 2, 2),
+		                                  ('.', 1, 6, 6), second])
+		self.assertEqual(pending.drop_motion(), 3)
+		self.assertEqual(pending.events, [begin])
+
+if __name__ == '__main__':
+	unittest.main()
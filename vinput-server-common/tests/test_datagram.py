@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Tests of the datagram transport: sequence numbers and keyframes on the
+ receiving side and the datagrams the server sends, over a unix datagram
+ socket.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import os, shutil, socket, tempfile, unittest
+
+from vinputserver.protocol import encode_datagram_header, encode_frame, \
+                                  decode_datagram, DATAGRAM_KEYFRAME, \
+                                  MAX_DATAGRAM_FRAMES, MAX_DATAGRAM_SIZE, \
+                                  DATAGRAM_HEADER_SIZE, FRAME_SIZE
+from vinputserver.datagram import DatagramThread, DatagramReceiver, \
+                                  update_state, keyframe_events
+
+def datagram(seq, events, flags=0):
+	'''Returns a datagram as the server sends it'''
+	return encode_datagram_header(seq, flags, 100, 100) + \
+	       ''.join([encode_frame(*event) for event in events])
+
+class DatagramReceiverTest(unittest.TestCase):
+
+	def setUp(self):
+		self.receiver = DatagramReceiver(('127.0.0.1', 1), socket.AF_INET)
+
+	def tearDown(self):
+		self.receiver.close()
+
+	def test_sequence(self):
+		receiver = self.receiver
+		self.assertEqual(receiver.handle(datagram(0xfffffffe,
+		                                          [('d', 0, 1, 2)])),
+		                 [('d', 0, 1, 2)])
+		# Across the wrap of the sequence number, two datagrams missing
+		receiver.handle(datagram(0xffffffff, [('.', 0, 3, 4)]))
+		receiver.handle(datagram(2, [('.', 0, 5, 6)]))
+		# One that comes too late is ignored
+		self.assertEqual(receiver.handle(datagram(1, [('u', 0, 5, 6)])), [])
+		self.assertEqual((receiver.received, receiver.lost, receiver.late),
+		                 (4, 2, 1))
+		self.assertEqual(receiver.state, {0: [True, 5, 6]})
+		self.assertEqual(receiver.resolution, (100, 100))
+
+	def test_keyframe(self):
+		receiver = self.receiver
+		receiver.handle(datagram(0, [('d', 0, 1, 1), ('.', 1, 2, 2),
+		                             ('d', 2, 3, 3)]))
+		# The release of pointer 0 and a touch of pointer 1 got lost
+		events = receiver.handle(datagram(5, [('U', 0, 1, 1), ('D', 1, 2, 2),
+		                                      ('D', 2, 4, 4)],
+		                                  DATAGRAM_KEYFRAME))
+		self.assertEqual(events, [('U', 0, 1, 1), ('D', 1, 2, 2),
+		                          ('.', 2, 4, 4)])
+		self.assertEqual(receiver.lost, 4)
+		# A keyframe of the same state changes nothing
+		self.assertEqual(receiver.handle(datagram(6, keyframe_events(
+			receiver.state), DATAGRAM_KEYFRAME)), [])
+
+class DatagramThreadTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		addr = os.path.join(self.directory, 'receiver')
+		self.receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+		self.receiver.bind(addr)
+		# The multicast group is the only destination
+		self.server = DatagramThread((100, 100), None, socket.AF_UNIX, addr)
+		self.server._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+	def tearDown(self):
+		self.server._sock.close()
+		self.receiver.close()
+		shutil.rmtree(self.directory)
+
+	def test_chunks(self):
+		events = [('.', pointer % 8, pointer, 0) for pointer
+		          in xrange(2*MAX_DATAGRAM_FRAMES + 1)]
+		self.server._seq = 0xffffffff
+		self.server._send_datagrams(events, 0)
+		received = [decode_datagram(self.receiver.recv(MAX_DATAGRAM_SIZE))
+		            for _ in xrange(3)]
+		self.assertEqual([seq for seq, flags, resolution, frames
+		                  in received], [0xffffffff, 0, 1])
+		self.assertEqual(sum([frames for seq, flags, resolution, frames
+		                      in received], []), events)
+		self.assertEqual(self.server.datagrams, 3)
+		self.assertEqual(self.server.client_stats(),
+		                 [(self.server.multicast_group, len(events),
+		                   3*DATAGRAM_HEADER_SIZE + FRAME_SIZE*len(events),
+		                   0)])
+
+	def test_state(self):
+		state = {}
+		update_state(state, [('d', 0, 0, 0), ('.', 0, 5, 6), ('!', 1, 7, 8),
+		                     ('D', 2, 9, 9)])
+		self.assertEqual(keyframe_events(state), [('D', 0, 5, 6),
+		                                          ('U', 1, 7, 8),
+		                                          ('D', 2, 9, 9)])
+		self.server._send_datagrams(keyframe_events(state),
+		                            DATAGRAM_KEYFRAME)
+		seq, flags, resolution, frames = decode_datagram(
+			self.receiver.recv(MAX_DATAGRAM_SIZE))
+		self.assertEqual((flags, resolution), (DATAGRAM_KEYFRAME, (100, 100)))
+
+if __name__ == '__main__':
+	unittest.main()
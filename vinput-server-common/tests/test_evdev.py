@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Tests of MultitouchDecoder: the touches it hands to a TouchSender for
+ input_event records, without a device.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import struct, unittest
+
+from vinputserver.uinput import EV_SYN, EV_KEY, EV_ABS, SYN_REPORT, ABS_X, \
+                                ABS_Y, BTN_TOUCH
+from vinputserver.evdev import SYN_DROPPED, ABS_MT_SLOT, ABS_MT_POSITION_X, \
+                               ABS_MT_POSITION_Y, ABS_MT_TRACKING_ID, \
+                               MultitouchDecoder, decode_events
+
+class _Server(object):
+	'''Stands in for the output thread of the TouchSender'''
+	latency = tracer = None
+
+class _Touches(object):
+	'''Stands in for a TouchSender and keeps the calls of every frame'''
+
+	def __init__(self):
+		self.server = _Server()
+		self.frames = []
+		self._calls = set()
+
+	def down(self, touchid, xcoord, ycoord):
+		self._calls.add(('down', touchid, xcoord, ycoord))
+
+	def motion(self, touchid, xcoord, ycoord):
+		self._calls.add(('motion', touchid, xcoord, ycoord))
+
+	def up(self, touchid, xcoord, ycoord):
+		self._calls.add(('up', touchid, xcoord, ycoord))
+
+	def frame(self, now=None):
+		self.frames.append((now, self._calls))
+		self._calls = set()
+
+def records(*events):
+	'''Returns input_event records of (type, code, value), one a second'''
+	return ''.join([struct.pack('@llHHi', second, 250000, type_, code, value)
+	                for second, (type_, code, value) in enumerate(events)])
+
+def report():
+	return EV_SYN, SYN_REPORT, 0
+
+class MultitouchDecoderTest(unittest.TestCase):
+
+	def feed(self, decoder, *events):
+		decoder.feed(decode_events(records(*events)))
+
+	def test_slots(self):
+		touches = _Touches()
+		decoder = MultitouchDecoder(touches, ((0, 1023), (0, 1023)),
+		                            (2048, 1024))
+		self.feed(decoder,
+		          (EV_ABS, ABS_MT_TRACKING_ID, 5), (EV_ABS, ABS_MT_POSITION_X, 100),
+		          (EV_ABS, ABS_MT_POSITION_Y, 200), report(),
+		          (EV_ABS, ABS_MT_POSITION_X, 110), (EV_ABS, ABS_MT_SLOT, 1),
+		          (EV_ABS, ABS_MT_TRACKING_ID, 6), (EV_ABS, ABS_MT_POSITION_X, 300),
+		          (EV_ABS, ABS_MT_POSITION_Y, 400), report(),
+		          (EV_ABS, ABS_MT_SLOT, 0), (EV_ABS, ABS_MT_TRACKING_ID, -1),
+		          report(),
+		          # A new contact in the same slot ends the old one
+		          (EV_ABS, ABS_MT_SLOT, 1), (EV_ABS, ABS_MT_TRACKING_ID, 7),
+		          (EV_ABS, ABS_MT_POSITION_X, 310),
+		          # A contact where the last one of its slot ended
+		          (EV_ABS, ABS_MT_SLOT, 0), (EV_ABS, ABS_MT_TRACKING_ID, 8),
+		          report())
+		self.assertEqual(touches.frames, [
+			(None, set([('down', 5, 200, 200)])),
+			(None, set([('motion', 5, 220, 200), ('down', 6, 600, 400)])),
+			(None, set([('up', 5, 220, 200)])),
+			(None, set([('up', 6, 620, 400), ('down', 7, 620, 400),
+			            ('down', 8, 220, 200)]))])
+		self.assertEqual(decoder.reports, 4)
+
+	def test_dropped(self):
+		touches = _Touches()
+		decoder = MultitouchDecoder(touches, event_time=True)
+		self.feed(decoder,
+		          (EV_ABS, ABS_MT_TRACKING_ID, 1), (EV_ABS, ABS_MT_POSITION_X, 10),
+		          (EV_ABS, ABS_MT_POSITION_Y, 20), report(),
+		          # The records up to the next report are incomplete
+		          (EV_SYN, SYN_DROPPED, 0), (EV_ABS, ABS_MT_POSITION_X, 999),
+		          (EV_ABS, ABS_MT_TRACKING_ID, -1), report(),
+		          (EV_ABS, ABS_MT_POSITION_Y, 30), report(),
+		          # Reports without changes end no frame
+		          report())
+		self.assertEqual(touches.frames, [
+			(3.25, set([('down', 1, 10, 20)])),
+			(9.25, set([('motion', 1, 10, 30)]))])
+		self.assertEqual((decoder.reports, decoder.dropped), (3, 1))
+
+	def test_single_touch(self):
+		touches = _Touches()
+		decoder = MultitouchDecoder(touches)
+		self.feed(decoder,
+		          (EV_ABS, ABS_X, 50), (EV_ABS, ABS_Y, 60),
+		          (EV_KEY, BTN_TOUCH, 1), report(),
+		          (EV_ABS, ABS_X, 55), report(),
+		          (EV_KEY, BTN_TOUCH, 0), report(),
+		          # The device sends no position that did not change
+		          (EV_KEY, BTN_TOUCH, 1), report())
+		self.assertEqual(touches.frames, [
+			(None, set([('down', 0, 50, 60)])),
+			(None, set([('motion', 0, 55, 60)])),
+			(None, set([('up', 0, 55, 60)])),
+			(None, set([('down', 3, 55, 60)]))])
+
+	def test_decode_events(self):
+		data = records((EV_ABS, ABS_X, -1), report())
+		self.assertEqual(decode_events(data + data[:5]),
+		                 (0, 250000, EV_ABS, ABS_X, -1,
+		                  1, 250000, EV_SYN, SYN_REPORT, 0))
+
+if __name__ == '__main__':
+	unittest.main()
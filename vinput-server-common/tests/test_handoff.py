@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Tests of the handoff protocol between two servers, both ends in this
+ process.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import os, errno, shutil, socket, stat, tempfile, threading, unittest
+
+from vinputserver.handoff import request_handoff, serve_handoff, \
+                                 open_handoff_socket
+
+class HandoffTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.addr = os.path.join(self.directory, 'handoff')
+		self.sock = open_handoff_socket(self.addr)
+		self.sock.setblocking(True)
+		self.served = []
+
+	def tearDown(self):
+		self.sock.close()
+		shutil.rmtree(self.directory)
+
+	def serve(self, fds):
+		'''Answers one handoff request in a thread'''
+		def run():
+			conn = self.sock.accept()[0]
+			try:
+				self.served.append(serve_handoff(conn, {'clients': [{}]}, fds))
+			except socket.error, e:
+				self.served.append(e.args[0])
+			finally:
+				conn.close()
+		thread = threading.Thread(target=run)
+		thread.start()
+		return thread
+
+	def test_handoff(self):
+		self.assertEqual(stat.S_IMODE(os.stat(self.addr).st_mode), 0600)
+		read_end, write_end = os.pipe()
+		thread = self.serve([read_end, write_end])
+		state, fds = request_handoff(self.addr)
+		thread.join()
+		self.assertEqual((state, self.served), ({'clients': [{}]}, [True]))
+		os.write(fds[1], 'x')
+		self.assertEqual(os.read(read_end, 1), 'x')
+		for fd in fds + [read_end, write_end]:
+			os.close(fd)
+
+	def test_other_user(self):
+		# Each side takes the other for a process of another user
+		getuid = os.getuid
+		os.getuid = lambda: getuid() + 1
+		try:
+			thread = self.serve([0])
+			client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			client.connect(self.addr)
+			thread.join()
+			self.assertEqual(self.served, [errno.EPERM])
+			# The refused peer gets nothing
+			self.assertEqual(client.recv(1), '')
+			client.close()
+			thread = self.serve([0])
+			try:
+				request_handoff(self.addr)
+			except socket.error, e:
+				self.assertEqual(e.args[0], errno.EPERM)
+			else:
+				self.fail('handoff from another user')
+			thread.join()
+		finally:
+			os.getuid = getuid
+
+	def test_abstract_address(self):
+		self.assertRaises(ValueError, open_handoff_socket, '\0vinput')
+		self.assertRaises(ValueError, request_handoff, '\0vinput')
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Tests of the latency histograms and of what the socket thread keeps of
+ them for its clients.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import unittest
+
+from vinputserver.latency import LatencyHistogram, LatencyRecorder, \
+                                 STAGE_WRITE
+
+from localserver import LocalServer, receive
+
+class LatencyHistogramTest(unittest.TestCase):
+
+	def test_percentiles(self):
+		histogram = LatencyHistogram(100000)
+		for value in xrange(1, 1001):
+			histogram.record(value)
+		histogram.record(10**9)
+		count, p50, p99, maximum = histogram.summary()
+		self.assertEqual((count, maximum), (1001, 100000))
+		# Within the relative error of the buckets
+		self.assertTrue(abs(p50 - 500) <= 500*0.016, p50)
+		self.assertTrue(abs(p99 - 990) <= 990*0.016, p99)
+		self.assertEqual(LatencyHistogram().summary(), (0, 0, 0, 0))
+
+class ClientHistogramTest(unittest.TestCase):
+
+	def test_disconnected_client(self):
+		server = LocalServer((1000, 1000))
+		server.latency = LatencyRecorder()
+		socks = [server.connect() for _ in xrange(2)]
+		server.latency.capture()
+		server.frame([('.', 0, 10, 10)])
+		for sock in socks:
+			receive(sock)
+		self.assertEqual(len(server.latency.clients), 2)
+		# A client that is gone takes its histogram along; its writes
+		# stay in the write stage
+		socks[0].close()
+		for client in server._clients[:]:
+			server._read(client)
+		self.assertEqual(server.latency.clients.keys(),
+		                 [server._clients[0].name()])
+		self.assertEqual(server.latency.histogram(STAGE_WRITE).count, 2)
+		socks[1].close()
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Tests of protocol version 2: DeltaEncoder and DeltaDecoder on their own
+ and the whole way from the server to a version 2 client.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import unittest
+
+from vinputserver.protocol import HELO_MAGIC, encode_helo, encode_frame
+from vinputserver.protocol2 import HELO2_MAGIC, CAP_PRESSURE, \
+                                   CAP_TIMESTAMP, DeltaEncoder, \
+                                   DeltaDecoder, encode_request, encode_helo2
+from vinputserver.regions import encode_region_request
+from vinputserver.transform import make_transform, encode_transform_request
+from vinputserver.gestures import GESTURE_MAGIC, GESTURE_BEGIN, \
+                                  GESTURE_CHANGE, GESTURE_END, \
+                                  encode_gesture, encode_gesture_request
+
+from localserver import LocalServer, receive
+
+def events_of(decoded):
+	'''Returns the (opcode, pointer, x, y) of all decoded events'''
+	return [event[:4] for magic, value in decoded if magic is None
+	        for event in value[1]]
+
+class DeltaDecoderTest(unittest.TestCase):
+
+	def test_packets(self):
+		encoder = DeltaEncoder(CAP_PRESSURE | CAP_TIMESTAMP, 10.0)
+		first = [('d', 0, 100, 200, 7), ('.', 1, 65535, 0, 255)]
+		second = [('.', 0, 98, 203), ('u', 1, 0, 0, 1)]
+		data = encode_helo(640, 480) + encode_helo2(3, 640, 480) + \
+		       str(encoder.encode(first, 10.5)) + \
+		       str(encoder.encode(second, 11.25))
+		decoder = DeltaDecoder()
+		self.assertEqual(decoder.feed(data), [
+			(HELO_MAGIC, (640, 480)),
+			(HELO2_MAGIC, (2, 3, (640, 480))),
+			(None, (500, [('d', 0, 100, 200, 7), ('.', 1, 65535, 0, 255)])),
+			(None, (1250, [('.', 0, 98, 203, 0), ('u', 1, 0, 0, 1)]))])
+		self.assertEqual(decoder.resolution, (640, 480))
+
+	def test_pieces(self):
+		encoder = DeltaEncoder(0)
+		events = [('.', pointer, pointer*200, 1000 - pointer) for pointer
+		          in xrange(256)]
+		data = encode_helo(1280, 720) + encode_frame('d', 4, 5, 6) + \
+		       encode_helo2(0, 1280, 720) + str(encoder.encode(events))
+		decoder = DeltaDecoder()
+		decoded = []
+		for offset in xrange(len(data)):
+			decoded += decoder.feed(data[offset])
+		self.assertEqual(events_of(decoded), [('d', 4, 5, 6)] + events)
+		self.assertEqual(decoder.feed(''), [])
+
+	def test_new_helo2_resets_positions(self):
+		decoder = DeltaDecoder()
+		encoder = DeltaEncoder(0)
+		decoder.feed(encode_helo(100, 100) + encode_helo2(0, 100, 100) +
+		             str(encoder.encode([('d', 0, 50, 60)])))
+		# The server starts over with a new encoder after a new HELO2
+		encoder = DeltaEncoder(0)
+		decoded = decoder.feed(encode_helo2(0, 20, 30) +
+		                       str(encoder.encode([('.', 0, 5, 6)])))
+		self.assertEqual(decoded, [(HELO2_MAGIC, (2, 0, (20, 30))),
+		                           (None, (None, [('.', 0, 5, 6, None)]))])
+		self.assertEqual(decoder.resolution, (20, 30))
+
+	def test_invalid(self):
+		self.assertRaises(ValueError, DeltaDecoder().feed,
+		                  encode_frame('d', 0, 1, 2))
+		decoder = DeltaDecoder()
+		decoder.feed(encode_helo(100, 100) + encode_helo2(0, 100, 100))
+		self.assertRaises(ValueError, decoder.feed, encode_helo(100, 100))
+
+class RoundTripTest(unittest.TestCase):
+
+	def test_region_reannounce(self):
+		server = LocalServer((1000, 1000))
+		sock = server.connect()
+		server.request(sock, encode_request(CAP_TIMESTAMP))
+		server.frame([('.', 0, 100, 100), ('d', 0, 100, 100),
+		              ('.', 1, 600, 600)])
+		server.frame([('.', 0, 110, 120)])
+		# Region of the lower right quarter, scaled to 100x100
+		server.request(sock, encode_region_request(500, 500, 500, 500,
+		                                           100, 100))
+		server.frame([('.', 1, 700, 800), ('.', 0, 120, 130)])
+		server.frame([('d', 1, 700, 800), ('.', 1, 750, 750)])
+		decoder = DeltaDecoder()
+		decoded = decoder.feed(receive(sock))
+		self.assertEqual([magic for magic, value in decoded
+		                  if magic is not None], [HELO_MAGIC, HELO2_MAGIC,
+		                                          HELO2_MAGIC])
+		self.assertEqual(decoded[-3][1], (2, CAP_TIMESTAMP, (100, 100)))
+		# Only pointer 1 is inside the region
+		self.assertEqual(events_of(decoded[-3:]), [('.', 1, 40, 60),
+		                                           ('d', 1, 40, 60),
+		                                           ('.', 1, 50, 50)])
+		self.assertEqual(events_of(decoded[:-3]), [('.', 0, 100, 100),
+		                                           ('d', 0, 100, 100),
+		                                           ('.', 1, 600, 600),
+		                                           ('.', 0, 110, 120)])
+
+	def test_no_pressure(self):
+		server = LocalServer((1000, 1000))
+		sock = server.connect()
+		# No input source gives pressure: it is not granted
+		server.request(sock, encode_request(CAP_PRESSURE | CAP_TIMESTAMP))
+		server.frame([('d', 0, 100, 100)])
+		decoded = DeltaDecoder().feed(receive(sock))
+		self.assertEqual(decoded[1], (HELO2_MAGIC,
+		                              (2, CAP_TIMESTAMP, (1000, 1000))))
+		self.assertEqual(decoded[2][1][1], [('d', 0, 100, 100, None)])
+
+	def test_region_while_pending(self):
+		server = LocalServer((1000, 1000))
+		sock = server.connect()
+		server.request(sock, '#F\0\x01')
+		server.frame([('.', 0, 10, 10)])
+		server.frame([('.', 0, 950, 950)])
+		server.request(sock, encode_region_request(0, 0, 100, 100))
+		server.frame([('.', 0, 50, 60)])
+		# The pending motion was made for the whole surface: it comes
+		# before the HELO of the region
+		self.assertEqual(DeltaDecoder().feed(receive(sock)), [
+			(HELO_MAGIC, (1000, 1000)),
+			(None, (None, [('.', 0, 10, 10, None)])),
+			(None, (None, [('.', 0, 950, 950, None)])),
+			(HELO_MAGIC, (100, 100))])
+
+	def test_transform_while_pending(self):
+		server = LocalServer((1000, 1000))
+		sock = server.connect()
+		server.request(sock, '#F\0\x01')
+		server.frame([('.', 0, 10, 10)])
+		server.frame([('.', 0, 500, 500), ('.', 1, 800, 800)])
+		server.request(sock, encode_transform_request(
+			make_transform((0.1, 0.1), resolution=(100, 100))))
+		server.frame([('.', 0, 900, 900)])
+		# The pending motion is not transformed: it comes before the HELO
+		# of the new resolution
+		decoded = DeltaDecoder().feed(receive(sock))
+		self.assertEqual(decoded[-1], (HELO_MAGIC, (100, 100)))
+		self.assertEqual(events_of(decoded), [('.', 0, 10, 10),
+		                                      ('.', 0, 500, 500),
+		                                      ('.', 1, 800, 800)])
+
+	def test_rate_limited(self):
+		server = LocalServer((1000, 1000))
+		sock = server.connect()
+		server.request(sock, encode_request(0))
+		# A rate limited client gets its events through the pending queue
+		server.request(sock, '#F\0\x01')
+		for step in xrange(5):
+			server.frame([('.', 0, 10*step, 10*step)])
+		server.frame([('d', 0, 50, 50)])
+		decoded = DeltaDecoder().feed(receive(sock))
+		# The first motion is due at once, the touch brings the newest
+		# motion along
+		self.assertEqual(events_of(decoded), [('.', 0, 0, 0),
+		                                      ('.', 0, 40, 40),
+		                                      ('d', 0, 50, 50)])
+
+	def test_gestures(self):
+		server = LocalServer((1000, 1000))
+		plain, limited = server.connect(), server.connect()
+		for sock in (plain, limited):
+			server.request(sock, encode_request(0))
+			server.request(sock, encode_gesture_request())
+		server.request(limited, '#F\0\x01')
+		for step, (events, phase) in enumerate([
+				([('.', 0, 10, 10), ('d', 0, 10, 10)], GESTURE_BEGIN),
+				([('.', 0, 20, 20)], GESTURE_CHANGE),
+				([('.', 0, 30, 30)], GESTURE_CHANGE),
+				([('u', 0, 30, 30)], GESTURE_END)]):
+			for event in events:
+				server.send(*event)
+			server.flush()
+			server.send_gesture(encode_gesture(phase, 1, 10*step, 0, 1.0,
+			                                   0, 0, 0))
+			server.step()
+		# Every gesture frame comes after the events it describes, between
+		# two packets
+		decoded = DeltaDecoder().feed(receive(plain))
+		self.assertEqual([(magic, value[:3]) for magic, value
+		                  in decoded[2:] if magic == GESTURE_MAGIC], [
+			(GESTURE_MAGIC, (GESTURE_BEGIN, 1, 0)),
+			(GESTURE_MAGIC, (GESTURE_CHANGE, 1, 10)),
+			(GESTURE_MAGIC, (GESTURE_CHANGE, 1, 20)),
+			(GESTURE_MAGIC, (GESTURE_END, 1, 30))])
+		self.assertEqual([magic for magic, value in decoded[2:]],
+		                 [None, GESTURE_MAGIC]*4)
+		# The rate limited client gets only the newest change, with the
+		# motion it describes
+		decoded = DeltaDecoder().feed(receive(limited))
+		self.assertEqual([(magic, value[:3]) if magic else events_of([
+		                  (magic, value)]) for magic, value in decoded[2:]], [
+			[('.', 0, 10, 10), ('d', 0, 10, 10)],
+			(GESTURE_MAGIC, (GESTURE_BEGIN, 1, 0)),
+			[('.', 0, 30, 30)],
+			(GESTURE_MAGIC, (GESTURE_CHANGE, 1, 20)),
+			[('u', 0, 30, 30)],
+			(GESTURE_MAGIC, (GESTURE_END, 1, 30))])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Tests of the rate limit schedule and of what a rate limited client's
+ pending events give up, with made-up times.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import unittest
+
+from vinputserver.ratelimit import RateLimit, MAX_RATE, MIN_RATE, \
+                                   DRAIN_HEADROOM, encode_rate_request, \
+                                   decode_rate_request
+from vinputserver.coalesce import MotionCoalescer
+
+class RateLimitTest(unittest.TestCase):
+
+	def test_request(self):
+		self.assertEqual(decode_rate_request(encode_rate_request(30)), 30)
+		self.assertEqual(decode_rate_request('xx' + encode_rate_request(0),
+		                                     2), 0)
+		self.assertRaises(ValueError, decode_rate_request, '#G\0\x01')
+
+	def test_declared_rate(self):
+		limit = RateLimit(20)
+		self.assertTrue(limit.due(100.0))
+		limit.tick(100.0, 12)
+		self.assertFalse(limit.due(100.04))
+		self.assertAlmostEqual(limit.timeout(100.04), 0.01)
+		self.assertTrue(limit.due(100.05))
+		self.assertEqual(limit.timeout(100.1), 0.0)
+		# A declared rate neither grows nor follows the drain speed
+		limit.behind(0)
+		limit.caught_up(1.0, 120)
+		self.assertEqual(limit.rate, 20.0)
+		self.assertEqual(limit.update_size, 12.0)
+
+	def test_inferred_rate(self):
+		limit = RateLimit(0)
+		self.assertEqual(limit.rate, MAX_RATE)
+		limit.tick(0.0, 60)
+		limit.tick(0.001, 60, keeping_up=False)
+		# 60000 bytes in a second are 1000 updates of 60 bytes
+		limit.behind(1000)
+		limit.caught_up(0.5, 31000)
+		self.assertAlmostEqual(limit.rate, 1000*DRAIN_HEADROOM)
+		self.assertAlmostEqual(limit.next_tick, 0.001 + 1.0/MAX_RATE)
+		rate = limit.rate
+		limit.tick(1.0, 60)
+		self.assertTrue(rate < limit.rate < rate*1.25)
+		# Without behind() first there is nothing to measure
+		limit.caught_up(0.5, 100000)
+		self.assertTrue(rate < limit.rate < rate*1.25)
+		limit.behind(0)
+		limit.caught_up(10.0, 1)
+		self.assertEqual(limit.rate, MIN_RATE)
+
+	def test_handoff(self):
+		limit = RateLimit(0)
+		limit.behind(0)
+		limit.tick(0.0, 100)
+		limit.caught_up(1.0, 5000)
+		adopted = RateLimit.adopt(limit.export())
+		self.assertEqual((adopted.rate, adopted.adaptive),
+		                 (limit.rate, True))
+		adopted = RateLimit.adopt(RateLimit(25).export())
+		self.assertEqual((adopted.rate, adopted.adaptive), (25.0, False))
+
+class TakeUrgentTest(unittest.TestCase):
+
+	def test_motion_after_touch_stays(self):
+		pending = MotionCoalescer()
+		pending.extend([('.', 0, 1, 1), ('.', 1, 5, 5), ('.', 0, 2, 2),
+		                ('d', 0, 2, 2), ('.', 0, 3, 3), ('.', 1, 6, 6),
+		                ('.', 0, 4, 4)])
+		# The touch brings the newest motion of the other pointer along
+		self.assertEqual(pending.take_urgent(), [('.', 0, 2, 2),
+		                                         ('.', 1, 6, 6),
+		                                         ('d', 0, 2, 2)])
+		self.assertEqual(pending.events, [('.', 0, 4, 4)])
+		self.assertEqual(pending.take_urgent(), [])
+		# The motion left over still is coalesced
+		pending.add(('.', 1, 7, 7))
+		pending.add(('.', 0, 5, 5))
+		self.assertEqual(pending.take(), [('.', 0, 5, 5), ('.', 1, 7, 7)])
+
+if __name__ == '__main__':
+	unittest.main()
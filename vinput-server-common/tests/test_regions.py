@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Tests of RegionRouter: what the subscribers of a region get and how
+ subscribers of equal regions share their events.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import unittest
+
+from vinputserver.regions import Region, RegionRouter
+
+class RegionRouterTest(unittest.TestCase):
+
+	def setUp(self):
+		self.router = RegionRouter((1600, 1600))
+		self.router.subscribe('left', Region(0, 0, 800, 1600, 400, 800))
+		self.router.subscribe('right', Region(800, 0, 800, 1600))
+
+	def route(self, events):
+		'''Returns the events of every subscriber'''
+		routed = self.router.route(events)
+		return dict([(subscriber, routed[group]) for group in routed
+		             for subscriber in group.subscribers])
+
+	def test_crossing(self):
+		self.assertEqual(self.route([('d', 0, 100, 100), ('.', 0, 700, 100),
+		                             ('.', 0, 900, 100), ('u', 0, 900, 100)]),
+		                 {'left': [('d', 0, 50, 50), ('.', 0, 350, 50),
+		                           ('u', 0, 399, 50)],
+		                  'right': [('.', 0, 100, 100), ('d', 0, 100, 100),
+		                            ('u', 0, 100, 100)]})
+
+	def test_hover_and_outside(self):
+		# Motion without a touch stays motion, in every cell; outside of
+		# the surface it goes nowhere
+		events = [('.', 1, x, 800) for x in xrange(0, 1600, 100)]
+		routed = self.route(events)
+		self.assertEqual(len(routed['left']) + len(routed['right']), 16)
+		self.assertEqual(routed['right'][0], ('.', 1, 0, 800))
+		self.assertEqual(self.route([('.', 1, 1700, 1700)]), {})
+
+	def test_shared_group(self):
+		self.router.subscribe('viewer', Region(800, 0, 800, 1600))
+		routed = self.router.route([('d', 2, 1000, 1000)])
+		self.assertEqual(routed.keys(), [self.router.group('right')])
+		self.assertTrue(self.router.group('viewer') is
+		                self.router.group('right'))
+
+	def test_join_while_touching(self):
+		self.route([('d', 3, 1000, 1000)])
+		# A pointer touches in the region already: the new subscriber
+		# has to get its own 'd'
+		self.router.subscribe('late', Region(800, 0, 800, 1600))
+		self.assertFalse(self.router.group('late') is
+		                 self.router.group('right'))
+		routed = self.route([('.', 3, 1010, 1000)])
+		self.assertEqual(routed['right'], [('.', 3, 210, 1000)])
+		self.assertEqual(routed['late'], [('.', 3, 210, 1000),
+		                                  ('d', 3, 210, 1000)])
+
+	def test_unsubscribe(self):
+		self.router.unsubscribe('left')
+		self.router.unsubscribe('unknown')
+		self.assertEqual(len(self.router), 1)
+		self.assertEqual(self.route([('d', 4, 10, 10)]), {})
+
+if __name__ == '__main__':
+	unittest.main()
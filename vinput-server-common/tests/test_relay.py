@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Tests of the pointer mapping of the relay, without upstream connections.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import socket, time, unittest
+
+from vinputserver.relay import Relay
+
+class _Output(object):
+	'''Stands in for the output thread and keeps what is sent'''
+
+	resolution = (100, 100)
+
+	def __init__(self):
+		self.sent = []
+
+	def send(self, opcode, pointer, xcoord=0, ycoord=0):
+		self.sent.append((opcode, pointer, xcoord, ycoord))
+
+	def flush(self):
+		pass
+
+class RelayTest(unittest.TestCase):
+
+	def setUp(self):
+		self.output = _Output()
+		self.relay = Relay(self.output, [('\0a', socket.AF_UNIX),
+		                                 ('\0b', socket.AF_UNIX)], 2, 1000)
+		for upstream in self.relay.upstreams:
+			upstream.scale = (1.0, 1.0)
+
+	def relay_events(self, index, events):
+		upstream = self.relay.upstreams[index]
+		for event in events:
+			self.relay._relay(upstream, *event)
+
+	def test_reclaimed_pointer_touches_again(self):
+		self.relay_events(0, [('d', 5, 10, 10)])
+		self.relay._release(self.relay.cursorids.reclaim(time.time() + 2))
+		self.relay_events(0, [('.', 5, 20, 20), ('.', 5, 30, 30),
+		                      ('u', 5, 30, 30)])
+		self.assertEqual(self.output.sent, [
+			('d', 0, 10, 10), ('u', 0, 10, 10),
+			('d', 0, 20, 20), ('.', 0, 30, 30), ('u', 0, 30, 30)])
+
+	def test_pool_exhausted(self):
+		# The second upstream takes the id of the pointer nobody moved
+		self.relay_events(0, [('d', 1, 10, 10), ('d', 2, 20, 20)])
+		self.relay.cursorids._last_seen[(0, 1)] -= 2
+		self.relay_events(1, [('d', 1, 50, 50)])
+		self.relay_events(0, [('.', 1, 15, 15)])
+		self.assertEqual(self.output.sent[2:], [
+			('u', 0, 10, 10), ('d', 0, 50, 50)])
+
+	def test_lost_upstream(self):
+		self.relay_events(0, [('d', 1, 10, 10)])
+		self.relay._release(self.relay.cursorids.reclaim(time.time() + 2))
+		self.relay._lost(self.relay.upstreams[0])
+		self.relay_events(0, [('.', 1, 20, 20)])
+		self.assertEqual(self.output.sent[-1], ('.', 0, 20, 20))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Tests of the shared memory ring buffer: the writer's publishing is
+ called directly, so every interleaving with the reader is fixed.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import os, unittest
+
+from vinputserver.shmring import ShmRingThread, ShmRingReader, _COUNT, \
+                                 _RESERVED_OFFSET
+
+def motion(first, count):
+	'''Returns count motion events numbered from first'''
+	return [('.', 0, number, 0) for number in xrange(first, first + count)]
+
+class ShmRingTest(unittest.TestCase):
+
+	def setUp(self):
+		self.writer = ShmRingThread((640, 480), 'test-%i' % os.getpid(), 8)
+		self.writer._create_ring()
+		self.reader = ShmRingReader(self.writer.name)
+
+	def tearDown(self):
+		self.reader.close()
+		self.writer.close()
+
+	def test_wrap_around(self):
+		self.writer._publish(motion(0, 5))
+		self.assertEqual(self.reader.read(), motion(0, 5))
+		# Slots 5, 6, 7, 0, 1 and 2
+		self.writer._publish(motion(5, 6))
+		self.assertEqual(self.reader.read(), motion(5, 6))
+		self.assertEqual(self.reader.read(), [])
+		self.assertEqual(self.reader.lost, 0)
+		self.assertEqual(self.reader.resolution, (640, 480))
+
+	def test_overrun(self):
+		self.writer._publish(motion(0, 6))
+		self.writer._publish(motion(6, 14))
+		# Only the last ring full is left
+		self.assertEqual(self.reader.read(), motion(12, 8))
+		self.assertEqual(self.reader.lost, 12)
+		# A batch larger than the ring
+		self.writer._publish(motion(20, 11))
+		self.assertEqual(self.reader.read(), motion(23, 8))
+		self.assertEqual(self.reader.lost, 15)
+		self.assertEqual(self.writer.client_stats()[0][1], 31)
+
+	def test_copy_overtaken(self):
+		self.writer._publish(motion(0, 8))
+		# The writer has begun to copy 3 frames into the slots of the
+		# oldest ones when the reader copies them
+		_COUNT.pack_into(self.writer._mm, _RESERVED_OFFSET, 11)
+		self.assertEqual(self.reader.read(), motion(3, 5))
+		self.assertEqual(self.reader.lost, 3)
+
+	def test_from_start(self):
+		self.writer._publish(motion(0, 10))
+		reader = ShmRingReader(self.writer.name, from_start=True)
+		try:
+			self.assertEqual(reader.read(), motion(2, 8))
+			self.assertEqual(reader.lost, 0)
+		finally:
+			reader.close()
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Tests of TouchSender: the events it sends for the touches of an input
+ source and when it gives the ids of lost touches to new ones.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import unittest
+
+from vinputserver.touches import TouchSender
+
+class _Server(object):
+	'''Stands in for the output thread and keeps the sent batches'''
+
+	latency = tracer = None
+	gesture_clients = 0
+
+	def __init__(self):
+		self.batches = []
+		self._batch = []
+
+	def send(self, opcode, pointer, xcoord=0, ycoord=0):
+		self._batch.append((opcode, pointer, xcoord, ycoord))
+
+	def flush(self):
+		self.batches.append(self._batch)
+		self._batch = []
+
+class TouchSenderTest(unittest.TestCase):
+
+	def setUp(self):
+		self.server = _Server()
+		self.touches = TouchSender(self.server, 2, 1000)
+
+	def test_frames(self):
+		touches = self.touches
+		touches.down('a', 10, 20)
+		touches.down('b', 30, 40)
+		touches.frame(1.0)
+		touches.motion('a', 11, 21)
+		touches.up('b', 31, 41)
+		touches.motion('b', 32, 42)
+		touches.down('c', 50, 60)
+		touches.frame(2.0)
+		self.assertEqual(self.server.batches, [
+			[('.', 0, 10, 20), ('d', 0, 10, 20), ('.', 1, 30, 40),
+			 ('d', 1, 30, 40)],
+			# The released pointer number goes to the next touch
+			[('.', 0, 11, 21), ('u', 1, 31, 41), ('.', 1, 50, 60),
+			 ('d', 1, 50, 60)]])
+
+	def test_no_free_id(self):
+		touches = self.touches
+		touches.down('a', 10, 20)
+		touches.down('b', 30, 40)
+		# No touch is quiet for longer than the timeout: 'c' gets no id
+		touches.down('c', 50, 60)
+		touches.motion('c', 51, 61)
+		self.assertEqual(touches.cursorids.exhausted, 1)
+		# Once all ids are in use, a touch quiet for longer than the
+		# timeout gives up its id to a new one
+		touches.cursorids._last_seen['a'] -= 2
+		touches.down('d', 70, 80)
+		touches.motion('a', 12, 22)
+		touches.frame()
+		self.assertEqual(self.server.batches, [[
+			('.', 0, 10, 20), ('d', 0, 10, 20), ('.', 1, 30, 40),
+			('d', 1, 30, 40), ('u', 0, 0, 0), ('.', 0, 70, 80),
+			('d', 0, 70, 80)]])
+
+	def test_frame_does_not_reclaim(self):
+		touches = self.touches
+		touches.down('a', 10, 20)
+		touches.cursorids._last_seen['a'] -= 2
+		# A finger resting on the device sends nothing; while ids are
+		# free, it keeps its own
+		touches.frame()
+		touches.down('b', 30, 40)
+		touches.frame()
+		self.assertEqual(self.server.batches[1], [('.', 1, 30, 40),
+		                                          ('d', 1, 30, 40)])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Tests of the reference client: the input_event records UInputClient
+ writes for the frames of a server, with pipes standing in for uinput.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import os, unittest
+
+from vinputserver.protocol import encode_helo, encode_frame
+from vinputserver.uinput import EV_SYN, EV_KEY, EV_ABS, SYN_REPORT, ABS_X, \
+                                ABS_Y, ABS_PRESSURE, BTN_LEFT, \
+                                INPUT_EVENT_SIZE, PointerDevice, UInputClient
+from vinputserver.evdev import decode_events
+
+class _Pipes(object):
+	'''Opens a pipe per device; the client writes to it, the test reads'''
+
+	def __init__(self):
+		self.names, self.ends = [], []
+
+	def __call__(self, name, width, height):
+		read_end, write_end = os.pipe()
+		self.names.append((name, width, height))
+		self.ends.append(read_end)
+		return write_end
+
+	def records(self, index):
+		'''Returns the (type, code, value) of the records of a device'''
+		fields = decode_events(os.read(self.ends[index], 65536))
+		return [fields[offset+2:offset+5] for offset
+		        in xrange(0, len(fields), 5)]
+
+	def close(self):
+		for fd in self.ends:
+			os.close(fd)
+
+def move(xcoord, ycoord):
+	return [(EV_ABS, ABS_X, xcoord), (EV_ABS, ABS_Y, ycoord),
+	        (EV_SYN, SYN_REPORT, 0)]
+
+def button(value):
+	return [(EV_KEY, BTN_LEFT, value), (EV_ABS, ABS_PRESSURE, value),
+	        (EV_SYN, SYN_REPORT, 0)]
+
+class UInputClientTest(unittest.TestCase):
+
+	def setUp(self):
+		self.pipes = _Pipes()
+		self.client = UInputClient(None, 2, self.pipes)
+
+	def tearDown(self):
+		self.client.close()
+		self.pipes.close()
+
+	def test_batch(self):
+		data = encode_helo(800, 600) + encode_frame('.', 0, 10, 20) + \
+		       encode_frame('d', 0, 0, 0) + encode_frame('!', 1, 30, 40) + \
+		       encode_frame('d', 2, 0, 0) + encode_frame('u', 0, 0, 0)
+		# The HELO and the frames arrive cut at any byte
+		self.client.feed(data[:4])
+		self.client.feed(data[4:17])
+		self.assertEqual(self.client.resolution, (800, 600))
+		self.assertEqual(self.pipes.names, [('MTC Touchpoint 0', 800, 600),
+		                                    ('MTC Touchpoint 1', 800, 600)])
+		self.client.feed(data[17:])
+		self.assertEqual(self.pipes.records(0),
+		                 move(10, 20) + button(1) + button(0))
+		self.assertEqual(self.pipes.records(1),
+		                 move(30, 40) + button(1) + button(0))
+		# One write per device and batch: pointer 0 moved in both batches,
+		# pointer 1 in the second; pointer 2 has no device
+		self.assertEqual(self.client.stats()[:3], (4, 2, 3))
+		self.assertEqual([device.writes for device in self.client.devices],
+		                 [2, 1])
+
+	def test_invalid_helo(self):
+		self.assertRaises(ValueError, self.client.feed,
+		                  encode_frame('d', 0, 0, 0))
+
+	def test_buffer_grows(self):
+		read_end, write_end = os.pipe()
+		device = PointerDevice(write_end, 2)
+		device.stamp(12.5)
+		for step in xrange(10):
+			device.move(step, step)
+		device.flush()
+		fields = decode_events(os.read(read_end, 65536))
+		self.assertEqual(len(fields), 5*30)
+		self.assertEqual(fields[:5], (12, 500000, EV_ABS, ABS_X, 0))
+		self.assertEqual(fields[-8:-5], (EV_ABS, ABS_Y, 9))
+		self.assertEqual((device.writes, device.bytes),
+		                 (1, 30*INPUT_EVENT_SIZE))
+		os.close(read_end)
+		os.close(write_end)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ Reference receiver for the datagram transport of the vinput servers.
+ Prints every event received and, on exit, how many datagrams were lost.
+
+ Usage: udprecv.py udp://HOST:PORT       (subscribe to a unicast server)
+        udprecv.py --multicast=GROUP:PORT (join a multicast group)
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import sys
+
+from vinputserver.common import parse_addr
+from vinputserver.datagram import DatagramReceiver
+
+def main():
+	'''main program - receives and prints events until interrupted'''
+	if len(sys.argv) != 2:
+		print >> sys.stderr, __doc__.strip().split('\n\n')[1]
+		sys.exit(1)
+	arg = sys.argv[1]
+	multicast = arg.startswith('--multicast=')
+	if multicast:
+		arg = arg[12:]
+	try:
+		family, _, _, addr = parse_addr(arg)
+	except ValueError:
+		print >> sys.stderr, 'Invalid address "%s". Aborted.' % arg
+		sys.exit(1)
+	receiver = DatagramReceiver(addr, family, multicast)
+	try:
+		while True:
+			for opcode, pointer, xcoord, ycoord in receiver.receive():
+				print '%s %3i %5i %5i' % (opcode, pointer, xcoord, ycoord)
+	except KeyboardInterrupt:
+		pass
+	print >> sys.stderr, '%i datagrams received, %i lost, %i late' \
+	                     % (receiver.received, receiver.lost, receiver.late)
+	receiver.close()
+
+if __name__ == '__main__':
+	main()
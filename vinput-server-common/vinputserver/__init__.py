@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Shared server side of the vinput protocol.
+
+ This package contains the parts common to all vinput device servers
+ (libavg, mouse, ...): the socket fan-out to the clients and the helpers
+ around it. The device servers only produce events and hand them to a
+ ServerSocketThread.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+
+ License:
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
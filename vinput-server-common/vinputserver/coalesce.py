@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Latest-wins coalescing of pending motion events.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+# Pseudo opcodes of gesture frames queued among the events (see
+# vinputserver.gestures), with GESTURE_POINTER as pointer and the frame as
+# x: begin and end are kept like touches; a change describes the events
+# before it and is coalesced and dropped like motion
+GESTURE_OPCODE = '#G'
+GESTURE_CHANGE_OPCODE = '#g'
+GESTURE_POINTER = -1
+# Opcodes which only carry positions and may be coalesced or dropped
+MOTION_OPCODES = ('.', GESTURE_CHANGE_OPCODE)
+# Opcodes whose coordinates are not used by the clients
+POSITIONLESS_OPCODES = ('d', 'u')
+
+class MotionCoalescer(object):
+	'''
+	MotionCoalescer() -> list of pending (opcode, pointer, x, y) events.
+
+	A motion event replaces the pending motion event of the same pointer
+	(in its place) as long as no other event of that pointer came in between.
+	All other events ('d', 'u', 'D', 'U', ...) are kept in order, so only
+	outdated positions get lost. A gesture change replaces the pending one
+	behind all events queued since, which it describes as well.
+	'''
+
+	__slots__ = ('events', 'coalesced', '_motion')
+
+	def __init__(self):
+		self.events = []
+		# Number of events that were replaced by newer ones
+		self.coalesced = 0
+		# pointer -> index of its pending motion event in self.events
+		self._motion = {}
+
+	def __len__(self):
+		return len(self.events)
+
+	def add(self, event):
+		'''x.add((opcode, pointer, x, y)) - appends or coalesces an event'''
+		pointer = event[1]
+		if event[0] in MOTION_OPCODES:
+			index = self._motion.get(pointer)
+			if index is not None:
+				self.coalesced += 1
+				if event[0] != GESTURE_CHANGE_OPCODE or \
+				   index == len(self.events) - 1:
+					self.events[index] = event
+					return
+				del self.events[index]
+				motion = self._motion
+				for key, position in motion.items():
+					if position > index:
+						motion[key] = position - 1
+			self._motion[pointer] = len(self.events)
+		elif pointer in self._motion:
+			del self._motion[pointer]
+		self.events.append(event)
+
+	def extend(self, events):
+		'''x.extend(events) - adds several events in order'''
+		add = self.add
+		for event in events:
+			add(event)
+
+	def drop_motion(self):
+		'''
+		x.drop_motion() -> number of removed events
+		Removes all pending motion events except those giving the position
+		of a following 'd' or 'u' (which carry no valid coordinates).
+		'''
+		events = []
+		needs_position = set()
+		for event in reversed(self.events):
+			opcode, pointer = event[0], event[1]
+			if opcode in MOTION_OPCODES:
+				if pointer not in needs_position:
+					continue
+				needs_position.remove(pointer)
+			elif opcode in POSITIONLESS_OPCODES:
+				needs_position.add(pointer)
+			else:
+				needs_position.discard(pointer)
+			events.append(event)
+		events.reverse()
+		dropped = len(self.events) - len(events)
+		self.events = events
+		self._motion.clear()
+		return dropped
+
+	def take_urgent(self):
+		'''
+		x.take_urgent() -> list of pending events
+		Takes the pending events up to the last one that is no motion event;
+		the motion events after it stay pending.
+		'''
+		events = self.events
+		for index in xrange(len(events) - 1, -1, -1):
+			if events[index][0] not in MOTION_OPCODES:
+				break
+		else:
+			return []
+		self.events = events[index+1:]
+		# Only the newest motion of each pointer is left
+		self._motion = dict([(event[1], position) for position, event
+		                     in enumerate(self.events)])
+		return events[:index+1]
+
+	def take(self):
+		'''x.take() -> list of all pending events; empties x'''
+		events = self.events
+		self.events = []
+		self._motion.clear()
+		return events
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Small helpers shared by the vinput device servers.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import sys, time, ctypes
+from socket import AF_INET6 as _AF_INET6, AF_INET as _AF_INET, \
+                   AF_UNIX as _AF_UNIX, SOCK_STREAM as _SOCK_STREAM, \
+                   SOCK_DGRAM as _SOCK_DGRAM
+
+# Set to True by the servers' -d/--debug switch
+DEBUG = False
+
+# Pseudo address family parse_addr returns for shared memory ring buffers
+SHM_FAMILY = 'shm'
+
+class _Timespec(ctypes.Structure):
+	_fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+_CLOCK_MONOTONIC = 1
+
+def _load_clock_gettime():
+	'''Returns libc's clock_gettime function or None'''
+	try:
+		clock_gettime = ctypes.CDLL(None, use_errno=True).clock_gettime
+	except (OSError, AttributeError):
+		return None
+	clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+	clock_gettime.restype = ctypes.c_int
+	return clock_gettime
+
+_clock_gettime = _load_clock_gettime()
+
+def monotonic():
+	'''
+	monotonic() -> seconds
+	Returns the time of a clock that never jumps (falls back to time.time()
+	where CLOCK_MONOTONIC is unavailable).
+	'''
+	if _clock_gettime is not None:
+		ts = _Timespec()
+		if _clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(ts)) == 0:
+			return ts.tv_sec + ts.tv_nsec*1e-9
+	return time.time()
+
+def i2s(integer, bytelength=None):
+	'''Converts an integer into a big-endian byte string'''
+	result = []
+	while integer > 0:
+		result.append(chr(integer%256))
+		integer = integer//256
+	if bytelength is not None:
+		if len(result) > bytelength:
+			raise OverflowError, 'Given number is too big for %i bytes.' % bytelength
+		for _ in range(len(result), bytelength):
+			result.append(chr(0))
+	result.reverse()
+	return ''.join(result)
+
+def debug_output(*args):
+	'''Prints debugging output to stderr if DEBUG is True'''
+	if DEBUG and len(args) > 0:
+		for arg in args[:-1]:
+			print >> sys.stderr, arg,
+		print >> sys.stderr, args[-1]
+
+def parse_addr(string):
+	'''
+	parses a listen address string into all needed socket parameters
+	
+	An optional "tcp://" or "udp://" prefix selects the socket type; the
+	default is TCP. "shm:NAME" selects a shared memory ring buffer, for
+	which the family is SHM_FAMILY and the address is NAME.
+	'''
+	result = None
+	sock_type = _SOCK_STREAM
+	if string.startswith('shm:'):
+		if not string[4:] or '/' in string[4:]:
+			raise ValueError, 'invalid ring buffer name'
+		return (SHM_FAMILY, None, 0, string[4:])
+	if string.startswith('udp://'):
+		sock_type = _SOCK_DGRAM
+		string = string[6:]
+	elif string.startswith('tcp://'):
+		string = string[6:]
+	if string.isdigit():
+		result = (_AF_INET6, sock_type, 0, ('::', int(string)))
+	elif string.startswith('unix:'):
+		if string.startswith('unix::'):
+			result = (_AF_UNIX, sock_type, 0, '\0'+string[6:])
+		else:
+			result = (_AF_UNIX, sock_type, 0, string[5:])
+	elif '.' in string:
+		addr, port = string.rsplit(':', 1)
+		port = int(port)
+		result = (_AF_INET, sock_type, 0, (addr, port))
+	elif string.startswith('['):
+		addr, port = string.rsplit(']:', 1)
+		port = int(port)
+		addr = addr[1:]
+		if '%' in addr:
+			addr, scopeid = addr.rsplit('%', 1)
+			result = (_AF_INET6, sock_type, 0, (addr, port, 0, scopeid))
+		else:
+			result = (_AF_INET6, sock_type, 0, (addr, port))
+	else:
+		# By default assume IPv6 addresses
+		addr, port = string.rsplit(':', 1)
+		port = int(port)
+		if '%' in addr:
+			addr, scopeid = addr.rsplit('%', 1)
+			result = (_AF_INET6, sock_type, 0, (addr, port, 0, scopeid))
+		else:
+			result = (_AF_INET6, sock_type, 0, (addr, port))
+	return result
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Mapping of the touch ids of an input source onto vinput pointer numbers.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import time
+from heapq import heappush, heappop
+
+# The pointer number is a single byte on the wire
+MAX_CURSORCOUNT = 256
+
+class CursorIdAllocator(object):
+	'''
+	CursorIdAllocator(cursorcount, [timeout]) -> maps touch ids onto the
+	pointer numbers 0 .. cursorcount-1, always handing out the smallest free
+	number.
+
+	 cursorcount: number of pointers (at most MAX_CURSORCOUNT)
+	 timeout: seconds after which a touch that has not been seen any more
+	          counts as lost and its pointer number may be reclaimed
+	          (0 or None: never)
+
+	acquire() and release() are O(log n) through a min-heap of the free
+	numbers.
+	'''
+
+	def __init__(self, cursorcount, timeout=None):
+		if not 0 < cursorcount <= MAX_CURSORCOUNT:
+			raise ValueError, 'cursorcount must be between 1 and %i' \
+			                  % MAX_CURSORCOUNT
+		self.cursorcount = cursorcount
+		self.timeout = timeout
+		# range() is sorted and thus already a valid heap
+		self._free = range(cursorcount)
+		# touch id -> pointer number
+		self._mappings = {}
+		# touch id -> time the touch was last seen
+		self._last_seen = {}
+		# Number of touches that got no pointer number because all were in use
+		self.exhausted = 0
+
+	def __len__(self):
+		'''Returns the number of pointer numbers in use'''
+		return len(self._mappings)
+
+	def lookup(self, touchid):
+		'''
+		x.lookup(touchid) -> pointer number or None
+		Returns the pointer number of a touch and marks it as seen.
+		'''
+		myid = self._mappings.get(touchid)
+		if myid is not None and self.timeout:
+			self._last_seen[touchid] = time.time()
+		return myid
+
+	def acquire(self, touchid):
+		'''
+		x.acquire(touchid) -> (pointer number, reclaimed)
+		Assigns the smallest free pointer number to a new touch. The number
+		is None if all are in use. reclaimed is the list of (touch id,
+		pointer number) pairs which had to be taken from lost touches.
+		'''
+		myid = self.lookup(touchid)
+		if myid is not None:
+			return myid, []
+		reclaimed = []
+		if not self._free:
+			reclaimed = self.reclaim()
+			if not self._free:
+				self.exhausted += 1
+				return None, reclaimed
+		myid = heappop(self._free)
+		self._mappings[touchid] = myid
+		if self.timeout:
+			self._last_seen[touchid] = time.time()
+		return myid, reclaimed
+
+	def release(self, touchid):
+		'''
+		x.release(touchid) -> pointer number or None
+		Frees the pointer number of an ended touch.
+		'''
+		myid = self._mappings.pop(touchid, None)
+		if myid is not None:
+			self._last_seen.pop(touchid, None)
+			heappush(self._free, myid)
+		return myid
+
+	def reclaim(self, now=None):
+		'''
+		x.reclaim([now]) -> list of (touch id, pointer number)
+		Frees the pointer numbers of all touches not seen for longer than
+		the timeout. The caller should send a release for them.
+		'''
+		if not self.timeout:
+			return []
+		if now is None:
+			now = time.time()
+		limit = now - self.timeout
+		lost = [touchid for touchid, seen in self._last_seen.iteritems()
+		        if seen < limit]
+		return [(touchid, self.release(touchid)) for touchid in lost]
@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+
+"""
+ UDP unicast and multicast transport for vinput events.
+
+ Every batch of events is sent once as a datagram with a sequence number
+ (once to the multicast group, or once to each subscribed receiver). Lost
+ datagrams are never retransmitted; instead a keyframe with the full state
+ of every pointer is sent periodically, so a receiver that missed a touch
+ or release is back in sync at the next keyframe and motion never stalls.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import errno, select, socket, struct, time
+
+from vinputserver.common import debug_output
+from vinputserver.protocol import FrameEncoder, encode_datagram_header, \
+                                  decode_datagram, SUBSCRIBE_MAGIC, \
+                                  DATAGRAM_KEYFRAME, MAX_DATAGRAM_FRAMES, \
+                                  MAX_DATAGRAM_SIZE
+from vinputserver.server import OutputThread, FLUSH_FRAME, DEF_MAX_BATCH_AGE
+
+########## Defaults ##########
+
+# Milliseconds between two keyframes
+DEF_KEYFRAME_INTERVAL = 1000
+# Hop limit of multicast datagrams
+DEF_MULTICAST_TTL = 1
+
+##############################
+
+# Seconds a unicast receiver stays subscribed without renewing
+SUBSCRIPTION_TIMEOUT = 10.0
+# Seconds between two subscriptions of a receiver
+SUBSCRIBE_INTERVAL = 2.0
+
+_POLLIN = select.POLLIN | select.POLLPRI
+
+def update_state(state, events):
+	'''
+	update_state(state, events)
+	Applies events to a dict mapping pointer numbers to [pressed, x, y].
+	'''
+	for opcode, pointer, xcoord, ycoord in events:
+		entry = state.get(pointer)
+		if entry is None:
+			entry = state[pointer] = [False, 0, 0]
+		if opcode in ('.', 'D', 'U', '!'):
+			entry[1], entry[2] = xcoord, ycoord
+		if opcode in ('d', 'D'):
+			entry[0] = True
+		elif opcode in ('u', 'U', '!'):
+			entry[0] = False
+
+def keyframe_events(state):
+	'''Returns the frames describing a pointer state as 'D'/'U' events'''
+	return [('D' if pressed else 'U', pointer, xcoord, ycoord)
+	        for pointer, (pressed, xcoord, ycoord) in sorted(state.items())]
+
+def _any_address(family):
+	'''Returns the wildcard address of an address family'''
+	return '::' if family == socket.AF_INET6 else ''
+
+class DatagramThread(OutputThread):
+	"""
+	DatagramThread(announce_resolution, sock_addr, sock_family,
+	               [multicast_group], [keyframe_interval], [flush_mode],
+	               [max_batch_age]) -> a Thread object sending the vinput
+	events as datagrams.
+
+	 announce_resolution: resolution/range of the used coordinates; sent in
+	                      every datagram header
+	 sock_addr: address to bind to; receivers send their subscriptions
+	            there (None: any address and port)
+	 sock_family: address family as defined in the socket module
+	 multicast_group: address (host, port) of a multicast group; if given,
+	                  every datagram is sent once to that group instead of
+	                  to the subscribed receivers
+	 keyframe_interval: milliseconds between two keyframes
+	 flush_mode, max_batch_age: see OutputThread
+	"""
+
+	def __init__(self, announce_resolution, sock_addr, sock_family,
+	             multicast_group=None, keyframe_interval=DEF_KEYFRAME_INTERVAL,
+	             flush_mode=FLUSH_FRAME, max_batch_age=DEF_MAX_BATCH_AGE):
+		"""
+		constructor - initializes x
+		"""
+		super(DatagramThread, self).__init__("Datagram Loop", flush_mode,
+		                                     max_batch_age)
+		self.resolution = announce_resolution
+		self.address = sock_addr
+		self.family = sock_family
+		self.multicast_group = multicast_group
+		self.keyframe_interval = keyframe_interval
+		self._sock = None
+		self._encoder = FrameEncoder(MAX_DATAGRAM_FRAMES)
+		# Unicast receivers: address -> time of the last subscription
+		self._subscribers = {}
+		# pointer -> [pressed, x, y] as sent so far
+		self._state = {}
+		self._seq = 0
+		self._next_keyframe = 0
+		self.datagrams = 0
+		self.send_errors = 0
+		self._expired = 0
+		# destination address -> [frames, bytes] sent to it
+		self._sent = {}
+
+	def run(self):
+		"""
+		Contains the thread main loop - sends the queued events and the
+		keyframes and handles subscriptions
+		NOTE: use x.start() to run the thread. x.run() is used internally.
+		"""
+		self._sock = sock = socket.socket(self.family, socket.SOCK_DGRAM)
+		if self.multicast_group is not None:
+			if self.family == socket.AF_INET6:
+				sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_MULTICAST_HOPS,
+				                DEF_MULTICAST_TTL)
+				sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_MULTICAST_LOOP, 1)
+			else:
+				sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL,
+				                DEF_MULTICAST_TTL)
+				sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+		if self.address is not None:
+			debug_output('opening datagram socket on %r' % (self.address,))
+			sock.bind(self.address)
+		sock.setblocking(False)
+		poller = select.poll()
+		poller.register(self._wakeup_r, _POLLIN)
+		poller.register(sock.fileno(), _POLLIN)
+		debug_output('starting datagram loop')
+		while self._running:
+			timeout = None
+			if self.keyframe_interval:
+				timeout = max(0, int((self._next_keyframe - time.time())*1000))
+			try:
+				ready = poller.poll(timeout)
+			except select.error, e:
+				if e.args[0] == errno.EINTR:
+					continue
+				raise
+			for fd, mask in ready:
+				if fd == self._wakeup_r:
+					self._drain_wakeup()
+				else:
+					self._read()
+			events = self._take_events()
+			if events:
+				update_state(self._state, events)
+				self._send_datagrams(events, 0)
+				self._record_write(self._taken_captured)
+			if self.keyframe_interval and time.time() >= self._next_keyframe:
+				self._next_keyframe = time.time() + self.keyframe_interval/1000.0
+				self._send_datagrams(keyframe_events(self._state),
+				                     DATAGRAM_KEYFRAME)
+
+	def _read(self):
+		'''Handles the subscriptions of unicast receivers'''
+		while True:
+			try:
+				data, addr = self._sock.recvfrom(64)
+			except socket.error, e:
+				if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+					return
+				if e.args[0] == errno.ECONNREFUSED:
+					# ICMP error caused by an earlier datagram
+					continue
+				raise
+			if data.startswith(SUBSCRIBE_MAGIC):
+				if addr not in self._subscribers:
+					debug_output('receiver subscribed: %r' % (addr,))
+					self.accepts += 1
+					# Give the new receiver the current state right away
+					self._next_keyframe = 0
+				self._subscribers[addr] = time.time()
+
+	def _destinations(self):
+		'''Returns the addresses every datagram has to be sent to'''
+		if self.multicast_group is not None:
+			return [self.multicast_group]
+		limit = time.time() - SUBSCRIPTION_TIMEOUT
+		for addr, seen in self._subscribers.items():
+			if seen < limit:
+				debug_output('receiver subscription expired: %r' % (addr,))
+				del self._subscribers[addr]
+				self._sent.pop(addr, None)
+				self._expired += 1
+		return self._subscribers.keys()
+
+	def _send_datagrams(self, events, flags):
+		'''Sends events in as few datagrams as possible'''
+		destinations = self._destinations()
+		if not destinations:
+			return
+		width, height = self.resolution
+		start = 0
+		while True:
+			chunk = events[start:start+MAX_DATAGRAM_FRAMES]
+			datagram = encode_datagram_header(self._seq, flags, width, height) \
+			           + self._encoder.encode(chunk).tobytes()
+			self._seq = (self._seq + 1) & 0xffffffff
+			for addr in destinations:
+				try:
+					self._sock.sendto(datagram, addr)
+					self.datagrams += 1
+					sent = self._sent.get(addr)
+					if sent is None:
+						sent = self._sent[addr] = [0, 0]
+					sent[0] += len(chunk)
+					sent[1] += len(datagram)
+				except socket.error:
+					# Datagrams may get lost anyway, the next keyframe repairs it
+					self.send_errors += 1
+			start += MAX_DATAGRAM_FRAMES
+			if start >= len(events):
+				break
+
+	def close_clients(self):
+		'''
+		x.close_clients()
+		Forgets all subscribed receivers.
+		'''
+		self._subscribers.clear()
+
+	def close(self):
+		'''
+		x.close()
+		Stops the thread and closes the socket.
+		'''
+		self._stop()
+		if self._sock is not None:
+			self._sock.close()
+			self._sock = None
+
+	def client_stats(self):
+		'''
+		x.client_stats() -> list of (name, frames, bytes, backlog)
+		See OutputThread.client_stats(); the multicast group counts as one
+		client and nothing is ever kept back.
+		'''
+		return [('[%s]:%s' % addr[:2] if isinstance(addr, tuple)
+		         else addr.replace('\0', '@') or 'unix', frames, size, 0)
+		        for addr, (frames, size) in self._sent.items()]
+
+	def disconnect_counts(self):
+		'''
+		x.disconnect_counts() -> dict
+		Returns the number of receiver subscriptions that expired.
+		'''
+		return {'expired': self._expired}
+
+	def counters(self):
+		'''
+		x.counters() -> dict
+		Returns the same counters as ServerSocketThread.counters(); datagrams
+		that could not be sent count as dropped.
+		'''
+		return {'coalesced': 0, 'dropped': self.send_errors}
+
+class DatagramReceiver(object):
+	'''
+	DatagramReceiver(sock_addr, sock_family, [multicast]) -> reference
+	receiver for DatagramThread.
+
+	 sock_addr: address of the server, which the receiver subscribes to, or
+	            in multicast mode the (group, port) to join
+	 sock_family: address family as defined in the socket module
+
+	receive() returns the events to apply, keyframes already turned into
+	the events needed to reach the announced state. lost counts the
+	datagrams missing in the sequence, late those which came too late
+	and were ignored.
+	'''
+
+	def __init__(self, sock_addr, sock_family, multicast=False):
+		self.address = sock_addr
+		self.multicast = multicast
+		self.resolution = None
+		# pointer -> [pressed, x, y] as applied so far
+		self.state = {}
+		self.received = self.lost = self.late = 0
+		self._expected = None
+		self._next_subscribe = 0
+		self._sock = sock = socket.socket(sock_family, socket.SOCK_DGRAM)
+		if multicast:
+			group, port = sock_addr[0], sock_addr[1]
+			sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+			sock.bind((_any_address(sock_family), port))
+			if sock_family == socket.AF_INET6:
+				mreq = socket.inet_pton(socket.AF_INET6, group) + \
+				       struct.pack('@I', 0)
+				sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_JOIN_GROUP, mreq)
+			else:
+				mreq = socket.inet_aton(group) + \
+				       struct.pack('=I', socket.INADDR_ANY)
+				sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+		else:
+			sock.bind((_any_address(sock_family), 0))
+
+	def fileno(self):
+		return self._sock.fileno()
+
+	def close(self):
+		self._sock.close()
+
+	def subscribe(self):
+		'''Subscribes at the server if it is time to (unicast only)'''
+		if not self.multicast and time.time() >= self._next_subscribe:
+			self._next_subscribe = time.time() + SUBSCRIBE_INTERVAL
+			self._sock.sendto(SUBSCRIBE_MAGIC, self.address)
+
+	def receive(self, timeout=None):
+		'''
+		x.receive([timeout]) -> list of (opcode, pointer, x, y)
+		Waits for the next datagram (at most timeout seconds) and returns its
+		events; the list is empty on timeout.
+		'''
+		self.subscribe()
+		if timeout is None:
+			timeout = SUBSCRIBE_INTERVAL
+		ready = select.select([self._sock], [], [], timeout)[0]
+		if not ready:
+			return []
+		data = self._sock.recv(MAX_DATAGRAM_SIZE)
+		try:
+			return self.handle(data)
+		except ValueError, e:
+			debug_output('ignoring invalid datagram: %s' % e)
+			return []
+
+	def handle(self, data):
+		'''
+		x.handle(data) -> list of (opcode, pointer, x, y)
+		Processes one datagram.
+		'''
+		seq, flags, resolution, frames = decode_datagram(data)
+		self.received += 1
+		self.resolution = resolution
+		if self._expected is not None:
+			gap = (seq - self._expected) & 0xffffffff
+			if gap >= 0x80000000:
+				# Older than what we already have
+				self.late += 1
+				return []
+			self.lost += gap
+		self._expected = (seq + 1) & 0xffffffff
+		if not flags & DATAGRAM_KEYFRAME:
+			update_state(self.state, frames)
+			return frames
+		# Only generate what differs from the state applied so far
+		events = []
+		for opcode, pointer, xcoord, ycoord in frames:
+			entry = self.state.get(pointer)
+			if entry is None or entry[0] != (opcode == 'D'):
+				events.append((opcode, pointer, xcoord, ycoord))
+			elif entry[1] != xcoord or entry[2] != ycoord:
+				events.append(('.', pointer, xcoord, ycoord))
+		update_state(self.state, events)
+		return events
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Headless input source reading touches from a Linux evdev device.
+
+ EvdevSource reads the struct input_event records of a touch screen or
+ touch pad (/dev/input/eventN) - or of any file or pipe carrying the same
+ records - in large chunks and decodes each chunk with one struct call.
+ MultitouchDecoder follows the multitouch protocol B (ABS_MT_SLOT,
+ ABS_MT_TRACKING_ID, ABS_MT_POSITION_X/Y) and, for devices without it,
+ single touch (ABS_X/Y, BTN_TOUCH). At every SYN_REPORT it hands the
+ touches that began, moved or ended to a TouchSender, which maps them
+ onto pointer numbers and sends them, and ends the frame; no render loop
+ is involved.
+
+ With a real device, the coordinates are scaled from the ranges the
+ device reports to the output resolution and the kernel's timestamps of
+ the reports are the capture times of the latency measurement.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import os, errno, fcntl, select, struct
+
+from vinputserver.common import debug_output
+from vinputserver.tracebuf import trace_point
+from vinputserver.uinput import EV_SYN, EV_KEY, EV_ABS, SYN_REPORT, ABS_X, \
+                                ABS_Y, BTN_TOUCH, INPUT_EVENT_SIZE
+
+# Records read from the device at once
+DEF_READ_EVENTS = 512
+
+# From linux/input.h
+SYN_DROPPED = 3
+ABS_MT_SLOT = 0x2f
+ABS_MT_POSITION_X = 0x35
+ABS_MT_POSITION_Y = 0x36
+ABS_MT_TRACKING_ID = 0x39
+
+# struct input_absinfo: value, minimum, maximum, fuzz, flat, resolution
+_ABSINFO = struct.Struct('@6i')
+
+def _ioc(direction, number, size):
+	'''Returns the request number of an evdev ioctl'''
+	return direction << 30 | size << 16 | ord('E') << 8 | number
+
+EVIOCGRAB = _ioc(1, 0x90, 4)
+
+def EVIOCGABS(code):
+	'''Returns the request number reading the input_absinfo of an axis'''
+	return _ioc(2, 0x40 + code, _ABSINFO.size)
+
+TRACE_REPORT = trace_point('evdev', 'report %i: %i touches changed')
+
+# The field layout of struct input_event, repeated for a whole chunk
+_RECORD_FORMAT = 'llHHi'
+_structs = {}
+
+def decode_events(data):
+	'''
+	decode_events(data) -> flat tuple
+	Decodes all complete input_event records of data at once; every record
+	gives five fields: seconds, microseconds, type, code, value.
+	'''
+	count = len(data)//INPUT_EVENT_SIZE
+	decoder = _structs.get(count)
+	if decoder is None:
+		decoder = _structs[count] = struct.Struct('@' + _RECORD_FORMAT*count)
+	return decoder.unpack_from(data)
+
+def axis_ranges(fd):
+	'''
+	axis_ranges(fd) -> ((xmin, xmax), (ymin, ymax)) or None
+	Returns the ranges of the touch coordinates of an evdev device, the
+	multitouch axes if it has them; None if fd is no evdev device.
+	'''
+	for xaxis, yaxis in ((ABS_MT_POSITION_X, ABS_MT_POSITION_Y),
+	                     (ABS_X, ABS_Y)):
+		try:
+			xinfo = _ABSINFO.unpack(fcntl.ioctl(fd, EVIOCGABS(xaxis),
+			                                    '\0'*_ABSINFO.size))
+			yinfo = _ABSINFO.unpack(fcntl.ioctl(fd, EVIOCGABS(yaxis),
+			                                    '\0'*_ABSINFO.size))
+		except IOError:
+			continue
+		if xinfo[2] > xinfo[1] and yinfo[2] > yinfo[1]:
+			return (xinfo[1], xinfo[2]), (yinfo[1], yinfo[2])
+	return None
+
+class MultitouchDecoder(object):
+	'''
+	MultitouchDecoder(touches, [ranges], [resolution], [event_time])
+	-> turns input_event records into the calls of a TouchSender.
+
+	 touches: TouchSender (vinputserver.touches)
+	 ranges: ((xmin, xmax), (ymin, ymax)) of the device coordinates, which
+	         are scaled to resolution; None passes them on unchanged
+	 event_time: use the timestamps of the records as capture time for the
+	             latency measurement and as time of the frames
+
+	The tracking ids of the device are the touch ids.
+	'''
+
+	# Slot number of the touch of single touch devices
+	SINGLE = -1
+
+	def __init__(self, touches, ranges=None, resolution=None,
+	             event_time=False):
+		self.touches = touches
+		self.event_time = event_time
+		self._scale = None
+		if ranges is not None and resolution is not None:
+			(xmin, xmax), (ymin, ymax) = ranges
+			self._scale = (xmin, resolution[0]/float(xmax - xmin + 1),
+			               ymin, resolution[1]/float(ymax - ymin + 1))
+		# slot -> [tracking id or None, x, y]: the state of the last report;
+		# a slot keeps the position of its last touch, which the device
+		# does not send again if the next one begins there
+		self._slots = {}
+		# slot -> [tracking id or None, x, y]: changes since the last report
+		self._changed = {}
+		self._slot = 0
+		# Records are ignored from a SYN_DROPPED to the next SYN_REPORT
+		self._dropping = False
+		# Set once the device sent multitouch records
+		self._multitouch = False
+		self.reports = 0
+		self.dropped = 0
+
+	def _change(self, slot):
+		'''Returns the pending state of a slot, starting from the last one'''
+		state = self._changed.get(slot)
+		if state is None:
+			state = self._changed[slot] = list(self._slots.get(slot,
+			                                                   (None, 0, 0)))
+		return state
+
+	def feed(self, fields):
+		'''Processes the records decoded by decode_events()'''
+		for index in xrange(0, len(fields), 5):
+			type_, code, value = fields[index+2:index+5]
+			if type_ == EV_ABS:
+				if self._dropping:
+					continue
+				if code == ABS_MT_SLOT:
+					self._slot = value
+				elif code == ABS_MT_POSITION_X:
+					self._change(self._slot)[1] = value
+				elif code == ABS_MT_POSITION_Y:
+					self._change(self._slot)[2] = value
+				elif code == ABS_MT_TRACKING_ID:
+					self._multitouch = True
+					self._change(self._slot)[0] = value if value >= 0 else None
+				elif not self._multitouch:
+					if code == ABS_X:
+						self._change(self.SINGLE)[1] = value
+					elif code == ABS_Y:
+						self._change(self.SINGLE)[2] = value
+			elif type_ == EV_KEY:
+				if code == BTN_TOUCH and not self._multitouch and \
+				   not self._dropping:
+					# Single touch: one touch id per contact
+					self._change(self.SINGLE)[0] = \
+						self.reports if value else None
+			elif type_ == EV_SYN:
+				if code == SYN_REPORT:
+					if self._dropping:
+						self._dropping = False
+						self._changed.clear()
+					else:
+						self._report(fields[index] + fields[index+1]*1e-6)
+				elif code == SYN_DROPPED:
+					# The kernel's buffer overflowed: the records up to the
+					# next report are incomplete
+					self._dropping = True
+					self.dropped += 1
+
+	def _report(self, when):
+		'''Hands the touches changed in a report to the TouchSender'''
+		self.reports += 1
+		changed = self._changed
+		if not changed:
+			return
+		touches = self.touches
+		server = touches.server
+		if server.latency is not None:
+			server.latency.capture(when if self.event_time else None)
+		if server.tracer is not None:
+			server.tracer.trace(TRACE_REPORT, self.reports, len(changed))
+		scale = self._scale
+		for slot, state in changed.iteritems():
+			touchid, xcoord, ycoord = state
+			if scale is not None:
+				xcoord = int((xcoord - scale[0])*scale[1])
+				ycoord = int((ycoord - scale[2])*scale[3])
+			last = self._slots.get(slot)
+			lastid = last[0] if last is not None else None
+			if lastid is not None and lastid != touchid:
+				# Ended, or replaced by a new contact in the same slot
+				touches.up(lastid, xcoord, ycoord)
+			self._slots[slot] = state
+			if touchid is None:
+				continue
+			if touchid != lastid:
+				touches.down(touchid, xcoord, ycoord)
+			else:
+				touches.motion(touchid, xcoord, ycoord)
+		changed.clear()
+		touches.frame(when if self.event_time else None)
+
+class EvdevSource(object):
+	'''
+	EvdevSource(fd, touches, [resolution], [grab], [read_events])
+	-> reads the touches of an evdev device, or of a file or pipe with its
+	records, and sends them through a TouchSender.
+
+	 fd: file descriptor to read from
+	 touches: TouchSender (vinputserver.touches)
+	 resolution: output resolution the device coordinates are scaled to
+	             (ignored for files and pipes)
+	 grab: take the device exclusively, so the desktop does not also use it
+	 read_events: records read at once
+
+	run() reads until the end of the file, an unplugged device or stop().
+	'''
+
+	def __init__(self, fd, touches, resolution=None, grab=False,
+	             read_events=DEF_READ_EVENTS):
+		self.fd = fd
+		self.read_size = read_events*INPUT_EVENT_SIZE
+		ranges = axis_ranges(fd)
+		if ranges is not None:
+			debug_output('device ranges %r' % (ranges,))
+			if grab:
+				fcntl.ioctl(fd, EVIOCGRAB, 1)
+		self.decoder = MultitouchDecoder(touches, ranges, resolution,
+		                                 event_time=ranges is not None)
+		self.records = 0
+		self.reads = 0
+		self._running = True
+
+	def run(self):
+		'''Reads and processes records until the input ends or stop()'''
+		poller = select.poll()
+		poller.register(self.fd, select.POLLIN | select.POLLPRI)
+		rest = ''
+		while self._running:
+			try:
+				if not poller.poll(1000):
+					continue
+				data = os.read(self.fd, self.read_size)
+			except (OSError, select.error), e:
+				if e.args[0] in (errno.EINTR, errno.EAGAIN):
+					continue
+				if e.args[0] == errno.ENODEV:
+					debug_output('input device is gone')
+					return
+				raise
+			if not data:
+				return
+			self.reads += 1
+			if rest:
+				data = rest + data
+			end = len(data) - len(data) % INPUT_EVENT_SIZE
+			# Pipes may cut a record
+			rest = data[end:]
+			fields = decode_events(data)
+			self.records += len(fields)//5
+			self.decoder.feed(fields)
+
+	def stop(self):
+		'''Makes run() return within a second'''
+		self._running = False
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Filtering and prediction of pointer motion.
+
+ Camera tracking delivers jittery positions that lag behind the finger.
+ A filter stage sits between the touch handler and the output thread (see
+ TouchSender): every position of a pointer goes through filter(), down()
+ and up() reset the pointer's state, so no touch inherits the motion of
+ the previous one. Nothing is buffered; each event leaves at once.
+
+  OneEuroFilter:      adaptive low-pass filter (Casiez et al., CHI 2012):
+                      smooths strongly at low speed, hardly at high speed
+  VelocityPredictor:  extrapolates the position by a look-ahead time with
+                      a constant-velocity model
+  FilterChain:        applies several filters in order
+
+ parse_filters() builds the stage from the --filter option of the
+ servers, e.g. "one-euro,predict:20".
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import math
+
+########## Defaults ##########
+
+# One-Euro: cutoff frequency at rest (Hz) and speed coefficient
+DEF_MIN_CUTOFF = 1.0
+DEF_BETA = 0.007
+# Cutoff frequency of the speed estimate (Hz)
+DEF_DERIVATE_CUTOFF = 1.0
+# Look-ahead of the predictor (milliseconds)
+DEF_LOOKAHEAD = 16
+# Smoothing factor of the predictor's velocity estimate (0..1, 1: none)
+DEF_VELOCITY_SMOOTHING = 0.5
+
+##############################
+
+# Shortest time step taken into account (seconds); events closer together
+# are treated as this far apart
+_MIN_DT = 1e-4
+
+def _alpha(cutoff, dt):
+	'''Returns the smoothing factor of a low-pass filter for a time step'''
+	tau = 1.0/(2*math.pi*cutoff)
+	return 1.0/(1.0 + tau/dt)
+
+class OneEuroFilter(object):
+	'''
+	OneEuroFilter([min_cutoff], [beta], [d_cutoff]) -> One-Euro filter of
+	the positions of every pointer.
+
+	 min_cutoff: cutoff frequency (Hz) at rest; lower means less jitter
+	 beta: how fast the cutoff rises with speed; higher means less lag
+	 d_cutoff: cutoff frequency (Hz) of the speed estimate
+	'''
+
+	def __init__(self, min_cutoff=DEF_MIN_CUTOFF, beta=DEF_BETA,
+	             d_cutoff=DEF_DERIVATE_CUTOFF):
+		if min_cutoff <= 0 or d_cutoff <= 0 or beta < 0:
+			raise ValueError, 'invalid One-Euro parameters'
+		self.min_cutoff = min_cutoff
+		self.beta = beta
+		self.d_cutoff = d_cutoff
+		# pointer -> [time, x, y, dx, dy]
+		self._state = {}
+
+	def down(self, pointer, xcoord, ycoord, now):
+		'''Starts a new touch; returns its position unchanged'''
+		self._state[pointer] = [now, float(xcoord), float(ycoord), 0.0, 0.0]
+		return xcoord, ycoord
+
+	def filter(self, pointer, xcoord, ycoord, now):
+		'''x.filter(pointer, xcoord, ycoord, now) -> filtered (x, y)'''
+		state = self._state.get(pointer)
+		if state is None:
+			return self.down(pointer, xcoord, ycoord, now)
+		last, lastx, lasty, dx, dy = state
+		dt = max(now - last, _MIN_DT)
+		# Low-pass the speed, then derive the cutoff from it
+		alpha = _alpha(self.d_cutoff, dt)
+		dx += alpha*((xcoord - lastx)/dt - dx)
+		dy += alpha*((ycoord - lasty)/dt - dy)
+		cutoff = self.min_cutoff + self.beta*math.sqrt(dx*dx + dy*dy)
+		alpha = _alpha(cutoff, dt)
+		lastx += alpha*(xcoord - lastx)
+		lasty += alpha*(ycoord - lasty)
+		state[:] = now, lastx, lasty, dx, dy
+		return lastx, lasty
+
+	def up(self, pointer):
+		'''Ends a touch and forgets its state'''
+		self._state.pop(pointer, None)
+
+class VelocityPredictor(object):
+	'''
+	VelocityPredictor([lookahead], [smoothing]) -> predicts where every
+	pointer will be lookahead milliseconds later, assuming it keeps its
+	velocity.
+
+	 smoothing: weight of the newest velocity sample (0..1); lower values
+	            steady the prediction at the cost of reacting later
+	'''
+
+	def __init__(self, lookahead=DEF_LOOKAHEAD,
+	             smoothing=DEF_VELOCITY_SMOOTHING):
+		if lookahead < 0 or not 0 < smoothing <= 1:
+			raise ValueError, 'invalid predictor parameters'
+		self.lookahead = lookahead/1000.0
+		self.smoothing = smoothing
+		# pointer -> [time, x, y, vx, vy]
+		self._state = {}
+
+	def down(self, pointer, xcoord, ycoord, now):
+		'''Starts a new touch; returns its position unchanged'''
+		self._state[pointer] = [now, xcoord, ycoord, 0.0, 0.0]
+		return xcoord, ycoord
+
+	def filter(self, pointer, xcoord, ycoord, now):
+		'''x.filter(pointer, xcoord, ycoord, now) -> predicted (x, y)'''
+		state = self._state.get(pointer)
+		if state is None:
+			return self.down(pointer, xcoord, ycoord, now)
+		last, lastx, lasty, vx, vy = state
+		dt = max(now - last, _MIN_DT)
+		smoothing = self.smoothing
+		vx += smoothing*((xcoord - lastx)/dt - vx)
+		vy += smoothing*((ycoord - lasty)/dt - vy)
+		state[:] = now, xcoord, ycoord, vx, vy
+		return xcoord + vx*self.lookahead, ycoord + vy*self.lookahead
+
+	def up(self, pointer):
+		'''Ends a touch and forgets its state'''
+		self._state.pop(pointer, None)
+
+class FilterChain(object):
+	'''
+	FilterChain(filters) -> applies filters in order, e.g. smoothing
+	before prediction.
+	'''
+
+	def __init__(self, filters):
+		self.filters = list(filters)
+
+	def down(self, pointer, xcoord, ycoord, now):
+		'''Starts a new touch in every filter'''
+		for stage in self.filters:
+			xcoord, ycoord = stage.down(pointer, xcoord, ycoord, now)
+		return xcoord, ycoord
+
+	def filter(self, pointer, xcoord, ycoord, now):
+		'''x.filter(pointer, xcoord, ycoord, now) -> (x, y)'''
+		for stage in self.filters:
+			xcoord, ycoord = stage.filter(pointer, xcoord, ycoord, now)
+		return xcoord, ycoord
+
+	def up(self, pointer):
+		'''Ends a touch in every filter'''
+		for stage in self.filters:
+			stage.up(pointer)
+
+# Filter name -> (class, number of numeric parameters)
+FILTERS = {
+	'one-euro': (OneEuroFilter, 3),
+	'predict': (VelocityPredictor, 2),
+}
+
+def parse_filters(spec):
+	'''
+	parse_filters(spec) -> filter
+	Builds a filter stage from a comma separated list of filters, each
+	optionally followed by its parameters separated by colons, e.g.
+	"one-euro:1.0:0.007,predict:20". Raises ValueError for invalid specs.
+	'''
+	stages = []
+	for part in spec.split(','):
+		fields = part.split(':')
+		if fields[0] not in FILTERS:
+			raise ValueError, 'unknown filter %r' % fields[0]
+		cls, count = FILTERS[fields[0]]
+		if len(fields) - 1 > count:
+			raise ValueError, 'too many parameters for %s' % fields[0]
+		stages.append(cls(*[float(value) for value in fields[1:]]))
+	if len(stages) == 1:
+		return stages[0]
+	return FilterChain(stages)
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Server-side recognition of multi-touch gestures.
+
+ Instead of every client tracking all pointers to recognize a pinch, a
+ rotation or a swipe, the server describes the set of active touches once
+ per frame and sends the result to the clients that ask for it with a
+ gesture request, at any time but only once:
+
+  request: "#G", version of the gesture frames (8 bit, GESTURE_VERSION)
+
+ From then on the client gets a gesture frame after the frames of every
+ input frame in which the touches changed:
+
+  gesture: "#G", phase (8 bit: GESTURE_BEGIN, GESTURE_CHANGE or
+           GESTURE_END), number of touches (8 bit), 16-bit x and y of the
+           centroid, 16-bit scale in 1/SCALE_UNIT, 16-bit signed rotation
+           in 1/ROTATION_UNIT degrees, 16-bit signed x and y velocity of
+           the centroid in coordinates per second
+
+ ('#' is no valid opcode, so the client recognizes the 16 byte frame
+ among the others.) A gesture begins with the first touch and ends when
+ the last one is released. Scale and rotation are relative to the begin
+ of the gesture: the scale is the ratio of the mean distance of the
+ touches from their centroid, the rotation (clockwise on the screen,
+ wrapped to -180..180 degrees) the least-squares rotation of the touches
+ around the centroid. Touches starting or ending in the middle of a
+ gesture do not change either. Coordinates are those of the server's
+ HELO, whatever region or transform the client uses.
+
+ A gesture frame always follows the events of its input frame, for
+ version 2 clients between two packets. Clients that are behind or rate
+ limited get gesture frames queued with their events: like motion, a
+ change replaces the pending one or is dropped, begin and end are kept.
+
+ GestureTracker keeps the positions of all pointers in a NumPy array, so
+ the description of any number of touches takes a handful of array
+ operations. It needs NumPy; without it, the servers refuse to enable
+ gestures.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import math, struct
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+GESTURE_MAGIC = '#G'
+GESTURE_VERSION = 1
+
+_GESTURE_REQUEST = struct.Struct('!2sB')
+GESTURE_REQUEST_SIZE = _GESTURE_REQUEST.size
+
+_GESTURE = struct.Struct('!2sBBHHHhhh')
+GESTURE_SIZE = _GESTURE.size
+
+# Phases of a gesture
+GESTURE_BEGIN = 0
+GESTURE_CHANGE = 1
+GESTURE_END = 2
+
+# Fixed point units of scale (1.0) and rotation (1 degree)
+SCALE_UNIT = 1000
+ROTATION_UNIT = 100
+# Weight of the newest measurement in the velocity
+VELOCITY_SMOOTHING = 0.5
+
+def _clamp(value, low, high):
+	'''Returns value rounded and limited to low..high'''
+	return min(max(int(round(value)), low), high)
+
+def encode_gesture_request(version=GESTURE_VERSION):
+	'''Returns the request a client sends to get gesture frames'''
+	return _GESTURE_REQUEST.pack(GESTURE_MAGIC, version)
+
+def decode_gesture_request(data, offset=0):
+	'''
+	decode_gesture_request(data, [offset]) -> version
+	Raises ValueError if data is no gesture request or asks for a version
+	the server does not know.
+	'''
+	magic, version = _GESTURE_REQUEST.unpack_from(data, offset)
+	if magic != GESTURE_MAGIC:
+		raise ValueError, 'invalid gesture request magic %r' % magic
+	if version != GESTURE_VERSION:
+		raise ValueError, 'unknown gesture version %i' % version
+	return version
+
+def encode_gesture(phase, touches, xcoord, ycoord, scale, rotation,
+                   xspeed, yspeed):
+	'''
+	encode_gesture(phase, touches, x, y, scale, rotation, xspeed, yspeed)
+	-> gesture frame; rotation in degrees, wrapped to -180..180
+	'''
+	rotation = (rotation + 180.0) % 360.0 - 180.0
+	return _GESTURE.pack(GESTURE_MAGIC, phase, min(touches, 0xff),
+	                     _clamp(xcoord, 0, 0xffff), _clamp(ycoord, 0, 0xffff),
+	                     _clamp(scale*SCALE_UNIT, 0, 0xffff),
+	                     _clamp(rotation*ROTATION_UNIT, -0x8000, 0x7fff),
+	                     _clamp(xspeed, -0x8000, 0x7fff),
+	                     _clamp(yspeed, -0x8000, 0x7fff))
+
+def decode_gesture(data, offset=0):
+	'''
+	decode_gesture(data, [offset])
+	-> (phase, touches, x, y, scale, rotation, xspeed, yspeed)
+	Raises ValueError if data is no gesture frame.
+	'''
+	fields = _GESTURE.unpack_from(data, offset)
+	if fields[0] != GESTURE_MAGIC:
+		raise ValueError, 'invalid gesture magic %r' % fields[0]
+	return fields[1:5] + (fields[5]/float(SCALE_UNIT),
+	                      fields[6]/float(ROTATION_UNIT)) + fields[7:]
+
+class GestureTracker(object):
+	'''
+	GestureTracker(cursorcount) -> describes the active touches as one
+	gesture.
+
+	 cursorcount: number of pointers; the pointer numbers index the arrays
+
+	down(), motion() and up() take the pointer numbers and coordinates
+	sent to the clients; frame() returns the gesture frame of the input
+	frame, if the touches changed. Raises ImportError without NumPy.
+	'''
+
+	def __init__(self, cursorcount):
+		if numpy is None:
+			raise ImportError, 'gesture recognition needs NumPy'
+		self._points = numpy.zeros((cursorcount, 2))
+		self._active = numpy.zeros(cursorcount, dtype=bool)
+		# Offsets of the touches from their centroid and their mean
+		# distance when the set of touches last changed
+		self._reference = numpy.zeros((cursorcount, 2))
+		self._spread = 0.0
+		# Phase of the last frame, None outside of a gesture
+		self._phase = None
+		# Set when a touch began or ended since the last frame()
+		self._rebase = False
+		self._dirty = False
+		# Scale and rotation up to the last change of the set of touches
+		self._base_scale, self._base_rotation = 1.0, 0.0
+		# State sent with the last frame: centroid, scale, rotation and
+		# velocity, and when
+		self._centroid = None
+		self._scale, self._rotation = 1.0, 0.0
+		self._velocity = numpy.zeros(2)
+		self._time = None
+		self.frames = 0
+
+	def down(self, pointer, xcoord, ycoord):
+		'''Adds a touch'''
+		self._points[pointer] = xcoord, ycoord
+		self._active[pointer] = True
+		self._rebase = self._dirty = True
+
+	def motion(self, pointer, xcoord, ycoord):
+		'''Moves a touch'''
+		self._points[pointer] = xcoord, ycoord
+		self._dirty = True
+
+	def up(self, pointer):
+		'''Removes a touch'''
+		if self._active[pointer]:
+			self._active[pointer] = False
+			self._rebase = self._dirty = True
+
+	def idle(self):
+		'''Forgets the current gesture; the next frame() begins a new one'''
+		self._phase = None
+		self._dirty = self._active.any()
+
+	def frame(self, now):
+		'''
+		x.frame(now) -> gesture frame or None
+		Describes the touches at the end of an input frame.
+		'''
+		if not self._dirty:
+			return None
+		self._dirty = False
+		active = self._active
+		count = int(active.sum())
+		if not count:
+			if self._phase is None:
+				return None
+			self._phase = None
+			self.frames += 1
+			return encode_gesture(GESTURE_END, 0, self._centroid[0],
+			                      self._centroid[1], self._scale,
+			                      self._rotation, 0, 0)
+		points = self._points[active]
+		centroid = points.mean(axis=0)
+		offsets = points - centroid
+		spread = numpy.sqrt((offsets*offsets).sum(axis=1)).mean()
+		if self._phase is None:
+			phase = GESTURE_BEGIN
+			self._base_scale, self._base_rotation = 1.0, 0.0
+			self._scale, self._rotation = 1.0, 0.0
+			self._velocity[:] = 0
+			self._rebase = True
+		else:
+			phase = GESTURE_CHANGE
+			if not self._rebase:
+				reference = self._reference[active]
+				scale = spread/self._spread if self._spread else 1.0
+				cross = (reference[:,0]*offsets[:,1]
+				         - reference[:,1]*offsets[:,0]).sum()
+				dot = (reference*offsets).sum()
+				self._scale = self._base_scale*scale
+				self._rotation = self._base_rotation \
+				                 + math.degrees(math.atan2(cross, dot))
+				elapsed = now - self._time
+				if elapsed > 0:
+					self._velocity += VELOCITY_SMOOTHING \
+						*((centroid - self._centroid)/elapsed - self._velocity)
+		if self._rebase:
+			# The jump of the centroid and spread of another set of touches
+			# is no movement
+			self._rebase = False
+			self._reference[active] = offsets
+			self._spread = spread
+			self._base_scale, self._base_rotation = self._scale, self._rotation
+		self._phase = phase
+		self._centroid = centroid
+		self._time = now
+		self.frames += 1
+		return encode_gesture(phase, count, centroid[0], centroid[1],
+		                      self._scale, self._rotation,
+		                      self._velocity[0], self._velocity[1])
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Taking over the sockets of another server process.
+
+ A server does not have to create its listening socket itself:
+
+  systemd socket activation: with a .socket unit, systemd creates and
+      binds the socket and passes it as file descriptor 3 (LISTEN_FDS,
+      LISTEN_PID); systemd_listen_fds() returns such descriptors.
+
+  handoff: a running server offers its sockets on a unix socket (the
+      --handoff option). A new server connects there before opening its
+      own socket and gets the listening socket and every client connection
+      together with the state of the clients, so it can continue where the
+      old one stopped: the clients keep their connection and get no new
+      HELO. The old server then stops and offers nothing anymore; the new
+      one offers its sockets on the same address for the next restart.
+
+ The handoff protocol:
+
+  request:  HANDOFF_MAGIC
+  answer:   32-bit length, the state as JSON, then the listening socket and
+            every client socket, one descriptor per message (SCM_RIGHTS)
+  confirm:  HANDOFF_ACK once the new server has all descriptors; only then
+            the old server forgets its clients
+
+ If anything fails before the confirmation, the old server keeps serving.
+
+ The descriptors give full control over the input stream of every
+ client, so both sides check with SO_PEERCRED that the other process
+ runs as the same user, and the socket file is only accessible to that
+ user. Abstract unix socket addresses (starting with a null byte) have
+ no file permissions at all and are refused.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import os, errno, json, select, struct, socket
+from _multiprocessing import sendfd, recvfd
+
+HANDOFF_MAGIC = '#H'
+HANDOFF_ACK = 'K'
+
+# Seconds either side waits for the other during a handoff
+HANDOFF_TIMEOUT = 5.0
+
+# The first descriptor systemd passes
+SD_LISTEN_FDS_START = 3
+
+# getsockopt() options returning the address family of a socket and the
+# credentials of its peer (Linux)
+_SO_DOMAIN = getattr(socket, 'SO_DOMAIN', 39)
+_SO_PEERCRED = getattr(socket, 'SO_PEERCRED', 17)
+# struct ucred: pid, uid, gid
+_UCRED = struct.Struct('@3i')
+
+_LENGTH = struct.Struct('!I')
+
+def systemd_listen_fds():
+	'''
+	systemd_listen_fds() -> list of file descriptors
+	Returns the sockets passed by systemd socket activation, if they are
+	meant for this process, and unsets the variables so child processes do
+	not take them as well.
+	'''
+	try:
+		pid = int(os.environ.get('LISTEN_PID', ''))
+		count = int(os.environ.get('LISTEN_FDS', ''))
+	except ValueError:
+		return []
+	for name in ('LISTEN_PID', 'LISTEN_FDS', 'LISTEN_FDNAMES'):
+		os.environ.pop(name, None)
+	if pid != os.getpid() or count <= 0:
+		return []
+	return range(SD_LISTEN_FDS_START, SD_LISTEN_FDS_START + count)
+
+def socket_from_fd(fd, sock_type=socket.SOCK_STREAM):
+	'''
+	socket_from_fd(fd, [sock_type]) -> socket object
+	Wraps an inherited socket descriptor; the socket object gets its own
+	copy, fd itself is closed.
+	'''
+	probe = socket.fromfd(fd, socket.AF_UNIX, sock_type)
+	try:
+		family = probe.getsockopt(socket.SOL_SOCKET, _SO_DOMAIN)
+	finally:
+		probe.close()
+	sock = socket.fromfd(fd, family, sock_type)
+	os.close(fd)
+	return sock
+
+def check_handoff_addr(addr):
+	'''Raises ValueError if addr cannot be used for a handoff'''
+	if addr.startswith('\0'):
+		raise ValueError, 'abstract socket addresses are open to every user'
+
+def _check_peer(sock):
+	'''Raises socket.error unless the peer of sock runs as this user'''
+	uid = _UCRED.unpack(sock.getsockopt(socket.SOL_SOCKET, _SO_PEERCRED,
+	                                    _UCRED.size))[1]
+	if uid != os.getuid():
+		raise socket.error(errno.EPERM, 'handoff peer runs as uid %i' % uid)
+
+def _recv_exactly(sock, size):
+	'''Reads size bytes or raises socket.error'''
+	data = ''
+	while len(data) < size:
+		chunk = sock.recv(size - len(data))
+		if not chunk:
+			raise socket.error(errno.ECONNRESET, 'handoff connection closed')
+		data += chunk
+	return data
+
+def _wait_readable(sock):
+	'''Waits until sock is readable or raises socket.timeout'''
+	if not select.select([sock], [], [], HANDOFF_TIMEOUT)[0]:
+		raise socket.timeout('handoff timed out')
+
+def request_handoff(addr):
+	'''
+	request_handoff(addr) -> (state, [listening socket fd, client fds...])
+	Asks the server offering its sockets on the unix socket addr to hand
+	them over. Returns None if no server is listening there; raises
+	socket.error or ValueError if the handoff fails or the server runs as
+	another user.
+	'''
+	check_handoff_addr(addr)
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		try:
+			sock.connect(addr)
+		except socket.error, e:
+			if e.args[0] in (errno.ENOENT, errno.ECONNREFUSED):
+				return None
+			raise
+		_check_peer(sock)
+		sock.settimeout(HANDOFF_TIMEOUT)
+		sock.sendall(HANDOFF_MAGIC)
+		length = _LENGTH.unpack(_recv_exactly(sock, _LENGTH.size))[0]
+		state = json.loads(_recv_exactly(sock, length))
+		if not isinstance(state, dict) or \
+		   not isinstance(state.get('clients'), list):
+			raise ValueError, 'invalid handoff state'
+		# recvfd() needs a blocking socket
+		sock.setblocking(True)
+		fds = []
+		try:
+			for _ in xrange(1 + len(state['clients'])):
+				_wait_readable(sock)
+				fds.append(recvfd(sock.fileno()))
+			sock.settimeout(HANDOFF_TIMEOUT)
+			sock.sendall(HANDOFF_ACK)
+		except:
+			for fd in fds:
+				os.close(fd)
+			raise
+		return state, fds
+	finally:
+		sock.close()
+
+def serve_handoff(conn, state, fds):
+	'''
+	serve_handoff(conn, state, fds) -> bool
+	Answers a handoff request on the connection conn with state and the
+	descriptors fds. Returns True once the new server confirmed that it
+	took them over; raises socket.error if the handoff fails or the new
+	server runs as another user.
+	'''
+	_check_peer(conn)
+	conn.settimeout(HANDOFF_TIMEOUT)
+	if _recv_exactly(conn, len(HANDOFF_MAGIC)) != HANDOFF_MAGIC:
+		return False
+	data = json.dumps(state)
+	conn.sendall(_LENGTH.pack(len(data)) + data)
+	conn.setblocking(True)
+	for fd in fds:
+		sendfd(conn.fileno(), fd)
+	_wait_readable(conn)
+	conn.settimeout(HANDOFF_TIMEOUT)
+	return conn.recv(1) == HANDOFF_ACK
+
+def open_handoff_socket(addr):
+	'''
+	open_handoff_socket(addr) -> listening unix socket
+	Offers the sockets of this server on addr; a stale socket file left by
+	a previous server is replaced. Raises ValueError for an abstract
+	address.
+	'''
+	check_handoff_addr(addr)
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		os.unlink(addr)
+	except OSError, e:
+		if e.errno != errno.ENOENT:
+			raise
+	sock.bind(addr)
+	# Other users cannot even connect
+	os.chmod(addr, 0600)
+	sock.listen(1)
+	sock.setblocking(False)
+	return sock
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Optional latency instrumentation of the event path.
+
+ Events are timestamped when the input source captures them, when they are
+ handed to the output thread and when they are written to each client.
+ The differences go into HDR style histograms (log-linear buckets with a
+ bounded relative error), one per stage and one per connected client.
+
+ Instrumentation is off unless an output thread's latency attribute is set
+ to a LatencyRecorder; the hot path then only tests that attribute.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import time
+
+# Stages measured by the output threads
+STAGE_ENQUEUE = 'capture>enqueue'
+STAGE_DISPATCH = 'enqueue>dispatch'
+STAGE_LOCK_WAIT = 'lock wait'
+STAGE_LOCK_HOLD = 'lock hold'
+STAGE_WRITE = 'capture>write'
+
+# 2**_SUB_BITS buckets per power of two: values are kept with a relative
+# error below 2**(1-_SUB_BITS), i.e. 1.6%
+_SUB_BITS = 7
+_SUB_COUNT = 1 << _SUB_BITS
+_HALF_COUNT = _SUB_COUNT >> 1
+
+class LatencyHistogram(object):
+	'''
+	LatencyHistogram([max_value]) -> histogram of integer values (the
+	recorders use microseconds). Values above max_value are counted as
+	max_value.
+	'''
+
+	__slots__ = ('counts', 'count', 'max', 'max_value')
+
+	def __init__(self, max_value=60*1000*1000):
+		self.max_value = max_value
+		self.counts = [0]*(self._index(max_value) + 1)
+		self.count = 0
+		self.max = 0
+
+	@staticmethod
+	def _index(value):
+		if value < _SUB_COUNT:
+			return value
+		shift = value.bit_length() - _SUB_BITS
+		return shift*_HALF_COUNT + (value >> shift)
+
+	@staticmethod
+	def _value(index):
+		'''Returns the lowest value counted in a bucket'''
+		if index < _SUB_COUNT:
+			return index
+		shift = index//_HALF_COUNT - 1
+		return (index - shift*_HALF_COUNT) << shift
+
+	def record(self, value):
+		'''x.record(value) - counts a value'''
+		value = min(max(int(value), 0), self.max_value)
+		self.counts[self._index(value)] += 1
+		self.count += 1
+		if value > self.max:
+			self.max = value
+
+	def percentile(self, percent):
+		'''x.percentile(percent) -> value below which percent of all values are'''
+		if not self.count:
+			return 0
+		rank = max(1, int(self.count*percent/100.0 + 0.5))
+		seen = 0
+		for index, count in enumerate(self.counts):
+			seen += count
+			if seen >= rank:
+				return min(self._value(index), self.max)
+		return self.max
+
+	def summary(self):
+		'''x.summary() -> (count, p50, p99, max)'''
+		return (self.count, self.percentile(50), self.percentile(99), self.max)
+
+class LatencyRecorder(object):
+	'''
+	LatencyRecorder() -> collection of latency histograms in microseconds,
+	one per stage and, for the write stage, one per client.
+
+	The input source calls capture() when it gets an event; the output
+	threads record the other stages.
+	'''
+
+	def __init__(self):
+		self.stages = {}
+		self.clients = {}
+		self._captured = None
+
+	def capture(self, when=None):
+		'''
+		x.capture([when]) - marks the time the current input event was
+		captured: when (a time.time() value, e.g. the kernel's timestamp
+		of the event) or now
+		'''
+		self._captured = when or time.time()
+
+	def captured(self):
+		'''Returns the time of the last capture() (now, if there was none)'''
+		return self._captured or time.time()
+
+	def histogram(self, stage):
+		'''Returns the histogram of a stage, creating it if needed'''
+		histogram = self.stages.get(stage)
+		if histogram is None:
+			histogram = self.stages[stage] = LatencyHistogram()
+		return histogram
+
+	def client_histogram(self, client):
+		'''Returns the histogram of the write stage of one client'''
+		histogram = self.clients.get(client)
+		if histogram is None:
+			histogram = self.clients[client] = LatencyHistogram()
+		return histogram
+
+	def forget_client(self, client):
+		'''
+		x.forget_client(client) - drops the histogram of a client that
+		disconnected; its writes stay counted in the write stage
+		'''
+		self.clients.pop(client, None)
+
+	def record(self, stage, seconds):
+		'''x.record(stage, seconds) - counts a duration'''
+		self.histogram(stage).record(seconds*1e6)
+
+	def report(self):
+		'''x.report() -> text table with count, p50, p99 and max in us'''
+		lines = ['%-40s %9s %9s %9s %9s' % ('stage', 'count', 'p50 us',
+		                                    'p99 us', 'max us')]
+		for name, histogram in sorted(self.stages.items()):
+			lines.append('%-40s %9i %9i %9i %9i'
+			             % ((name,) + histogram.summary()))
+		for client, histogram in sorted(self.clients.items()):
+			lines.append('%-40s %9i %9i %9i %9i'
+			             % (('%s %s' % (STAGE_WRITE, client),)
+			                + histogram.summary()))
+		return '\n'.join(lines)
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Live metrics of a device server in the Prometheus text format.
+
+ MetricsServer answers HTTP requests on its own socket and thread. It only
+ reads counters that the output thread and the input source keep anyway,
+ so neither of them ever waits for a scrape.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import errno, select, threading
+from socket import socket as _socket, SOCK_STREAM as _SOCK_STREAM, \
+                   error as _sockerror, timeout as _socktimeout
+
+from vinputserver.common import debug_output
+
+# Seconds a scraper gets to send its request
+REQUEST_TIMEOUT = 2.0
+
+_CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+def _escape(value):
+	'''Escapes a label value'''
+	return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+	                 .replace('\n', '\\n')
+
+def _metric(lines, name, kind, description, samples):
+	'''
+	Appends a metric to lines. samples is a list of (labels, value) with
+	labels a list of (label name, value) pairs.
+	'''
+	lines.append('# HELP %s %s' % (name, description))
+	lines.append('# TYPE %s %s' % (name, kind))
+	for labels, value in samples:
+		if labels:
+			lines.append('%s{%s} %s' % (name, ','.join(['%s="%s"'
+				% (label, _escape(text)) for label, text in labels]), value))
+		else:
+			lines.append('%s %s' % (name, value))
+
+def render(server, cursorids=None):
+	'''
+	render(server, [cursorids]) -> metrics text
+	Returns the metrics of an output thread (and of the CursorIdAllocator
+	of the input source, if given) in the Prometheus text format.
+	'''
+	lines = []
+	counts = server.event_counts or {}
+	_metric(lines, 'vinput_events_total', 'counter',
+	        'Events handed to the output thread, by opcode.',
+	        [([('opcode', opcode)], count)
+	         for opcode, count in sorted(counts.items())])
+	_metric(lines, 'vinput_queue_depth', 'gauge',
+	        'Batches of events waiting for the output thread.',
+	        [(None, server.queue_depth())])
+	clients = server.client_stats()
+	_metric(lines, 'vinput_clients', 'gauge', 'Connected clients.',
+	        [(None, len(clients))])
+	_metric(lines, 'vinput_client_frames_sent_total', 'counter',
+	        'Frames sent to a client.',
+	        [([('client', name)], frames) for name, frames, size, backlog
+	         in clients])
+	_metric(lines, 'vinput_client_bytes_sent_total', 'counter',
+	        'Bytes sent to a client.',
+	        [([('client', name)], size) for name, frames, size, backlog
+	         in clients])
+	_metric(lines, 'vinput_client_backlog_bytes', 'gauge',
+	        'Bytes waiting to be written to a client.',
+	        [([('client', name)], backlog) for name, frames, size, backlog
+	         in clients])
+	_metric(lines, 'vinput_accepts_total', 'counter',
+	        'Clients that connected or subscribed.', [(None, server.accepts)])
+	_metric(lines, 'vinput_disconnects_total', 'counter',
+	        'Clients dropped by the server, by reason.',
+	        [([('reason', reason)], count) for reason, count
+	         in sorted(server.disconnect_counts().items())])
+	counters = server.counters()
+	_metric(lines, 'vinput_coalesced_frames_total', 'counter',
+	        'Motion frames merged for lagging clients.',
+	        [(None, counters['coalesced'])])
+	_metric(lines, 'vinput_dropped_frames_total', 'counter',
+	        'Frames dropped for lagging clients.',
+	        [(None, counters['dropped'])])
+	if cursorids is not None:
+		_metric(lines, 'vinput_cursors', 'gauge',
+		        'Pointer numbers available.', [(None, cursorids.cursorcount)])
+		_metric(lines, 'vinput_cursors_in_use', 'gauge',
+		        'Pointer numbers assigned to touches.', [(None, len(cursorids))])
+		_metric(lines, 'vinput_cursors_exhausted_total', 'counter',
+		        'Touches ignored because the maximum of cursors was reached.',
+		        [(None, cursorids.exhausted)])
+	return '\n'.join(lines) + '\n'
+
+class MetricsServer(threading.Thread):
+	"""
+	MetricsServer(server, sock_addr, sock_family, [cursorids]) -> a Thread
+	object serving the metrics of an output thread over HTTP.
+
+	 server: the output thread (ServerSocketThread, DatagramThread or
+	         ShmRingThread); counting events per opcode is enabled on it
+	 sock_addr: address to listen on, format varies with sock_family
+	 sock_family: address family as defined in the socket module
+	 cursorids: CursorIdAllocator of the input source; may also be set
+	            later through x.cursorids
+
+	Every GET request is answered with the metrics (see render()).
+	"""
+
+	def __init__(self, server, sock_addr, sock_family, cursorids=None):
+		"""
+		constructor - initializes x
+		"""
+		super(MetricsServer, self).__init__(name="Metrics Server")
+		self.setDaemon(True)
+		self.server = server
+		self.address = sock_addr
+		self.family = sock_family
+		self.cursorids = cursorids
+		self._sock = None
+		self._running = True
+		if server.event_counts is None:
+			server.event_counts = {}
+
+	def run(self):
+		"""
+		Contains the thread main loop - answers the requests of scrapers
+		NOTE: use x.start() to run the thread. x.run() is used internally.
+		"""
+		debug_output('opening metrics socket on %r' % (self.address,))
+		self._sock = sock = _socket(self.family, _SOCK_STREAM)
+		sock.bind(self.address)
+		sock.listen(5)
+		while self._running:
+			try:
+				# Time out now and then to notice close()
+				if not select.select([sock], [], [], 0.5)[0]:
+					continue
+				conn, addr = sock.accept()
+			except (select.error, _sockerror), e:
+				if e.args[0] == errno.EINTR:
+					continue
+				if not self._running:
+					break
+				raise
+			try:
+				self._handle(conn)
+			except (_sockerror, _socktimeout), e:
+				debug_output('metrics request failed: %s' % (e,))
+			finally:
+				conn.close()
+
+	def _handle(self, conn):
+		'''Answers one HTTP request'''
+		conn.settimeout(REQUEST_TIMEOUT)
+		request = ''
+		while '\r\n\r\n' not in request and '\n\n' not in request \
+		      and len(request) < 8192:
+			data = conn.recv(4096)
+			if not data:
+				break
+			request += data
+		parts = request.split(None, 2)
+		if len(parts) < 2 or parts[0] not in ('GET', 'HEAD'):
+			status, body = '405 Method Not Allowed', ''
+		elif parts[1].split('?', 1)[0] not in ('/', '/metrics'):
+			status, body = '404 Not Found', ''
+		else:
+			status, body = '200 OK', render(self.server, self.cursorids)
+		conn.sendall('HTTP/1.0 %s\r\nContent-Type: %s\r\n'
+		             'Content-Length: %i\r\nConnection: close\r\n\r\n'
+		             % (status, _CONTENT_TYPE, len(body)))
+		if parts and parts[0] == 'GET':
+			conn.sendall(body)
+
+	def close(self):
+		'''
+		x.close()
+		Stops the thread and closes the socket.
+		'''
+		self._running = False
+		if self.isAlive() and threading.currentThread() is not self:
+			self.join(1.0)
+		if self._sock is not None:
+			self._sock.close()
+			self._sock = None
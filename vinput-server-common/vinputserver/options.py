@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Command line options and output setup shared by the device servers.
+
+ Every server takes the same options for its output: where and how the
+ clients are served, the lag handling, recording, tracing and metrics.
+ Its main() hands each argument to ServerOptions.parse() first and only
+ handles what is left (cursor count, device, upstreams, ...) itself;
+ create_output() then builds the output thread the options describe.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import sys, signal
+from socket import AF_INET6 as _AF_INET6, SOCK_STREAM as _SOCK_STREAM, \
+                   SOCK_DGRAM as _SOCK_DGRAM, AF_UNIX as _AF_UNIX
+
+from vinputserver import common
+from vinputserver.common import debug_output, parse_addr, SHM_FAMILY
+from vinputserver.cursorids import MAX_CURSORCOUNT
+from vinputserver.server import ServerSocketThread, DEF_MAX_BUFFER, \
+                                DEF_MAX_LAG, LAG_DROP_MOTION, LAG_POLICIES, \
+                                DEF_MAX_BATCH_AGE, DEF_BACKLOG, FLUSH_FRAME, \
+                                FLUSH_MODES
+from vinputserver.datagram import DatagramThread, DEF_KEYFRAME_INTERVAL
+from vinputserver.shmring import ShmRingThread
+from vinputserver.worker import WorkerServer
+from vinputserver.handoff import systemd_listen_fds, socket_from_fd, \
+                                 check_handoff_addr
+from vinputserver.latency import LatencyRecorder
+from vinputserver.metrics import MetricsServer
+from vinputserver.record import SessionRecorder
+from vinputserver.tracebuf import TraceBuffer
+
+def _abort(message):
+	'''Prints message and exits like the servers' option parsers'''
+	print >> sys.stderr, '%s Aborted.' % message
+	sys.exit(1)
+
+class ServerOptions(object):
+	'''
+	ServerOptions(resolution, listen_addr, [cursorcount], [flush], [latency])
+	-> the options every device server takes for its output.
+
+	 resolution: default of -r/--resolution
+	 listen_addr: default (host, port) of -l/--listen
+	 cursorcount: default of -c/--cursorcount; None if the server takes
+	              no cursor count
+	 flush: whether --flush= is taken; otherwise every flush() of the
+	        input ends a frame
+	 latency: whether --latency is taken
+
+	After parse() took all options, the attributes hold their values.
+	'''
+
+	def __init__(self, resolution, listen_addr, cursorcount=None, flush=True,
+	             latency=True):
+		self.resolution = resolution
+		self.cursorcount = cursorcount
+		self._flush = flush
+		self._latency = latency
+		self.addr = listen_addr
+		self.sock_family, self.sock_type, self.sock_prot = _AF_INET6, \
+		                                                   _SOCK_STREAM, 0
+		self.max_buffer = DEF_MAX_BUFFER
+		self.lag_policy = LAG_DROP_MOTION
+		self.max_lag = DEF_MAX_LAG
+		self.flush_mode = FLUSH_FRAME
+		self.max_batch_age = DEF_MAX_BATCH_AGE
+		self.multicast = None
+		self.keyframe_interval = DEF_KEYFRAME_INTERVAL
+		self.latency = False
+		self.worker = False
+		self.adaptive_rate = False
+		self.backlog = DEF_BACKLOG
+		self.handoff = None
+		self.metrics_addr = None
+		self.record = None
+		self.trace = None
+
+	def parse(self, args):
+		'''
+		x.parse(args) -> True if args[0] was one of the shared options
+		Takes the option at the front of the argument list args off it.
+		Raises IndexError if it lacks its argument and ValueError if its
+		value is invalid, with args left unchanged.
+		'''
+		arg = args[0]
+		if arg in ('-d', '--debug'):
+			common.DEBUG = True
+		elif arg == '-l':
+			self.sock_family, self.sock_type, self.sock_prot, self.addr = \
+				parse_addr(args[1])
+			args.pop(0)
+		elif arg.startswith('--listen='):
+			self.sock_family, self.sock_type, self.sock_prot, self.addr = \
+				parse_addr(arg[9:])
+		elif arg == '-c' and self.cursorcount is not None:
+			self.cursorcount = self._parse_cursorcount(args[1])
+			args.pop(0)
+		elif arg.startswith('--cursorcount=') and self.cursorcount is not None:
+			self.cursorcount = self._parse_cursorcount(arg[14:])
+		elif arg == '-r':
+			self.resolution = [ int(x) for x in args[1].split('x', 1) ]
+			args.pop(0)
+		elif arg.startswith('--resolution='):
+			resolution = [ int(x) for x in arg[13:].split('x', 1) ]
+			if 0 in resolution or len(resolution) != 2:
+				raise ValueError, 'invalid resolution'
+			self.resolution = resolution
+		elif arg.startswith('--max-buffer='):
+			max_buffer = int(arg[13:])
+			if max_buffer <= 0:
+				raise ValueError, 'invalid buffer size'
+			self.max_buffer = max_buffer
+		elif arg.startswith('--lag-policy='):
+			if arg[13:] not in LAG_POLICIES:
+				raise ValueError, 'invalid lag policy'
+			self.lag_policy = arg[13:]
+		elif arg.startswith('--max-lag='):
+			self.max_lag = int(arg[10:])
+		elif arg.startswith('--flush=') and self._flush:
+			if arg[8:] not in FLUSH_MODES:
+				raise ValueError, 'invalid flush mode'
+			self.flush_mode = arg[8:]
+		elif arg.startswith('--max-batch-age='):
+			self.max_batch_age = int(arg[16:])
+		elif arg.startswith('--multicast='):
+			self.multicast = parse_addr(arg[12:])
+		elif arg.startswith('--keyframe-interval='):
+			self.keyframe_interval = int(arg[20:])
+		elif arg == '--worker':
+			self.worker = True
+		elif arg == '--adaptive-rate':
+			self.adaptive_rate = True
+		elif arg.startswith('--backlog='):
+			backlog = int(arg[10:])
+			if backlog <= 0:
+				raise ValueError, 'invalid backlog'
+			self.backlog = backlog
+		elif arg.startswith('--handoff='):
+			handoff = parse_addr(arg[10:])
+			if handoff[0] != _AF_UNIX or handoff[1] != _SOCK_STREAM:
+				raise ValueError, 'handoff needs a unix stream socket'
+			check_handoff_addr(handoff[3])
+			self.handoff = handoff[3]
+		elif arg == '--latency' and self._latency:
+			self.latency = True
+		elif arg.startswith('--record='):
+			if not arg[9:]:
+				raise ValueError, 'missing file name'
+			self.record = arg[9:]
+		elif arg.startswith('--trace='):
+			if not arg[8:]:
+				raise ValueError, 'missing file name'
+			self.trace = arg[8:]
+		elif arg.startswith('--metrics='):
+			metrics_addr = parse_addr(arg[10:])
+			if metrics_addr[0] == SHM_FAMILY or \
+			   metrics_addr[1] != _SOCK_STREAM:
+				raise ValueError, 'metrics need a stream socket'
+			self.metrics_addr = metrics_addr
+		else:
+			return False
+		args.pop(0)
+		return True
+
+	@staticmethod
+	def _parse_cursorcount(value):
+		'''Returns the cursor count value or raises ValueError'''
+		cursorcount = int(value)
+		if not 0 < cursorcount <= MAX_CURSORCOUNT:
+			raise ValueError, 'invalid cursor count'
+		return cursorcount
+
+	def stream_output(self):
+		'''
+		Returns whether the clients are served by a ServerSocketThread of
+		this process (no multicast, ring buffer, datagrams or worker)
+		'''
+		return self.multicast is None and self.sock_family != SHM_FAMILY and \
+		       self.sock_type != _SOCK_DGRAM and not self.worker
+
+	def create_output(self):
+		'''
+		x.create_output() -> output thread, not started yet
+		Builds the output thread with the recorder, tracer and latency
+		recorder the options ask for. Prints a message and exits if the
+		options do not go together.
+		'''
+		multicast = self.multicast
+		datagrams = multicast is not None or self.sock_family == SHM_FAMILY \
+		            or self.sock_type == _SOCK_DGRAM
+		if self.worker and datagrams:
+			_abort('A worker process needs a stream socket output.')
+		if self.worker and self.handoff is not None:
+			_abort('A worker process cannot hand over its clients.')
+		# A listening socket passed by systemd socket activation
+		listen_sock = None
+		listen_fds = systemd_listen_fds()
+		if listen_fds:
+			if datagrams:
+				_abort('A socket passed by systemd needs a stream socket output.')
+			listen_sock = socket_from_fd(listen_fds[0])
+		resolution, addr = self.resolution, self.addr
+		if multicast is not None:
+			server = DatagramThread(resolution, None, multicast[0],
+			                        multicast_group=multicast[3],
+			                        keyframe_interval=self.keyframe_interval,
+			                        flush_mode=self.flush_mode,
+			                        max_batch_age=self.max_batch_age)
+		elif self.sock_family == SHM_FAMILY:
+			server = ShmRingThread(resolution, addr, flush_mode=self.flush_mode,
+			                       max_batch_age=self.max_batch_age)
+		elif self.sock_type == _SOCK_DGRAM:
+			server = DatagramThread(resolution, addr, self.sock_family,
+			                        keyframe_interval=self.keyframe_interval,
+			                        flush_mode=self.flush_mode,
+			                        max_batch_age=self.max_batch_age)
+		elif self.worker:
+			# Accepting and writing to the clients happens in a worker
+			# process, which also counts the events for the metrics
+			metrics_addr = None
+			if self.metrics_addr is not None:
+				metrics_addr = self.metrics_addr[3], self.metrics_addr[0]
+			server = WorkerServer(resolution, addr, self.sock_family,
+			                      self.sock_type, self.sock_prot,
+			                      max_buffer=self.max_buffer,
+			                      lag_policy=self.lag_policy,
+			                      max_lag=self.max_lag,
+			                      flush_mode=self.flush_mode,
+			                      max_batch_age=self.max_batch_age,
+			                      backlog=self.backlog, listen_sock=listen_sock,
+			                      adaptive_rate=self.adaptive_rate,
+			                      metrics_addr=metrics_addr)
+		else:
+			server = ServerSocketThread(resolution, addr, self.sock_family,
+			                            self.sock_type, self.sock_prot,
+			                            max_buffer=self.max_buffer,
+			                            lag_policy=self.lag_policy,
+			                            max_lag=self.max_lag,
+			                            flush_mode=self.flush_mode,
+			                            max_batch_age=self.max_batch_age,
+			                            backlog=self.backlog,
+			                            listen_sock=listen_sock,
+			                            handoff_addr=self.handoff,
+			                            adaptive_rate=self.adaptive_rate)
+		if self.record is not None:
+			try:
+				server.recorder = SessionRecorder(self.record)
+			except IOError, e:
+				_abort('Cannot open recording "%s": %s.'
+				       % (self.record, e.strerror))
+		if self.trace is not None:
+			server.tracer = TraceBuffer()
+			# kill -USR1 dumps the trace records
+			signal.signal(signal.SIGUSR1, lambda signum, frame:
+			              server.tracer.dump_file(self.trace))
+		if self.latency:
+			server.latency = LatencyRecorder()
+			# kill -USR2 prints the latencies measured so far
+			signal.signal(signal.SIGUSR2, lambda signum, frame:
+			              sys.stderr.write(server.latency.report() + '\n'))
+		return server
+
+	def start_metrics(self, server, cursorids=None):
+		'''
+		x.start_metrics(server, [cursorids]) -> running MetricsServer of
+		the output thread server, or None without --metrics or with a
+		worker process (which serves them itself)
+		'''
+		if self.metrics_addr is None or self.worker:
+			return None
+		metrics = MetricsServer(server, self.metrics_addr[3],
+		                        self.metrics_addr[0], cursorids)
+		metrics.start()
+		return metrics
+
+	def finish(self, server, metrics):
+		'''
+		x.finish(server, metrics)
+		Closes the output thread and its metrics server once the input
+		ended, and saves what was recorded and traced.
+		'''
+		if metrics is not None:
+			metrics.close()
+		server.close()
+		if server.recorder is not None:
+			server.recorder.close()
+		if server.tracer is not None:
+			server.tracer.dump_file(self.trace)
+		debug_output('%(coalesced)i motion frames coalesced, %(dropped)i dropped'
+		             % server.counters())
+		if self.latency:
+			print >> sys.stderr, server.latency.report()
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Encoder for the vinput wire protocol.
+
+ The server greets each client with a HELO ("##", 16-bit width, 16-bit
+ height) and then sends 6 byte frames: opcode character, pointer number,
+ 16-bit x and 16-bit y coordinate, all big-endian.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import struct
+
+HELO_MAGIC = '##'
+# Datagram transport: every datagram starts with a header ("#V", 32-bit
+# sequence number, flags byte, 16-bit width, 16-bit height) followed by
+# frames. Receivers subscribe by sending SUBSCRIBE_MAGIC to the server.
+DATAGRAM_MAGIC = '#V'
+SUBSCRIBE_MAGIC = '#S'
+# Flag of datagrams carrying the full pointer state instead of events
+DATAGRAM_KEYFRAME = 0x01
+
+_HELO = struct.Struct('!2sHH')
+_FRAME = struct.Struct('!cBHH')
+_DATAGRAM_HEADER = struct.Struct('!2sIBHH')
+
+# Size of a vinput frame in bytes
+FRAME_SIZE = _FRAME.size
+# Largest coordinate the protocol can carry
+MAX_COORD = 0xffff
+DATAGRAM_HEADER_SIZE = _DATAGRAM_HEADER.size
+# Payload size that fits into an ethernet frame without fragmentation
+MAX_DATAGRAM_SIZE = 1400
+MAX_DATAGRAM_FRAMES = (MAX_DATAGRAM_SIZE - DATAGRAM_HEADER_SIZE)//FRAME_SIZE
+# Frames decode_frames() unpacks with one struct call; the structs are
+# cached per number of frames
+_DECODE_CHUNK = 256
+_decoders = {}
+
+def encode_helo(width, height):
+	'''Returns the HELO announcing the given coordinate range'''
+	return _HELO.pack(HELO_MAGIC, width, height)
+
+def encode_datagram_header(seq, flags, width, height):
+	'''Returns the header of a datagram'''
+	return _DATAGRAM_HEADER.pack(DATAGRAM_MAGIC, seq & 0xffffffff, flags,
+	                             width, height)
+
+def decode_datagram(data):
+	'''
+	decode_datagram(data) -> (seq, flags, (width, height), frames)
+	Splits a datagram into its header fields and a list of (opcode, pointer,
+	x, y) tuples. Raises ValueError for anything that is not a datagram.
+	'''
+	if len(data) < DATAGRAM_HEADER_SIZE or \
+	   (len(data) - DATAGRAM_HEADER_SIZE) % FRAME_SIZE:
+		raise ValueError, 'invalid datagram size %i' % len(data)
+	magic, seq, flags, width, height = _DATAGRAM_HEADER.unpack_from(data)
+	if magic != DATAGRAM_MAGIC:
+		raise ValueError, 'invalid datagram magic %r' % magic
+	frames = [decode_frame(data, offset) for offset in
+	          xrange(DATAGRAM_HEADER_SIZE, len(data), FRAME_SIZE)]
+	return seq, flags, (width, height), frames
+
+def _normalize(opcode, pointer, xcoord, ycoord):
+	'''
+	Converts the fields of an event into what the frame format takes:
+	integer opcodes become characters, pointer numbers are taken modulo 256
+	and coordinates are clamped into the 16-bit range.
+	'''
+	if isinstance(opcode, (int, long)):
+		opcode = chr(opcode)
+	if isinstance(pointer, basestring):
+		pointer = ord(pointer)
+	xcoord = min(max(int(xcoord), 0), MAX_COORD)
+	ycoord = min(max(int(ycoord), 0), MAX_COORD)
+	return opcode, pointer % 256, xcoord, ycoord
+
+def encode_frame(opcode, pointer, xcoord=0, ycoord=0):
+	'''Encodes a single command as a 6 byte vinput frame'''
+	try:
+		return _FRAME.pack(opcode, pointer, xcoord, ycoord)
+	except struct.error:
+		return _FRAME.pack(*_normalize(opcode, pointer, xcoord, ycoord))
+
+def encode_frame_into(buf, offset, opcode, pointer, xcoord=0, ycoord=0):
+	'''Encodes a single command into a writable buffer at offset'''
+	try:
+		_FRAME.pack_into(buf, offset, opcode, pointer, xcoord, ycoord)
+	except struct.error:
+		_FRAME.pack_into(buf, offset,
+		                 *_normalize(opcode, pointer, xcoord, ycoord))
+
+def decode_frame(data, offset=0):
+	'''Returns the (opcode, pointer, x, y) tuple of the frame at offset'''
+	return _FRAME.unpack_from(data, offset)
+
+def decode_frames(data, offset=0, end=None):
+	'''
+	decode_frames(data, [offset, [end]]) -> list of (opcode, pointer, x, y)
+	Decodes all complete frames between offset and end (default: the end
+	of data) with one struct call per _DECODE_CHUNK frames.
+	'''
+	if end is None:
+		end = len(data)
+	count = (end - offset)//FRAME_SIZE
+	frames = []
+	while count > 0:
+		chunk = min(count, _DECODE_CHUNK)
+		decoder = _decoders.get(chunk)
+		if decoder is None:
+			decoder = _decoders[chunk] = struct.Struct('!' + 'cBHH'*chunk)
+		fields = decoder.unpack_from(data, offset)
+		frames.extend(zip(fields[0::4], fields[1::4], fields[2::4],
+		                  fields[3::4]))
+		offset += chunk*FRAME_SIZE
+		count -= chunk
+	return frames
+
+class FrameEncoder(object):
+	'''
+	FrameEncoder([capacity]) -> encoder for batches of vinput frames.
+
+	The frames are packed into a buffer which is reused for every batch, so
+	encoding does not allocate a string per frame. capacity is the number of
+	frames the buffer initially has room for; it grows when needed.
+	'''
+
+	__slots__ = ('_buffer', '_view')
+
+	def __init__(self, capacity=256):
+		self._buffer = bytearray(capacity*FRAME_SIZE)
+		self._view = memoryview(self._buffer)
+
+	def encode(self, events):
+		'''
+		x.encode(events) -> memoryview
+		Encodes a sequence of (opcode, pointer, x, y) tuples. The result
+		points into the encoder's buffer and is only valid until the next
+		call.
+		'''
+		size = len(events)*FRAME_SIZE
+		if size > len(self._buffer):
+			self._buffer = bytearray(max(size, 2*len(self._buffer)))
+			self._view = memoryview(self._buffer)
+		buf, pack_into = self._buffer, _FRAME.pack_into
+		offset = 0
+		for event in events:
+			try:
+				pack_into(buf, offset, *event)
+			except struct.error:
+				pack_into(buf, offset, *_normalize(*event))
+			offset += FRAME_SIZE
+		return self._view[:size]
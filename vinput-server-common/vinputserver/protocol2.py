@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Version 2 of the vinput wire protocol.
+
+ Every client is greeted with the version 1 HELO and gets version 1 frames
+ (see protocol.py), so old clients keep working unchanged. A client that
+ understands version 2 sends a request right after connecting:
+
+  request: "#2", version (8 bit), requested capabilities (8 bit)
+
+ The server answers at the next frame boundary of the stream with
+
+  HELO2:   "#2", version (8 bit), granted capabilities (8 bit),
+           16-bit width, 16-bit height
+
+ (the requested capabilities the server supports, see CAPABILITIES)
+
+ ('#' is no valid opcode, so the client recognizes it among the 6 byte
+ frames) and from then on sends packets. A packet carries the events the
+ server writes at once, i.e. one or more frames of the input source:
+
+  flags (8 bit): PACKET_TIMESTAMP, PACKET_PRESSURE
+  count (8 bit): number of events
+  [timestamp]:   32-bit milliseconds since the HELO2, if PACKET_TIMESTAMP
+  count times:   opcode character, pointer number, x and y as zigzag
+                 varints relative to the last position sent for the
+                 pointer (0, 0 for a new pointer), [pressure (8 bit), if
+                 PACKET_PRESSURE]
+
+ All multi-byte fields are big-endian. Motion of a few pixels takes 4 bytes
+ per pointer instead of 6.
+
+ The server sends a new HELO2 between two packets when the client's
+ coordinate range changes (a region or transform request); the positions
+ of all pointers start from 0, 0 again after it. No flags byte starts
+ with '#', so the client recognizes it like the first one. Gesture
+ frames (see gestures.py) come between two packets as well. DeltaDecoder
+ does all of this on the client side.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import struct
+
+from vinputserver.protocol import FRAME_SIZE, HELO_MAGIC, MAX_COORD, \
+                                  decode_frame
+from vinputserver.gestures import GESTURE_MAGIC, GESTURE_SIZE, decode_gesture
+
+PROTOCOL_VERSION = 2
+HELO2_MAGIC = '#2'
+
+# Capabilities a client may request
+CAP_TIMESTAMP = 0x01
+CAP_PRESSURE = 0x02
+# Capabilities the server grants. No input source gives its events a
+# pressure yet, so CAP_PRESSURE is only encoded and decoded, not granted.
+CAPABILITIES = CAP_TIMESTAMP
+
+# Packet flags; the same bits as the capabilities
+PACKET_TIMESTAMP = CAP_TIMESTAMP
+PACKET_PRESSURE = CAP_PRESSURE
+
+_REQUEST = struct.Struct('!2sBB')
+_HELO2 = struct.Struct('!2sBBHH')
+_PACKET_HEADER = struct.Struct('!BB')
+_TIMESTAMP = struct.Struct('!I')
+
+REQUEST_SIZE = _REQUEST.size
+HELO2_SIZE = _HELO2.size
+# Events in one packet
+MAX_PACKET_EVENTS = 0xff
+
+def encode_request(capabilities, version=PROTOCOL_VERSION):
+	'''Returns the request a client sends to switch to version 2'''
+	return _REQUEST.pack(HELO2_MAGIC, version, capabilities)
+
+def decode_request(data, offset=0):
+	'''
+	decode_request(data, [offset]) -> (version, capabilities)
+	Raises ValueError if data is no request.
+	'''
+	magic, version, capabilities = _REQUEST.unpack_from(data, offset)
+	if magic != HELO2_MAGIC:
+		raise ValueError, 'invalid request magic %r' % magic
+	return version, capabilities
+
+def encode_helo2(capabilities, width, height):
+	'''Returns the HELO2 granting the given capabilities'''
+	return _HELO2.pack(HELO2_MAGIC, PROTOCOL_VERSION, capabilities, width,
+	                   height)
+
+def decode_helo2(data, offset=0):
+	'''
+	decode_helo2(data, [offset]) -> (version, capabilities, (width, height))
+	Raises ValueError if data is no HELO2.
+	'''
+	magic, version, capabilities, width, height = \
+		_HELO2.unpack_from(data, offset)
+	if magic != HELO2_MAGIC:
+		raise ValueError, 'invalid HELO2 magic %r' % magic
+	return version, capabilities, (width, height)
+
+def _append_varint(buf, value):
+	'''Appends a signed integer as zigzag varint to a bytearray'''
+	value = (value << 1) ^ (value >> 63)
+	while value >= 0x80:
+		buf.append((value & 0x7f) | 0x80)
+		value >>= 7
+	buf.append(value)
+
+def _read_varint(data, offset):
+	'''Returns the zigzag varint at offset and the offset behind it'''
+	result = shift = 0
+	while True:
+		byte = ord(data[offset])
+		offset += 1
+		result |= (byte & 0x7f) << shift
+		if byte < 0x80:
+			break
+		shift += 7
+	return (result >> 1) ^ -(result & 1), offset
+
+class DeltaEncoder(object):
+	'''
+	DeltaEncoder(capabilities, [start]) -> encoder of the packets of one
+	client. It remembers the last position of every pointer, so it must see
+	every event sent to the client.
+
+	 capabilities: granted capabilities (CAP_TIMESTAMP, CAP_PRESSURE)
+	 start: time of the HELO2 (seconds); timestamps count from there
+	'''
+
+	__slots__ = ('capabilities', 'start', '_positions')
+
+	def __init__(self, capabilities, start=0.0):
+		self.capabilities = capabilities
+		self.start = start
+		self._positions = {}
+
+	def encode(self, events, now=None):
+		'''
+		x.encode(events, [now]) -> bytearray
+		Encodes (opcode, pointer, x, y) tuples; a fifth element is the
+		pressure (0 if missing). now is the time for the timestamp.
+		'''
+		buf = bytearray()
+		flags = self.capabilities
+		positions = self._positions
+		for start in xrange(0, len(events), MAX_PACKET_EVENTS):
+			chunk = events[start:start+MAX_PACKET_EVENTS]
+			buf += _PACKET_HEADER.pack(flags, len(chunk))
+			if flags & PACKET_TIMESTAMP:
+				buf += _TIMESTAMP.pack(int(((now or 0) - self.start)*1000)
+				                       & 0xffffffff)
+			for event in chunk:
+				opcode, pointer, xcoord, ycoord = event[:4]
+				if isinstance(opcode, (int, long)):
+					opcode = chr(opcode)
+				pointer &= 0xff
+				xcoord = min(max(int(xcoord), 0), MAX_COORD)
+				ycoord = min(max(int(ycoord), 0), MAX_COORD)
+				last = positions.get(pointer, (0, 0))
+				buf += opcode
+				buf.append(pointer)
+				_append_varint(buf, xcoord - last[0])
+				_append_varint(buf, ycoord - last[1])
+				positions[pointer] = (xcoord, ycoord)
+				if flags & PACKET_PRESSURE:
+					buf.append(min(max(int(event[4]), 0), 0xff)
+					           if len(event) > 4 else 0)
+		return buf
+
+	def positions(self):
+		'''x.positions() -> list of (pointer, x, y) last sent to the client'''
+		return [(pointer, pos[0], pos[1])
+		        for pointer, pos in self._positions.iteritems()]
+
+	def restore(self, positions):
+		'''x.restore(positions) - continues from positions() of another encoder'''
+		for pointer, xcoord, ycoord in positions:
+			self._positions[pointer] = (xcoord, ycoord)
+
+class DeltaDecoder(object):
+	'''
+	DeltaDecoder() -> decoder of the stream a client gets after sending a
+	request: the HELO, the version 1 frames up to the HELO2, the HELO2 and
+	the packets after it, including any later HELO2.
+
+	feed() takes any pieces of the stream and returns everything complete,
+	in order, as (magic, value) pairs:
+
+	 (HELO_MAGIC, (width, height)) for a HELO
+	 (HELO2_MAGIC, (version, capabilities, (width, height))) for a HELO2
+	 (GESTURE_MAGIC, (phase, touches, x, y, scale, rotation, xspeed,
+	   yspeed)) for a gesture frame (see vinputserver.gestures)
+	 (None, (timestamp or None, [(opcode, pointer, x, y, pressure), ...]))
+	   for a packet; pressure is None unless the packet carries it. Each
+	   version 1 frame comes as a packet of its own.
+
+	version, capabilities and resolution follow the last HELO or HELO2.
+	Raises ValueError if the stream is no vinput stream.
+	'''
+
+	def __init__(self):
+		self._buffer = ''
+		self._positions = {}
+		# Protocol version of the stream; None before the HELO
+		self.version = None
+		self.capabilities = 0
+		self.resolution = None
+
+	def feed(self, data):
+		'''x.feed(data) -> list of (magic, value)'''
+		data = self._buffer + data
+		decoded = []
+		offset = 0
+		while offset < len(data):
+			try:
+				item, end = self._decode(data, offset)
+			except (IndexError, struct.error):
+				# Incomplete
+				break
+			decoded.append(item)
+			offset = end
+		self._buffer = data[offset:]
+		return decoded
+
+	def _decode(self, data, offset):
+		'''Decodes what starts at offset; the state changes only if complete'''
+		if data[offset] == '#':
+			magic = data[offset:offset+2]
+			if magic == HELO2_MAGIC:
+				helo2 = decode_helo2(data, offset)
+				self.version, self.capabilities, self.resolution = helo2
+				# The server starts a new DeltaEncoder with every HELO2
+				self._positions = {}
+				return (magic, helo2), offset + HELO2_SIZE
+			if magic == HELO_MAGIC and self.version != PROTOCOL_VERSION:
+				resolution = decode_frame(data, offset)[2:]
+				self.version, self.capabilities = 1, 0
+				self.resolution = resolution
+				return (magic, resolution), offset + FRAME_SIZE
+			if magic == GESTURE_MAGIC and self.version is not None:
+				return (magic, decode_gesture(data, offset)), \
+				       offset + GESTURE_SIZE
+			if len(magic) < 2:
+				raise IndexError, 'incomplete'
+			raise ValueError, 'unexpected %r in the stream' % magic
+		if self.version is None:
+			raise ValueError, 'stream does not start with a HELO'
+		if self.version == 1:
+			opcode, pointer, xcoord, ycoord = decode_frame(data, offset)
+			return (None, (None, [(opcode, pointer, xcoord, ycoord, None)])), \
+			       offset + FRAME_SIZE
+		return self._decode_packet(data, offset)
+
+	def _decode_packet(self, data, offset):
+		'''Decodes the packet at offset; positions change only if complete'''
+		flags, count = _PACKET_HEADER.unpack_from(data, offset)
+		offset += _PACKET_HEADER.size
+		timestamp = None
+		if flags & PACKET_TIMESTAMP:
+			timestamp = _TIMESTAMP.unpack_from(data, offset)[0]
+			offset += _TIMESTAMP.size
+		positions = dict(self._positions)
+		events = []
+		for _ in xrange(count):
+			opcode = data[offset]
+			pointer = ord(data[offset+1])
+			dx, offset = _read_varint(data, offset+2)
+			dy, offset = _read_varint(data, offset)
+			last = positions.get(pointer, (0, 0))
+			xcoord, ycoord = last[0] + dx, last[1] + dy
+			positions[pointer] = (xcoord, ycoord)
+			pressure = None
+			if flags & PACKET_PRESSURE:
+				pressure = ord(data[offset])
+				offset += 1
+			events.append((opcode, pointer, xcoord, ycoord, pressure))
+		self._positions = positions
+		return (None, (timestamp, events)), offset
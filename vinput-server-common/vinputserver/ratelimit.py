@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Per-client limits of the motion update rate.
+
+ A client that cannot use every motion frame (a projector refreshing at
+ 30 Hz fed by a 200 Hz tracker) or sits behind a slow link may limit the
+ updates it gets by sending a rate request, at any time:
+
+  request: "#F", 16-bit maximum number of updates per second (0: infer
+           the rate from how fast the client takes its data)
+
+ The server then writes motion to the client only once per tick, with the
+ pending motion of every pointer coalesced to its newest position. Touches
+ and releases ('d', 'u', 'D', 'U') are written at once, together with the
+ motion before them. The server answers nothing; the frames stay the same.
+
+ An inferred rate starts at MAX_RATE. Whenever the client's socket fills
+ up, the speed at which it drains the backlog is measured and the rate is
+ set to the number of updates of the average size it can take in a
+ second; while it keeps up, the rate grows again by RATE_INCREASE per
+ second.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import struct
+
+RATE_MAGIC = '#F'
+
+_RATE_REQUEST = struct.Struct('!2sH')
+RATE_REQUEST_SIZE = _RATE_REQUEST.size
+
+# Bounds of inferred rates (updates per second); inferred rates start at
+# the maximum
+MIN_RATE = 10
+MAX_RATE = 1000
+# Share of the measured drain speed an inferred rate uses
+DRAIN_HEADROOM = 0.8
+# Factor by which an inferred rate grows per second the client keeps up
+RATE_INCREASE = 1.25
+# Weight of the newest update in the average update size
+_SIZE_SMOOTHING = 0.2
+
+def encode_rate_request(rate):
+	'''Returns the request a client sends to limit its updates per second'''
+	return _RATE_REQUEST.pack(RATE_MAGIC, rate)
+
+def decode_rate_request(data, offset=0):
+	'''
+	decode_rate_request(data, [offset]) -> updates per second (0: infer)
+	Raises ValueError if data is no rate request.
+	'''
+	magic, rate = _RATE_REQUEST.unpack_from(data, offset)
+	if magic != RATE_MAGIC:
+		raise ValueError, 'invalid rate request magic %r' % magic
+	return rate
+
+class RateLimit(object):
+	'''
+	RateLimit([rate]) -> tick schedule of a rate limited client.
+
+	 rate: maximum updates per second the client declared; 0 or None
+	       infers it from its drain speed
+
+	The server writes pending motion when due() and calls tick() after
+	each update; it reports with behind() and caught_up() when the
+	client's socket fills up and when the backlog is written.
+	'''
+
+	__slots__ = ('rate', 'adaptive', 'next_tick', 'update_size',
+	             '_behind_bytes')
+
+	def __init__(self, rate=None):
+		self.adaptive = not rate
+		self.rate = float(rate or MAX_RATE)
+		self.next_tick = 0.0
+		# Average bytes of an update; None before the first one
+		self.update_size = None
+		self._behind_bytes = None
+
+	def __repr__(self):
+		return '<RateLimit %.1f/s%s>' % (self.rate,
+		                                 ' inferred' if self.adaptive else '')
+
+	def due(self, now):
+		'''Returns whether the next update may be written at now'''
+		return now >= self.next_tick
+
+	def timeout(self, now):
+		'''Returns the seconds until the next update may be written'''
+		return max(self.next_tick - now, 0.0)
+
+	def tick(self, now, size, keeping_up=True):
+		'''
+		x.tick(now, size, [keeping_up])
+		Schedules the next update after one of size bytes was written at
+		now; an inferred rate grows if the client is keeping up.
+		'''
+		self.next_tick = now + 1.0/self.rate
+		if self.update_size is None:
+			self.update_size = float(size)
+		else:
+			self.update_size += _SIZE_SMOOTHING*(size - self.update_size)
+		if self.adaptive and keeping_up:
+			# One tick's share of the growth per second
+			self.rate = min(self.rate*RATE_INCREASE**(1.0/self.rate), MAX_RATE)
+
+	def behind(self, sent):
+		'''Notes that the client fell behind after sent bytes in total'''
+		self._behind_bytes = sent
+
+	def caught_up(self, elapsed, sent):
+		'''
+		x.caught_up(elapsed, sent)
+		Notes that the client took its backlog within elapsed seconds,
+		with sent bytes in total; an inferred rate follows its drain speed.
+		'''
+		start, self._behind_bytes = self._behind_bytes, None
+		if not self.adaptive or start is None or not self.update_size or \
+		   elapsed <= 0:
+			return
+		speed = (sent - start)/elapsed
+		self.rate = max(MIN_RATE, min(MAX_RATE, speed/self.update_size
+		                                         *DRAIN_HEADROOM))
+
+	def export(self):
+		'''Returns the state for a handoff (see RateLimit.adopt())'''
+		return self.rate, self.adaptive
+
+	@classmethod
+	def adopt(cls, state):
+		'''RateLimit.adopt(state) -> RateLimit restored from export()'''
+		rate, adaptive = state
+		limit = cls(0 if adaptive else rate)
+		limit.rate = float(rate)
+		return limit
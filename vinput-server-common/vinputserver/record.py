@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Binary recordings of the frames a device server sends.
+
+ A recording is a sequence of records (network byte order):
+  session start: "#VR1", width, height (16 bit each); the time offsets of
+                 the following batches count from here
+  resolution:    "R", width, height; the announced resolution changed
+  batch:         "B", 64-bit time offset in microseconds (monotonic clock),
+                 16-bit number of frames, followed by the 6 byte frames
+
+ Every time a server opens the file a new session is appended. SessionReader
+ maps the file with mmap, so long sessions are never loaded as a whole.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import mmap, os, struct
+
+from vinputserver.common import monotonic
+from vinputserver.protocol import FRAME_SIZE, FrameEncoder, decode_frame
+
+SESSION_MAGIC = '#VR1'
+
+_SESSION = struct.Struct('!4sHH')
+_RESOLUTION = struct.Struct('!cHH')
+_BATCH = struct.Struct('!cQH')
+
+# Frames in one batch record
+_MAX_BATCH_FRAMES = 0xffff
+
+class SessionRecorder(object):
+	'''
+	SessionRecorder(path) -> appends the frames given to record() to a
+	recording, starting a new session.
+
+	Output threads call record() from their own thread when their recorder
+	attribute is set.
+	'''
+
+	def __init__(self, path):
+		self.path = path
+		self._file = open(path, 'ab')
+		self._encoder = FrameEncoder()
+		self._start = None
+		self._resolution = None
+
+	def record(self, events, resolution):
+		'''
+		x.record(events, resolution)
+		Appends a batch of (opcode, pointer, x, y) events with the current
+		time; resolution is the one announced to the clients.
+		'''
+		now = monotonic()
+		resolution = tuple(resolution)
+		write = self._file.write
+		if self._start is None:
+			self._start = now
+			write(_SESSION.pack(SESSION_MAGIC, *resolution))
+		elif resolution != self._resolution:
+			write(_RESOLUTION.pack('R', *resolution))
+		self._resolution = resolution
+		offset = int((now - self._start)*1e6)
+		for start in xrange(0, len(events), _MAX_BATCH_FRAMES):
+			chunk = events[start:start+_MAX_BATCH_FRAMES]
+			write(_BATCH.pack('B', offset, len(chunk)))
+			write(self._encoder.encode(chunk))
+
+	def close(self):
+		'''x.close() - writes out and closes the recording'''
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+
+class SessionReader(object):
+	'''
+	SessionReader(path) -> reader of a recording made by SessionRecorder.
+
+	Iterating over it yields (session, time offset in seconds, resolution,
+	frames) for every batch; session counts the sessions from 0. A
+	truncated last record (a server that was killed) is ignored.
+	'''
+
+	def __init__(self, path):
+		fd = os.open(path, os.O_RDONLY)
+		try:
+			size = os.fstat(fd).st_size
+			# mmap can not map empty files
+			self._mm = mmap.mmap(fd, size, access=mmap.ACCESS_READ) \
+			           if size else ''
+		finally:
+			os.close(fd)
+		if self._mm[:len(SESSION_MAGIC)] != SESSION_MAGIC:
+			self.close()
+			raise ValueError, 'not a vinput recording: %s' % path
+
+	def close(self):
+		if not isinstance(self._mm, str):
+			self._mm.close()
+		self._mm = ''
+
+	def __iter__(self):
+		mm = self._mm
+		size = len(mm)
+		position = 0
+		session = -1
+		resolution = None
+		while position < size:
+			kind = mm[position]
+			if kind == SESSION_MAGIC[0]:
+				if position + _SESSION.size > size:
+					return
+				magic, width, height = _SESSION.unpack_from(mm, position)
+				if magic != SESSION_MAGIC:
+					raise ValueError, 'invalid record at byte %i' % position
+				session += 1
+				resolution = (width, height)
+				position += _SESSION.size
+			elif kind == 'R':
+				if position + _RESOLUTION.size > size:
+					return
+				resolution = _RESOLUTION.unpack_from(mm, position)[1:]
+				position += _RESOLUTION.size
+			elif kind == 'B':
+				if position + _BATCH.size > size:
+					return
+				kind, offset, count = _BATCH.unpack_from(mm, position)
+				position += _BATCH.size
+				end = position + count*FRAME_SIZE
+				if end > size:
+					return
+				yield session, offset/1e6, resolution, \
+				      [decode_frame(mm, start) for start
+				       in xrange(position, end, FRAME_SIZE)]
+				position = end
+			else:
+				raise ValueError, 'invalid record at byte %i' % position
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Region subscriptions: clients that only get the events of a rectangle.
+
+ A client subscribes by sending a region request to the server, at any
+ time but only once:
+
+  request: "#R", 16-bit x, y, width and height of the rectangle (in the
+           coordinates of the server's HELO), 16-bit output width and
+           height (0, 0: the size of the rectangle)
+
+ The server answers at the next frame boundary with a new HELO (HELO2 for
+ version 2 clients) announcing the output resolution. From then on the
+ client only gets the events inside its rectangle, translated and scaled
+ to the output resolution. A pointer that leaves the rectangle while
+ touching gets a 'u' at the edge; one that enters while touching gets a
+ '.' and a 'd' there, so every client sees complete touches.
+
+ RegionRouter decides which events go to which client through a grid of
+ cells over the surface, each listing the regions overlapping it, so an
+ event only has to be checked against the regions in its cell. Clients
+ subscribed to equal regions share a group, whose events are routed and
+ encoded once for all of them.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import struct
+
+REGION_MAGIC = '#R'
+
+_REGION_REQUEST = struct.Struct('!2sHHHHHH')
+REGION_REQUEST_SIZE = _REGION_REQUEST.size
+
+# Cells of the grid index per axis
+GRID_CELLS = 16
+
+def encode_region_request(x, y, width, height, out_width=0, out_height=0):
+	'''Returns the request a client sends to subscribe to a rectangle'''
+	return _REGION_REQUEST.pack(REGION_MAGIC, x, y, width, height, out_width,
+	                            out_height)
+
+def decode_region_request(data, offset=0):
+	'''
+	decode_region_request(data, [offset]) -> Region
+	Raises ValueError if data is no valid region request.
+	'''
+	magic, x, y, width, height, out_width, out_height = \
+		_REGION_REQUEST.unpack_from(data, offset)
+	if magic != REGION_MAGIC:
+		raise ValueError, 'invalid region request magic %r' % magic
+	return Region(x, y, width, height, out_width, out_height)
+
+class Region(object):
+	'''
+	Region(x, y, width, height, [out_width, out_height]) -> a rectangle of
+	the surface and the resolution its events are scaled to.
+
+	Regions with the same rectangle and resolution compare equal.
+	'''
+
+	__slots__ = ('x', 'y', 'width', 'height', 'resolution', '_right',
+	             '_bottom', '_sx', '_sy', '_key')
+
+	def __init__(self, x, y, width, height, out_width=0, out_height=0):
+		if width <= 0 or height <= 0:
+			raise ValueError, 'empty region'
+		self.x, self.y = x, y
+		self.width, self.height = width, height
+		self.resolution = (out_width or width, out_height or height)
+		self._right, self._bottom = x + width - 1, y + height - 1
+		self._sx = self.resolution[0]/float(width)
+		self._sy = self.resolution[1]/float(height)
+		self._key = (x, y, width, height) + self.resolution
+
+	def __eq__(self, other):
+		return isinstance(other, Region) and self._key == other._key
+
+	def __ne__(self, other):
+		return not self == other
+
+	def __hash__(self):
+		return hash(self._key)
+
+	def __repr__(self):
+		return 'Region(%i, %i, %i, %i, %i, %i)' % self._key
+
+	def contains(self, xcoord, ycoord):
+		'''Returns True if the point lies inside the rectangle'''
+		return self.x <= xcoord <= self._right and \
+		       self.y <= ycoord <= self._bottom
+
+	def transform(self, xcoord, ycoord):
+		'''
+		x.transform(xcoord, ycoord) -> (x, y)
+		Maps a point into the output resolution; points outside are moved
+		onto the nearest edge first.
+		'''
+		xcoord = min(max(xcoord, self.x), self._right)
+		ycoord = min(max(ycoord, self.y), self._bottom)
+		return int((xcoord - self.x)*self._sx), int((ycoord - self.y)*self._sy)
+
+class _Group(object):
+	'''Subscribers of equal regions that get the same events'''
+
+	__slots__ = ('region', 'subscribers')
+
+	def __init__(self, region):
+		self.region = region
+		self.subscribers = []
+
+	def __repr__(self):
+		return '<group of %i on %r>' % (len(self.subscribers), self.region)
+
+class RegionRouter(object):
+	'''
+	RegionRouter(resolution) -> index of the subscribed regions.
+
+	Subscribers are arbitrary hashable objects (the server's clients).
+	Those of equal regions are routed as one group: route() takes a batch
+	of events and returns, for every group that gets any of them, the list
+	of its transformed events; group() tells the group of a subscriber.
+	'''
+
+	def __init__(self, resolution):
+		self.resolution = tuple(resolution)
+		# subscriber -> its group
+		self._groups = {}
+		# pointer number -> groups it is touching inside the region of
+		self._holders = {}
+		# Pointer numbers that are touching anywhere
+		self._down = set()
+		# Grid cell -> (group, bounds, scale) of the regions overlapping
+		# it; group -> the same tuple; grid cell -> the tuple of the only
+		# region covering all of it, or None
+		self._grid = self._bounds = self._exclusive = None
+
+	def __len__(self):
+		return len(self._groups)
+
+	def group(self, subscriber):
+		'''Returns the group of a subscriber (the key of route()) or None'''
+		return self._groups.get(subscriber)
+
+	def subscribe(self, subscriber, region):
+		'''Adds a subscriber getting the events inside region'''
+		self.unsubscribe(subscriber)
+		held = set()
+		for holders in self._holders.itervalues():
+			held.update(holders)
+		# A group in which a pointer is touching already had its 'd'; the
+		# new subscriber has to get one when the pointer moves
+		for group in self._groups.itervalues():
+			if group.region == region and group not in held:
+				break
+		else:
+			group = _Group(region)
+			self._grid = None
+		group.subscribers.append(subscriber)
+		self._groups[subscriber] = group
+
+	def unsubscribe(self, subscriber):
+		'''Removes a subscriber; unknown ones are ignored'''
+		group = self._groups.pop(subscriber, None)
+		if group is not None:
+			group.subscribers.remove(subscriber)
+			if not group.subscribers:
+				for holders in self._holders.itervalues():
+					holders.discard(group)
+				self._grid = None
+
+	def _cell(self, xcoord, ycoord):
+		'''Returns the index of the grid cell containing a point'''
+		width, height = self.resolution
+		col = min(max(int(xcoord)*GRID_CELLS//max(width, 1), 0), GRID_CELLS - 1)
+		row = min(max(int(ycoord)*GRID_CELLS//max(height, 1), 0), GRID_CELLS - 1)
+		return row*GRID_CELLS + col
+
+	def _build(self):
+		'''Lists the regions overlapping every grid cell'''
+		cells = GRID_CELLS*GRID_CELLS
+		grid = [[] for _ in xrange(cells)]
+		bounds = {}
+		for group in set(self._groups.itervalues()):
+			region = group.region
+			entry = bounds[group] = (group, region.x, region.y,
+				region._right, region._bottom, region._sx, region._sy)
+			first = self._cell(region.x, region.y)
+			last = self._cell(region._right, region._bottom)
+			for row in xrange(first//GRID_CELLS, last//GRID_CELLS + 1):
+				for col in xrange(first % GRID_CELLS, last % GRID_CELLS + 1):
+					grid[row*GRID_CELLS + col].append(entry)
+		# Cells lying within one region and no other, where route() needs
+		# no bounds checks (route() finds the cell of x at
+		# int(x*GRID_CELLS/width))
+		width = max(self.resolution[0], 1)/float(GRID_CELLS)
+		height = max(self.resolution[1], 1)/float(GRID_CELLS)
+		exclusive = [None]*cells
+		for cell in xrange(cells):
+			if len(grid[cell]) == 1:
+				entry = grid[cell][0]
+				row, col = divmod(cell, GRID_CELLS)
+				if entry[1] <= col*width and (col + 1)*width <= entry[3] and \
+				   entry[2] <= row*height and (row + 1)*height <= entry[4]:
+					exclusive[cell] = entry
+		self._grid = grid
+		self._bounds = bounds
+		self._exclusive = exclusive
+
+	def route(self, events, resolution=None):
+		'''
+		x.route(events, [resolution]) -> {group: [event, ...]}
+		Distributes (opcode, pointer, x, y) tuples to the groups.
+		resolution is the current coordinate range of the events; the grid
+		is rebuilt when it changes.
+		'''
+		if resolution is not None and tuple(resolution) != self.resolution:
+			self.resolution = tuple(resolution)
+			self._grid = None
+		if self._grid is None:
+			self._build()
+		# The same as Region.contains() and Region.transform(), inlined
+		grid, bounds = self._grid, self._bounds
+		exclusive = self._exclusive
+		down, holders_of = self._down, self._holders
+		colscale = GRID_CELLS/float(max(self.resolution[0], 1))
+		rowscale = GRID_CELLS/float(max(self.resolution[1], 1))
+		last = GRID_CELLS - 1
+		routed = {}
+		for opcode, pointer, xcoord, ycoord in events:
+			col = int(xcoord*colscale)
+			row = int(ycoord*rowscale)
+			if 0 <= col <= last and 0 <= row <= last:
+				cell = row*GRID_CELLS + col
+				entry = exclusive[cell]
+				if entry is not None and opcode == '.' and \
+				   xcoord >= 0 and ycoord >= 0:
+					# Most motion: inside a cell of a single region, by a
+					# pointer touching only there or not touching at all
+					group = entry[0]
+					holders = holders_of.get(pointer)
+					if (len(holders) == 1 and group in holders) if holders \
+					   else pointer not in down:
+						event = ('.', pointer, int((xcoord - entry[1])*entry[5]),
+						         int((ycoord - entry[2])*entry[6]))
+						target = routed.get(group)
+						if target is None:
+							routed[group] = [event]
+						else:
+							target.append(event)
+						continue
+			else:
+				cell = min(max(row, 0), last)*GRID_CELLS + min(max(col, 0), last)
+			if not isinstance(opcode, str):
+				opcode = chr(opcode)
+			holders = holders_of.get(pointer)
+			if holders:
+				leaving = None
+				for group in holders:
+					_, left, top, right, bottom, sx, sy = bounds[group]
+					if not (left <= xcoord <= right and top <= ycoord <= bottom):
+						if leaving is None:
+							leaving = []
+						leaving.append((group, 'u', pointer,
+							int((min(max(xcoord, left), right) - left)*sx),
+							int((min(max(ycoord, top), bottom) - top)*sy)))
+				if leaving:
+					# Left the region while touching (or released outside):
+					# release at the edge
+					for event in leaving:
+						holders.discard(event[0])
+						routed.setdefault(event[0], []).append(event[1:])
+			elif holders is None:
+				holders = holders_of[pointer] = set()
+			pressed = opcode in 'dD'
+			released = not pressed and opcode in 'uU'
+			touching = opcode == '.' and pointer in down
+			for group, left, top, right, bottom, sx, sy in grid[cell]:
+				if not (left <= xcoord <= right and top <= ycoord <= bottom):
+					continue
+				event = (opcode, pointer, int((xcoord - left)*sx),
+				         int((ycoord - top)*sy))
+				target = routed.get(group)
+				if target is None:
+					target = routed[group] = [event]
+				else:
+					target.append(event)
+				if pressed:
+					holders.add(group)
+				elif released:
+					holders.discard(group)
+				elif touching and group not in holders:
+					# Entered the region while touching
+					target.append(('d',) + event[1:])
+					holders.add(group)
+			if pressed:
+				down.add(pointer)
+			elif released:
+				down.discard(pointer)
+		return routed
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Relay merging the streams of several vinput servers into one.
+
+ Relay connects as a client to each upstream server, maps the pointer
+ numbers of all upstreams onto one pointer number space, rescales the
+ coordinates from the resolution each upstream announced in its HELO to
+ the output resolution and hands the merged events to an output thread,
+ one batch per poll round. Lost upstreams are reconnected; their pointers
+ are released.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import errno, select, socket, time
+
+from vinputserver.common import debug_output
+from vinputserver.cursorids import CursorIdAllocator
+from vinputserver.protocol import FRAME_SIZE, HELO_MAGIC, decode_frame
+
+# Seconds between two connection attempts to a lost upstream
+RECONNECT_INTERVAL = 1.0
+# Seconds between two checks for lost pointers
+RECLAIM_INTERVAL = 1.0
+
+_POLLIN = select.POLLIN | select.POLLPRI
+
+class Upstream(object):
+	'''
+	Upstream(index, addr, family) -> connection to one upstream server.
+
+	resolution is None until the HELO came in; pointers maps the pointer
+	numbers of the upstream that are in use to their last scaled position.
+	'''
+
+	def __init__(self, index, addr, family):
+		self.index = index
+		self.addr = addr
+		self.family = family
+		self.sock = None
+		self.connecting = False
+		self.resolution = None
+		self.scale = None
+		self.pointers = {}
+		self.frames = 0
+		self.connects = 0
+		self._buffer = ''
+		self._next_connect = 0
+
+	def name(self):
+		'''Returns a printable name of the upstream'''
+		if self.family == socket.AF_UNIX:
+			return 'unix:' + self.addr.replace('\0', '@')
+		return '[%s]:%i' % self.addr[:2]
+
+	def connect(self):
+		'''Starts a non-blocking connection attempt'''
+		self._next_connect = time.time() + RECONNECT_INTERVAL
+		self.sock = socket.socket(self.family, socket.SOCK_STREAM)
+		self.sock.setblocking(0)
+		err = self.sock.connect_ex(self.addr)
+		if err not in (0, errno.EINPROGRESS, errno.EAGAIN):
+			debug_output('cannot connect to %s: %s' % (self.name(),
+			                                          errno.errorcode.get(err, err)))
+			self.sock.close()
+			self.sock = None
+			return
+		self.connecting = True
+		self._buffer = ''
+		self.resolution = self.scale = None
+
+	def due(self, now):
+		'''Returns True if the upstream should be connected again'''
+		return self.sock is None and now >= self._next_connect
+
+	def connected(self):
+		'''Finishes the connection attempt; returns False if it failed'''
+		self.connecting = False
+		err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+		if err:
+			debug_output('cannot connect to %s: %s' % (self.name(),
+			                                          errno.errorcode.get(err, err)))
+			return False
+		self.connects += 1
+		debug_output('connected to %s' % self.name())
+		return True
+
+	def feed(self, data, resolution):
+		'''
+		x.feed(data, resolution) -> list of (opcode, pointer, x, y)
+		Takes received data and returns the complete frames. The HELO sets
+		the factors scaling the coordinates to resolution; raises ValueError
+		if the stream does not start with one.
+		'''
+		data = self._buffer + data
+		offset = 0
+		if self.resolution is None:
+			if len(data) < FRAME_SIZE:
+				self._buffer = data
+				return []
+			if data[:2] != HELO_MAGIC:
+				raise ValueError, 'no vinput HELO from %s' % self.name()
+			self.resolution = decode_frame(data)[2:]
+			self.scale = (resolution[0]/float(max(self.resolution[0], 1)),
+			              resolution[1]/float(max(self.resolution[1], 1)))
+			debug_output('%s announces %ix%i' % ((self.name(),)
+			                                     + self.resolution))
+			offset = FRAME_SIZE
+		end = len(data) - (len(data) - offset) % FRAME_SIZE
+		frames = [decode_frame(data, pos) for pos in xrange(offset, end,
+		                                                   FRAME_SIZE)]
+		self._buffer = data[end:]
+		self.frames += len(frames)
+		return frames
+
+	def close(self):
+		'''Closes the connection; the next attempt follows after a while'''
+		if self.sock is not None:
+			self.sock.close()
+			self.sock = None
+		self.connecting = False
+
+class Relay(object):
+	'''
+	Relay(server, upstreams, cursorcount, [pointer_timeout]) -> relay of
+	several upstream servers to one output thread.
+
+	 server: output thread (or anything with send() and flush())
+	 upstreams: list of (address, family) of stream sockets
+	 cursorcount: size of the merged pointer number space
+	 pointer_timeout: milliseconds after which a pointer that got no more
+	                  events is released (0 or None: never)
+
+	The coordinates are scaled to server.resolution. run() relays until
+	stop() is called.
+	'''
+
+	def __init__(self, server, upstreams, cursorcount, pointer_timeout=None):
+		self.server = server
+		self.upstreams = [Upstream(index, addr, family) for index,
+		                  (addr, family) in enumerate(upstreams)]
+		self.cursorids = CursorIdAllocator(cursorcount,
+		                                   (pointer_timeout or 0)/1000.0)
+		self._running = True
+		self._next_reclaim = 0
+		# Upstream pointers (index, pointer) released by _release() whose
+		# events the clients have to get as a new touch
+		self._reclaimed = set()
+
+	def run(self):
+		'''Relays the events of the upstreams until stop() is called'''
+		poller = select.poll()
+		fdmap = {}
+		while self._running:
+			now = time.time()
+			for upstream in self.upstreams:
+				if upstream.due(now):
+					upstream.connect()
+					if upstream.sock is not None:
+						fdmap[upstream.sock.fileno()] = upstream
+						poller.register(upstream.sock, select.POLLOUT
+						                if upstream.connecting else _POLLIN)
+			try:
+				ready = poller.poll(RECONNECT_INTERVAL*1000)
+			except select.error, e:
+				if e.args[0] == errno.EINTR:
+					continue
+				raise
+			for fd, event in ready:
+				upstream = fdmap[fd]
+				if upstream.connecting:
+					if upstream.connected():
+						poller.modify(fd, _POLLIN)
+						continue
+				elif event & _POLLIN and self._receive(upstream):
+					continue
+				poller.unregister(fd)
+				del fdmap[fd]
+				self._lost(upstream)
+			now = time.time()
+			if now >= self._next_reclaim:
+				self._next_reclaim = now + RECLAIM_INTERVAL
+				self._release(self.cursorids.reclaim(now))
+			# Everything received in this round goes out as one batch
+			self.server.flush()
+		for upstream in self.upstreams:
+			upstream.close()
+
+	def stop(self):
+		'''Makes run() return after the current poll round'''
+		self._running = False
+
+	def _receive(self, upstream):
+		'''Relays the frames of a readable upstream; False if it is gone'''
+		try:
+			data = upstream.sock.recv(65536)
+		except socket.error, e:
+			if e.args[0] in (errno.EAGAIN, errno.EINTR):
+				return True
+			debug_output('%s: %s' % (upstream.name(), e.args[-1]))
+			return False
+		if not data:
+			return False
+		try:
+			frames = upstream.feed(data, self.server.resolution)
+		except ValueError, e:
+			debug_output(str(e))
+			return False
+		for frame in frames:
+			self._relay(upstream, *frame)
+		return True
+
+	def _relay(self, upstream, opcode, pointer, xcoord, ycoord):
+		'''Maps one event of an upstream into the merged stream'''
+		key = upstream.index, pointer
+		xcoord = int(xcoord*upstream.scale[0])
+		ycoord = int(ycoord*upstream.scale[1])
+		if opcode in 'uU':
+			myid = self.cursorids.release(key)
+			upstream.pointers.pop(pointer, None)
+			self._reclaimed.discard(key)
+		else:
+			myid, reclaimed = self.cursorids.acquire(key)
+			self._release(reclaimed)
+			if myid is None:
+				debug_output('Ignoring pointer %i of %s; maximum of %i '
+				             'cursors reached.' % (pointer, upstream.name(),
+				                                   self.cursorids.cursorcount))
+				return
+			if key in self._reclaimed:
+				# The clients got a release for it; the touch goes on
+				# under its new number
+				self._reclaimed.discard(key)
+				if opcode not in 'dD':
+					opcode = 'd'
+			upstream.pointers[pointer] = (xcoord, ycoord)
+		if myid is not None:
+			self.server.send(opcode, myid, xcoord, ycoord)
+
+	def _lost(self, upstream):
+		'''Releases the pointers of an upstream that went away'''
+		debug_output('lost connection to %s' % upstream.name())
+		upstream.close()
+		for pointer, (xcoord, ycoord) in upstream.pointers.items():
+			myid = self.cursorids.release((upstream.index, pointer))
+			if myid is not None:
+				self.server.send('u', myid, xcoord, ycoord)
+		upstream.pointers.clear()
+		self._reclaimed = set([key for key in self._reclaimed
+		                       if key[0] != upstream.index])
+
+	def _release(self, reclaimed):
+		'''
+		Sends releases for pointers that got no more events; if one moves
+		again, _relay() sends it as a new touch
+		'''
+		for (index, pointer), myid in reclaimed:
+			self._reclaimed.add((index, pointer))
+			debug_output('Reclaiming id %i of lost pointer %i of %s'
+			             % (myid, pointer, self.upstreams[index].name()))
+			xcoord, ycoord = self.upstreams[index].pointers.pop(pointer,
+			                                                    (0, 0))
+			self.server.send('u', myid, xcoord, ycoord)
@@ -0,0 +1,1177 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Non-blocking fan-out of vinput frames to all connected clients.
+
+ The input thread (libavg or GTK callbacks) only enqueues events. A single
+ socket thread accepts clients, encodes the queued events and writes them
+ to every client through non-blocking sockets and select.poll, so a slow
+ or stalled client can never block touch handling or rendering.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import os, errno, fcntl, math, select, threading, time
+from collections import deque
+from socket import socket as _socket, SOCK_STREAM as _SOCK_STREAM, \
+                   error as _sockerror
+
+from vinputserver.common import debug_output
+from vinputserver.latency import STAGE_ENQUEUE, STAGE_DISPATCH, \
+                                 STAGE_LOCK_WAIT, STAGE_LOCK_HOLD, STAGE_WRITE
+from vinputserver.coalesce import MotionCoalescer, GESTURE_OPCODE, \
+                                  GESTURE_CHANGE_OPCODE, GESTURE_POINTER
+from vinputserver.protocol import FRAME_SIZE, FrameEncoder, encode_helo
+from vinputserver.protocol2 import REQUEST_SIZE, CAPABILITIES, DeltaEncoder, \
+                                   HELO2_MAGIC, decode_request, encode_helo2
+from vinputserver.regions import REGION_MAGIC, REGION_REQUEST_SIZE, \
+                                 Region, RegionRouter, decode_region_request
+from vinputserver.transform import TRANSFORM_MAGIC, TRANSFORM_REQUEST_SIZE, \
+                                   Transform, decode_transform_request
+from vinputserver.ratelimit import RATE_MAGIC, RATE_REQUEST_SIZE, RateLimit, \
+                                   decode_rate_request
+from vinputserver.gestures import GESTURE_MAGIC, GESTURE_REQUEST_SIZE, \
+                                  GESTURE_CHANGE, decode_gesture_request
+from vinputserver.tracebuf import trace_point
+from vinputserver.handoff import request_handoff, serve_handoff, \
+                                open_handoff_socket, socket_from_fd, \
+                                check_handoff_addr
+
+########## Defaults ##########
+
+# Maximum number of unsent bytes buffered per client
+DEF_MAX_BUFFER = 64*1024
+# Milliseconds a client may stay behind before it gets disconnected
+# (0 disables the check)
+DEF_MAX_LAG = 2000
+# Milliseconds after which a batch is flushed even if the frame has not
+# ended yet
+DEF_MAX_BATCH_AGE = 20
+# Connections the kernel queues until the socket thread accepts them
+DEF_BACKLOG = 128
+
+##############################
+
+# Policies for clients whose outbound buffer is full
+LAG_DROP_MOTION = 'drop-motion'
+LAG_DISCONNECT = 'disconnect'
+LAG_POLICIES = (LAG_DROP_MOTION, LAG_DISCONNECT)
+
+# When events are handed to the socket thread: after every single event or
+# once per frame of the input source (see ServerSocketThread.flush)
+FLUSH_EVENT = 'event'
+FLUSH_FRAME = 'frame'
+FLUSH_MODES = (FLUSH_EVENT, FLUSH_FRAME)
+
+TRACE_SEND = trace_point('send', '%c pointer %i at %ix%i')
+TRACE_DISPATCH = trace_point('dispatch', '%i events to %i clients')
+TRACE_WRITE = trace_point('write', 'fd %i: %i bytes written, %i left')
+
+_POLLIN = select.POLLIN | select.POLLPRI
+_POLLERR = select.POLLERR | select.POLLHUP | select.POLLNVAL
+
+def _set_nonblocking(fd):
+	'''Sets O_NONBLOCK on a raw file descriptor'''
+	flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+	fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+class OutputThread(threading.Thread):
+	"""
+	OutputThread(name, [flush_mode, [max_batch_age]]) -> base class of the
+	threads delivering events to the clients.
+
+	 flush_mode: FLUSH_EVENT hands every event to the thread at once,
+	             FLUSH_FRAME collects the events until flush() is called
+	             at the end of an input frame, so each client gets one write
+	             per frame
+	 max_batch_age: milliseconds after which send() flushes a batch by
+	                itself in FLUSH_FRAME mode (0 or None: never)
+
+	send() and flush() never wait on a socket; all socket operations happen
+	in the thread itself. They have to be called from the same thread (the
+	input thread). Subclasses poll on self._wakeup_r and call
+	self._drain_wakeup() and self._take_events() when it becomes readable.
+
+	Setting x.latency to a LatencyRecorder (vinputserver.latency) before
+	start() enables the latency instrumentation, setting x.recorder to a
+	SessionRecorder (vinputserver.record) records all events sent and
+	setting x.tracer to a TraceBuffer (vinputserver.tracebuf) traces them.
+	"""
+
+	def __init__(self, name, flush_mode=FLUSH_FRAME,
+	             max_batch_age=DEF_MAX_BATCH_AGE):
+		super(OutputThread, self).__init__(name=name)
+		if flush_mode not in FLUSH_MODES:
+			raise ValueError, 'unknown flush mode %r' % (flush_mode,)
+		# Flag as daemon thread
+		self.setDaemon(True)
+		self.flush_mode = flush_mode
+		self.max_batch_age = max_batch_age
+		# Batches of events handed over by flush(); deque.append is atomic
+		self._queue = deque()
+		# Events of the current input frame and when the first one came in
+		self._batch = []
+		self._batch_start = None
+		# Self-pipe to wake up the poll loop
+		self._wakeup_r, self._wakeup_w = os.pipe()
+		_set_nonblocking(self._wakeup_r)
+		_set_nonblocking(self._wakeup_w)
+		self._wakeup_pending = False
+		self._running = True
+		# LatencyRecorder or None; when set, flush() queues (capture time,
+		# flush time) of every batch in _batch_times, in step with _queue
+		self.latency = None
+		self._batch_times = deque()
+		self._batch_captured = None
+		# Capture time of the oldest event returned by _take_events()
+		self._taken_captured = None
+		# opcode -> number of events taken by the thread; None disables
+		# the counting (see vinputserver.metrics)
+		self.event_counts = None
+		# Number of clients that connected (or subscribed) so far
+		self.accepts = 0
+		# SessionRecorder (vinputserver.record) getting every batch the
+		# thread takes, or None
+		self.recorder = None
+		# Coordinate range announced to the clients; set by subclasses
+		self.resolution = None
+		# TraceBuffer (vinputserver.tracebuf) or None; the input source
+		# may use it for its own trace points as well
+		self.tracer = None
+		# Number of clients subscribed to gesture frames
+		self.gesture_clients = 0
+
+	def send(self, opcode, pointer, xcoord=0, ycoord=0):
+		"""
+		x.send(opcode, pointer, [xcoord, ycoord])
+		Send a command to all connected clients.
+
+		Usually needed opcodes are '.' for movements, 'd' and 'u' for touch
+		and release, respective the uppercase variants for simultaneous
+		movements and touches/releases.
+
+		The command is only queued; the thread writes it. In
+		FLUSH_FRAME mode it is sent with the next flush().
+		"""
+		tracer = self.tracer
+		if tracer is not None:
+			tracer.trace(TRACE_SEND, ord(opcode) if isinstance(opcode, str)
+			                         else opcode, pointer, xcoord, ycoord)
+		batch = self._batch
+		batch.append((opcode, pointer, xcoord, ycoord))
+		latency = self.latency
+		if latency is not None:
+			captured = latency.captured()
+			latency.record(STAGE_ENQUEUE, time.time() - captured)
+			if len(batch) == 1:
+				self._batch_captured = captured
+		if self.flush_mode == FLUSH_EVENT:
+			self.flush()
+		elif len(batch) == 1:
+			self._batch_start = time.time()
+		elif self.max_batch_age and \
+		     time.time() - self._batch_start >= self.max_batch_age/1000.0:
+			self.flush()
+
+	def flush(self):
+		"""
+		x.flush()
+		Hands all events sent since the last flush to the thread as
+		one batch. Meant to be called once per frame of the input source.
+		"""
+		if self._batch:
+			if self.latency is not None:
+				# Before the batch, so the thread always finds its times
+				self._batch_times.append((self._batch_captured, time.time()))
+			self._queue.append(self._batch)
+			self._batch = []
+			self._wakeup()
+
+	def send_gesture(self, frame):
+		'''
+		x.send_gesture(frame)
+		Sends a gesture frame (vinputserver.gestures) to the clients
+		subscribed to gestures. Threads without subscriptions ignore it.
+		'''
+		pass
+
+	def _wakeup(self):
+		'''Wakes up the poll loop unless a wakeup is already pending'''
+		if not self._wakeup_pending:
+			self._wakeup_pending = True
+			try:
+				os.write(self._wakeup_w, 'x')
+			except OSError, e:
+				# A full pipe wakes the loop anyway
+				if e.errno != errno.EAGAIN:
+					raise
+
+	def _drain_wakeup(self):
+		'''
+		Empties the wakeup pipe; the caller has to take the events
+		afterwards.
+		'''
+		try:
+			while os.read(self._wakeup_r, 4096):
+				pass
+		except OSError, e:
+			if e.errno != errno.EAGAIN:
+				raise
+		# Only after the pipe is empty: a wakeup written before would be
+		# swallowed while the flag stays set, and no later one would be
+		# written. Events queued before the flag is cleared are taken by
+		# the caller, those after it write a new wakeup.
+		self._wakeup_pending = False
+
+	def _take_events(self):
+		'''
+		Returns the events of all batches queued by flush() so far and
+		counts and records them
+		'''
+		events = self._take_batches()
+		counts = self.event_counts
+		if counts is not None:
+			for event in events:
+				counts[event[0]] = counts.get(event[0], 0) + 1
+		if self.recorder is not None and events:
+			self.recorder.record(events, self.resolution)
+		return events
+
+	def _take_batches(self):
+		'''
+		Returns the events of all batches queued by flush() so far and
+		measures how long they waited
+		'''
+		queue = self._queue
+		events = []
+		# Only take what is there now, the input thread may keep adding
+		count = len(queue)
+		for _ in xrange(count):
+			events.extend(queue.popleft())
+		latency = self.latency
+		if latency is not None and count:
+			now = time.time()
+			times = self._batch_times
+			self._taken_captured = None
+			# Batches queued before latency was enabled have no times
+			for _ in xrange(min(count, len(times))):
+				captured, flushed = times.popleft()
+				latency.record(STAGE_DISPATCH, now - flushed)
+				if self._taken_captured is None:
+					self._taken_captured = captured
+		return events
+
+	def _record_write(self, captured, client=None):
+		'''Records the capture>write latency of events written just now'''
+		latency = self.latency
+		if latency is not None and captured is not None:
+			elapsed = time.time() - captured
+			latency.record(STAGE_WRITE, elapsed)
+			if client is not None:
+				latency.client_histogram(client).record(elapsed*1e6)
+
+	def queue_depth(self):
+		'''Returns the number of batches the thread has not taken yet'''
+		return len(self._queue)
+
+	def client_stats(self):
+		'''
+		x.client_stats() -> list of (name, frames, bytes, backlog)
+		Returns the frames and bytes sent to every client so far and the
+		bytes still waiting to be written to it.
+		'''
+		return []
+
+	def disconnect_counts(self):
+		'''
+		x.disconnect_counts() -> dict
+		Returns how often clients were dropped, by reason.
+		'''
+		return {}
+
+	def _stop(self):
+		'''Makes the thread leave its main loop and waits for it'''
+		self._running = False
+		self._wakeup()
+		if self.isAlive() and threading.currentThread() is not self:
+			self.join(1.0)
+
+class _Client(object):
+	'''
+	State of one connected client: the socket, the bytes that still have to
+	be written to it, the events queued up while its socket was full and
+	since when it is falling behind.
+	'''
+
+	__slots__ = ('conn', 'addr', 'fd', 'outbuf', 'pending', 'behind_since',
+	             'dropped', 'polling_out', 'captured', 'frames', 'bytes',
+	             'inbuf', 'encoder', 'region', 'transform', 'rate',
+	             'gestures')
+
+	def __init__(self, conn, addr):
+		self.conn = conn
+		self.addr = addr
+		self.fd = conn.fileno()
+		self.outbuf = bytearray()
+		self.pending = MotionCoalescer()
+		self.behind_since = None
+		self.dropped = 0
+		self.polling_out = False
+		# Capture time of the oldest unwritten event (latency measurement)
+		self.captured = None
+		# Frames queued for and bytes written to the client so far
+		self.frames = 0
+		self.bytes = 0
+		# Requests sent by the client that are not complete yet; None once
+		# it sent something else
+		self.inbuf = ''
+		# DeltaEncoder of a version 2 client, None for version 1
+		self.encoder = None
+		# Region the client subscribed to, None for the whole surface
+		self.region = None
+		# Transform of the client's coordinates (vinputserver.transform)
+		self.transform = None
+		# RateLimit of the client's motion updates, None for every frame
+		self.rate = None
+		# Whether the client gets gesture frames
+		self.gestures = False
+
+	def name(self):
+		'''Returns a short name of the client for reports'''
+		if isinstance(self.addr, tuple):
+			return '[%s]:%s' % self.addr[:2]
+		return '%s#%i' % (self.addr.replace('\0', '@') or 'unix', self.fd)
+
+	def export(self):
+		'''Returns the state of the client for a handoff (see adopt())'''
+		state = {
+			'addr': [_text(part) for part in self.addr]
+			        if isinstance(self.addr, tuple) else _text(self.addr),
+			'outbuf': _text(str(self.outbuf)),
+			'pending': [(_text(opcode), pointer, _text(xcoord), ycoord)
+			            for opcode, pointer, xcoord, ycoord
+			            in self.pending.events],
+			'inbuf': _text(self.inbuf),
+			'frames': self.frames,
+			'bytes': self.bytes,
+			'encoder': None,
+			'region': None,
+			'transform': None,
+			'rate': None,
+			'gestures': self.gestures,
+		}
+		if self.encoder is not None:
+			state['encoder'] = (self.encoder.capabilities, self.encoder.start,
+			                    self.encoder.positions())
+		if self.region is not None:
+			region = self.region
+			state['region'] = (region.x, region.y, region.width,
+			                   region.height) + region.resolution
+		if self.transform is not None:
+			state['transform'] = (self.transform.matrix,
+			                      self.transform.resolution)
+		if self.rate is not None:
+			state['rate'] = self.rate.export()
+		return state
+
+	@classmethod
+	def adopt(cls, conn, state):
+		'''
+		_Client.adopt(conn, state) -> _Client
+		Restores a client handed over by another server from export().
+		'''
+		addr = state['addr']
+		if isinstance(addr, list):
+			addr = tuple([_bytes(part) for part in addr])
+		client = cls(conn, _bytes(addr))
+		client.outbuf += _bytes(state['outbuf'])
+		client.pending.extend([(_bytes(opcode), pointer, _bytes(xcoord),
+		                        ycoord) for opcode, pointer, xcoord, ycoord
+		                       in state['pending']])
+		client.inbuf = _bytes(state['inbuf'])
+		client.frames = state['frames']
+		client.bytes = state['bytes']
+		if state['encoder'] is not None:
+			capabilities, start, positions = state['encoder']
+			client.encoder = DeltaEncoder(capabilities, start)
+			client.encoder.restore(positions)
+		if state['region'] is not None:
+			client.region = Region(*state['region'])
+		if state['transform'] is not None:
+			client.transform = Transform(*state['transform'])
+		# Servers without rate limits send no rate
+		if state.get('rate') is not None:
+			client.rate = RateLimit.adopt(state['rate'])
+		client.gestures = bool(state.get('gestures'))
+		return client
+
+def _text(value):
+	'''Makes a byte string fit for JSON; other values stay as they are'''
+	return value.decode('latin-1') if isinstance(value, str) else value
+
+def _bytes(value):
+	'''Reverses _text()'''
+	return value.encode('latin-1') if isinstance(value, unicode) else value
+
+class ServerSocketThread(OutputThread):
+	"""
+	ServerSocketThread(announce_resolution, sock_addr, sock_family,
+	                   [sock_type, [sock_protocol]], [max_buffer],
+	                   [lag_policy], [max_lag], [flush_mode],
+	                   [max_batch_age], [backlog], [listen_sock],
+	                   [handoff_addr], [adaptive_rate]) -> a Thread object
+	implementing the simple vinput protocol on a socket. Clients asking
+	for it get protocol version 2 (see vinputserver.protocol2), only the
+	events of a region (see vinputserver.regions), transformed
+	coordinates (see vinputserver.transform), a limited number of motion
+	updates per second (see vinputserver.ratelimit) or gesture frames (see
+	vinputserver.gestures).
+
+	 announce_resolution: resolution/range of the used coordinates
+	 sock_addr: address to listen on; format varies with sock_family
+	            (for example ('::', 1243)) to listen  on TCP port 1243 on
+	            all ip addresses when using an IPv6 socket)
+	 sock_family: address family as defined in the socket module
+	              (for example socket.AF_INET6)
+	 sock_type: socket type as defined in the socket module
+	            (default: SOCK_STREAM)
+	 sock_protocol: socket protocol as defined in the socket module
+	                (if omitted, uses system default protocol for the
+	                given socket type, so TCP by default)
+	 max_buffer: maximum number of unsent bytes kept for each client;
+	             while a client's socket is full, its pending motion is
+	             coalesced to the newest position of every pointer
+	 lag_policy: what to do with a client whose buffer is full:
+	             LAG_DROP_MOTION drops its pending motion frames (touches
+	             and releases are always kept), LAG_DISCONNECT closes it
+	 max_lag: milliseconds a client may stay behind before it is
+	          disconnected regardless of the policy (0 or None: never)
+	 flush_mode, max_batch_age: see OutputThread
+	 backlog: connections the kernel queues before they are accepted
+	 listen_sock: a listening socket to use instead of opening one, e.g.
+	              one passed by systemd (see vinputserver.handoff)
+	 handoff_addr: path of a unix socket on which the thread first asks
+	               a running server of the same user to hand over its
+	               sockets and clients, then offers its own to the next
+	               server (None: no handoff); see vinputserver.handoff
+	 adaptive_rate: limit the motion updates of clients that declare no
+	                rate to what their drain speed shows they can take
+
+	After the thread handed its sockets over, it stops and calls
+	x.on_handoff() if that is set, so the application can quit.
+	"""
+
+	def __init__(self, announce_resolution, sock_addr, sock_family,
+	             sock_type=_SOCK_STREAM, sock_protocol=0,
+	             max_buffer=DEF_MAX_BUFFER, lag_policy=LAG_DROP_MOTION,
+	             max_lag=DEF_MAX_LAG, flush_mode=FLUSH_FRAME,
+	             max_batch_age=DEF_MAX_BATCH_AGE, backlog=DEF_BACKLOG,
+	             listen_sock=None, handoff_addr=None, adaptive_rate=False):
+		"""
+		constructor - initializes x
+		"""
+		super(ServerSocketThread, self).__init__("Socket Loop", flush_mode,
+		                                         max_batch_age)
+		if lag_policy not in LAG_POLICIES:
+			raise ValueError, 'unknown lag policy %r' % (lag_policy,)
+		if handoff_addr is not None:
+			check_handoff_addr(handoff_addr)
+		# Init attributes
+		self._clients = []
+		self._clients_lock = threading.RLock()
+		self.address = sock_addr
+		self.family = sock_family
+		self.sock_type = sock_type
+		self.sock_prot = sock_protocol
+		self.resolution = announce_resolution
+		self.max_buffer = max_buffer
+		self.lag_policy = lag_policy
+		self.max_lag = max_lag
+		self.backlog = backlog
+		self.handoff_addr = handoff_addr
+		self.adaptive_rate = adaptive_rate
+		self._sock = listen_sock
+		# Socket on which the next server asks for a handoff
+		self._handoff_sock = None
+		# Called from the thread after a handoff
+		self.on_handoff = None
+		self._poller = None
+		self._fdmap = {}
+		# The batch encoded by _encoder is shared by all clients, so the
+		# backlog of lagging clients and the events routed to region
+		# clients need their own buffer
+		self._encoder = FrameEncoder()
+		self._backlog_encoder = FrameEncoder()
+		# Counters of clients that are gone
+		self._coalesced = self._dropped = 0
+		# reason -> number of clients dropped for it
+		self._disconnects = {}
+		# Clients subscribed to a region (vinputserver.regions)
+		self._router = RegionRouter(announce_resolution)
+		# Gesture frames of send_gesture(); deque.append is atomic
+		self._gesture_queue = deque()
+
+	def __del__(self):
+		"""destructor - cleans up all open connections and closes the server socket"""
+		if self._sock:
+			try:
+				self.close()
+			finally:
+				del self._sock
+
+	def run(self):
+		"""
+		Contains the thread main loop - opens and binds the server socket,
+		accepts client connections and writes queued events to the clients
+		NOTE: use x.start() to run the thread. x.run() is used internally.
+		"""
+		self._poller = poller = select.poll()
+		if self._sock is None and self.handoff_addr is not None:
+			self._take_over()
+		if self._sock is None:
+			debug_output('opening socket on %r' % (self.address,))
+			self._sock = _socket(self.family, self.sock_type, self.sock_prot)
+			self._sock.bind(self.address)
+			self._sock.listen(self.backlog)
+		sock = self._sock
+		sock.setblocking(False)
+		poller.register(sock.fileno(), _POLLIN)
+		poller.register(self._wakeup_r, _POLLIN)
+		listen_fd = sock.fileno()
+		handoff_fd = None
+		if self.handoff_addr is not None:
+			self._handoff_sock = open_handoff_socket(self.handoff_addr)
+			handoff_fd = self._handoff_sock.fileno()
+			poller.register(handoff_fd, _POLLIN)
+		debug_output('starting socket loop')
+		while self._running:
+			try:
+				events = poller.poll(self._poll_timeout())
+			except select.error, e:
+				if e.args[0] == errno.EINTR:
+					continue
+				raise
+			for fd, mask in events:
+				if fd == listen_fd:
+					self._accept()
+				elif fd == self._wakeup_r:
+					self._drain_wakeup()
+				elif fd == handoff_fd:
+					if self._hand_off():
+						return
+					handoff_fd = self._handoff_sock and \
+					             self._handoff_sock.fileno()
+				else:
+					client = self._fdmap.get(fd)
+					if client is None:
+						continue
+					if mask & _POLLERR:
+						self._drop_client(client, 'error' if mask & select.POLLERR
+						                          else 'closed')
+					elif mask & _POLLIN:
+						self._read(client)
+			# The gesture frames taken before the events were sent after
+			# the flush() of their events, which are taken now as well
+			gestures = self._take_gestures()
+			self._dispatch()
+			self._dispatch_gestures(gestures)
+			self._check_lag()
+
+	def close_clients(self):
+		'''
+		x.close_clients()
+		Closes all client connections.
+		'''
+		with self._clients_lock:
+			for client in self._clients:
+				if self._poller is not None:
+					try:
+						self._poller.unregister(client.fd)
+					except KeyError:
+						pass
+				try:
+					client.conn.close()
+				except _sockerror:
+					pass
+				self._coalesced += client.pending.coalesced
+				self._dropped += client.dropped
+				self._router.unsubscribe(client)
+			del self._clients[:]
+			self._fdmap.clear()
+			self.gesture_clients = 0
+		# A poll() in progress keeps the closed sockets open until it returns
+		self._wakeup()
+
+	def close(self):
+		'''
+		x.close()
+		Stops the socket thread and closes all sockets.
+		'''
+		self._stop()
+		with self._clients_lock:
+			self.close_clients()
+			try:
+				if self._sock is not None:
+					self._sock.close()
+				if self._handoff_sock is not None:
+					self._handoff_sock.close()
+					try:
+						os.unlink(self.handoff_addr)
+					except OSError:
+						pass
+			finally:
+				self._sock = self._handoff_sock = None
+
+	def _take_over(self):
+		'''Takes over the sockets and clients of the server at handoff_addr'''
+		try:
+			result = request_handoff(self.handoff_addr)
+		except (_sockerror, ValueError), e:
+			debug_output('handoff failed: %s' % (e,))
+			return
+		if result is None:
+			debug_output('no server to take over at %r' % (self.handoff_addr,))
+			return
+		state, fds = result
+		self._sock = socket_from_fd(fds[0], self.sock_type)
+		clients = []
+		for info, fd in zip(state['clients'], fds[1:]):
+			conn = socket_from_fd(fd)
+			conn.setblocking(False)
+			try:
+				clients.append(_Client.adopt(conn, info))
+			except (KeyError, TypeError, ValueError), e:
+				debug_output('cannot take over client: %s' % (e,))
+				conn.close()
+		debug_output('took over %i clients' % len(clients))
+		with self._clients_lock:
+			for client in clients:
+				self._clients.append(client)
+				self._fdmap[client.fd] = client
+				if client.region is not None:
+					self._router.subscribe(client, client.region)
+			self._count_gesture_clients()
+		self.accepts += len(clients)
+		changed = list(state.get('resolution') or ()) != list(self.resolution)
+		for client in clients:
+			self._poller.register(client.fd, _POLLIN)
+			if changed:
+				self._announce(client)
+			else:
+				self._write(client)
+
+	def _hand_off(self):
+		'''
+		Hands the sockets and clients over to the server asking for them;
+		returns True if it took them
+		'''
+		try:
+			conn = self._handoff_sock.accept()[0]
+		except _sockerror, e:
+			if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+				return False
+			raise
+		# The new server offers its sockets on the same address
+		self._poller.unregister(self._handoff_sock.fileno())
+		self._handoff_sock.close()
+		self._handoff_sock = None
+		# Events queued so far still go to the clients
+		self._dispatch()
+		with self._clients_lock:
+			state = {'resolution': list(self.resolution),
+			         'clients': [client.export() for client in self._clients]}
+			fds = [self._sock.fileno()] + [client.fd for client in self._clients]
+			try:
+				done = serve_handoff(conn, state, fds)
+			except _sockerror, e:
+				debug_output('handoff failed: %s' % (e,))
+				done = False
+			finally:
+				conn.close()
+			if not done:
+				# Keep serving, and offering the sockets
+				try:
+					self._handoff_sock = open_handoff_socket(self.handoff_addr)
+				except _sockerror, e:
+					debug_output('cannot offer a handoff anymore: %s' % (e,))
+				else:
+					self._poller.register(self._handoff_sock.fileno(), _POLLIN)
+				return False
+			debug_output('handed %i clients over' % len(self._clients))
+			for client in self._clients:
+				self._poller.unregister(client.fd)
+				# Only closes the descriptor of this process; the connection
+				# stays open in the new server
+				client.conn.close()
+				self._coalesced += client.pending.coalesced
+				self._dropped += client.dropped
+			del self._clients[:]
+			self._fdmap.clear()
+			self._router = RegionRouter(self.resolution)
+			self.gesture_clients = 0
+		self._poller.unregister(self._sock.fileno())
+		self._sock.close()
+		self._sock = None
+		self._running = False
+		if self.on_handoff is not None:
+			self.on_handoff()
+		return True
+
+	def _accept(self):
+		'''Accepts all pending connections and queues the HELO for them'''
+		while True:
+			try:
+				conn, addr = self._sock.accept()
+			except _sockerror, e:
+				if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+					return
+				raise
+			debug_output('client connected: %r' % (addr,))
+			conn.setblocking(False)
+			client = _Client(conn, addr)
+			if self.adaptive_rate:
+				client.rate = RateLimit()
+			self.accepts += 1
+			client.outbuf += encode_helo(*self.resolution)
+			with self._clients_lock:
+				self._clients.append(client)
+				self._fdmap[client.fd] = client
+			self._poller.register(client.fd, _POLLIN)
+			self._write(client)
+
+	def _read(self, client):
+		'''Reads the requests of a client; detects disconnects'''
+		try:
+			data = client.conn.recv(4096)
+		except _sockerror, e:
+			if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+				return
+			data = ''
+		if not data:
+			self._drop_client(client, 'closed')
+			return
+		if client.inbuf is None:
+			# Anything after something that is no request is ignored
+			return
+		client.inbuf += data
+		while len(client.inbuf) >= 2:
+			magic = client.inbuf[:2]
+			if magic == HELO2_MAGIC:
+				size = REQUEST_SIZE
+			elif magic == REGION_MAGIC:
+				size = REGION_REQUEST_SIZE
+			elif magic == TRANSFORM_MAGIC:
+				size = TRANSFORM_REQUEST_SIZE
+			elif magic == RATE_MAGIC:
+				size = RATE_REQUEST_SIZE
+			elif magic == GESTURE_MAGIC:
+				size = GESTURE_REQUEST_SIZE
+			else:
+				client.inbuf = None
+				return
+			if len(client.inbuf) < size:
+				return
+			request, client.inbuf = client.inbuf[:size], client.inbuf[size:]
+			try:
+				if magic == HELO2_MAGIC:
+					self._upgrade(client, decode_request(request)[1])
+				elif magic == REGION_MAGIC:
+					self._subscribe(client, decode_region_request(request))
+				elif magic == RATE_MAGIC:
+					self._set_rate(client, decode_rate_request(request))
+				elif magic == GESTURE_MAGIC:
+					self._subscribe_gestures(client,
+					                         decode_gesture_request(request))
+				else:
+					self._set_transform(client,
+					                    decode_transform_request(request))
+			except ValueError, e:
+				debug_output('client %r: %s' % (client.addr, e))
+
+	def _upgrade(self, client, capabilities):
+		'''Switches a client to protocol version 2'''
+		if client.encoder is not None:
+			return
+		capabilities &= CAPABILITIES
+		debug_output('client %r uses protocol version 2, capabilities %i'
+		             % (client.addr, capabilities))
+		# The output buffer always ends at a frame boundary, so the HELO2
+		# is where the client expects the next frame
+		client.outbuf += encode_helo2(capabilities,
+		                              *self._client_resolution(client))
+		client.encoder = DeltaEncoder(capabilities, time.time())
+		self._write(client)
+
+	def _client_resolution(self, client):
+		'''Returns the coordinate range a client gets'''
+		if client.transform is not None and client.transform.resolution:
+			return client.transform.resolution
+		if client.region is not None:
+			return client.region.resolution
+		return self.resolution
+
+	def _announce(self, client):
+		'''Announces a changed resolution to a client'''
+		# The pending events were made for the old resolution: they go
+		# before the HELO, rate limit or not
+		if client.pending:
+			self._encode_backlog(client, client.pending.take())
+		# At the next frame boundary, like the HELO2
+		resolution = self._client_resolution(client)
+		if client.encoder is not None:
+			client.outbuf += encode_helo2(client.encoder.capabilities,
+			                              *resolution)
+			client.encoder = DeltaEncoder(client.encoder.capabilities,
+			                              time.time())
+		else:
+			client.outbuf += encode_helo(*resolution)
+		self._write(client)
+
+	def _subscribe(self, client, region):
+		'''Restricts a client to the events inside a region'''
+		if client.region is not None:
+			raise ValueError, 'already subscribed to %r' % (client.region,)
+		debug_output('client %r subscribes to %r' % (client.addr, region))
+		with self._clients_lock:
+			client.region = region
+			self._router.subscribe(client, region)
+		self._announce(client)
+
+	def _set_transform(self, client, transform):
+		'''Transforms the coordinates a client gets'''
+		if client.transform is not None:
+			raise ValueError, 'already transformed by %r' % (client.transform,)
+		debug_output('client %r uses %r' % (client.addr, transform))
+		with self._clients_lock:
+			client.transform = transform
+		self._announce(client)
+
+	def _set_rate(self, client, rate):
+		'''Limits the motion updates a client gets per second'''
+		client.rate = RateLimit(rate)
+		debug_output('client %r limited to %r' % (client.addr, client.rate))
+		self._write(client)
+
+	def _subscribe_gestures(self, client, version):
+		'''Sends gesture frames to a client from now on'''
+		if client.gestures:
+			raise ValueError, 'already subscribed to gestures'
+		debug_output('client %r subscribes to gestures, version %i'
+		             % (client.addr, version))
+		with self._clients_lock:
+			client.gestures = True
+			self._count_gesture_clients()
+
+	def _count_gesture_clients(self):
+		'''Updates gesture_clients; called with _clients_lock held'''
+		self.gesture_clients = len([client for client in self._clients
+		                            if client.gestures])
+
+	def send_gesture(self, frame):
+		'''
+		x.send_gesture(frame)
+		See OutputThread.send_gesture(). Called after flush(), the frame
+		follows the events of its input frame.
+		'''
+		self._gesture_queue.append(frame)
+		self._wakeup()
+
+	def _take_gestures(self):
+		'''Returns the gesture frames queued by send_gesture() so far'''
+		queue = self._gesture_queue
+		return [queue.popleft() for _ in xrange(len(queue))]
+
+	def _dispatch_gestures(self, frames):
+		'''Writes gesture frames to the subscribed clients, after their events'''
+		if not frames:
+			return
+		data = events = None
+		with self._clients_lock:
+			for client in self._clients[:]:
+				if not client.gestures:
+					continue
+				if client.outbuf or client.pending or \
+				   client.rate is not None:
+					# The events of the frames may still be pending: the
+					# gesture frames queue up behind them, and their
+					# changes are coalesced and dropped like motion
+					if events is None:
+						events = [(GESTURE_CHANGE_OPCODE
+						           if ord(frame[2]) == GESTURE_CHANGE
+						           else GESTURE_OPCODE, GESTURE_POINTER, frame, 0)
+						          for frame in frames]
+					client.pending.extend(events)
+				else:
+					# Between two packets for version 2 clients
+					if data is None:
+						data = ''.join(frames)
+					client.outbuf += data
+					client.frames += len(frames)
+				self._write(client)
+				if client.outbuf or client.pending:
+					self._limit(client)
+
+	def _dispatch(self):
+		'''Encodes all queued batches and writes them to every client'''
+		if not self._queue:
+			# Only write to clients that became writable again or whose
+			# next tick came
+			for client in self._clients[:]:
+				if client.outbuf or client.pending:
+					self._write(client)
+			return
+		events = self._take_events()
+		data = None
+		latency = self.latency
+		if latency is not None:
+			captured = self._taken_captured
+			start = time.time()
+		self._clients_lock.acquire()
+		try:
+			if latency is not None:
+				locked = time.time()
+				latency.record(STAGE_LOCK_WAIT, locked - start)
+			if self.tracer is not None:
+				self.tracer.trace(TRACE_DISPATCH, len(events), len(self._clients))
+			routed = None
+			if self._router:
+				routed = self._router.route(events, self.resolution)
+			# transform or (region group, transform) -> [events of its
+			# clients, their frames or None]
+			transformed = {}
+			for client in self._clients[:]:
+				shared = None
+				if client.region is not None:
+					# Region clients only get the events routed to their
+					# group, transformed and encoded once for all of them
+					group = self._router.group(client)
+					shared = transformed.get((group, client.transform))
+					if shared is None:
+						batch = routed.get(group)
+						if batch and client.transform is not None:
+							batch = client.transform.apply(batch)
+						shared = transformed[group, client.transform] = \
+							[batch, None]
+					batch = shared[0]
+				elif client.transform is not None:
+					# Each transform is applied once, whoever uses it
+					shared = transformed.get(client.transform)
+					if shared is None:
+						shared = transformed[client.transform] = \
+							[client.transform.apply(events), None]
+					batch = shared[0]
+				else:
+					batch = events
+				if not batch:
+					pass
+				elif client.outbuf or client.pending or \
+				     client.rate is not None:
+					# Client is behind or only takes motion once per tick:
+					# keep the events for later, so the motion can still be
+					# coalesced
+					client.pending.extend(batch)
+				else:
+					if client.encoder is not None:
+						client.outbuf += client.encoder.encode(batch, time.time())
+					elif shared is not None:
+						if shared[1] is None:
+							shared[1] = self._backlog_encoder.encode(batch).tobytes()
+						client.outbuf += shared[1]
+					else:
+						if data is None:
+							data = self._encoder.encode(events)
+						client.outbuf += data
+					client.frames += len(batch)
+				if latency is not None and client.captured is None and batch:
+					client.captured = captured
+				self._write(client)
+				if client.outbuf or client.pending:
+					self._limit(client)
+		finally:
+			if latency is not None:
+				latency.record(STAGE_LOCK_HOLD, time.time() - locked)
+			self._clients_lock.release()
+
+	def _encode_gestures(self, client, backlog, outbuf):
+		'''Appends pending events with gesture frames among them to outbuf'''
+		start = 0
+		for index, event in enumerate(backlog):
+			if event[1] != GESTURE_POINTER:
+				continue
+			if index > start:
+				if client.encoder is not None:
+					outbuf += client.encoder.encode(backlog[start:index],
+					                                time.time())
+				else:
+					outbuf += self._backlog_encoder.encode(backlog[start:index])
+			outbuf += event[2]
+			start = index + 1
+		if start < len(backlog):
+			if client.encoder is not None:
+				outbuf += client.encoder.encode(backlog[start:], time.time())
+			else:
+				outbuf += self._backlog_encoder.encode(backlog[start:])
+
+	def _encode_backlog(self, client, backlog):
+		'''Appends pending events taken from a client to its buffer'''
+		client.frames += len(backlog)
+		if client.gestures:
+			self._encode_gestures(client, backlog, client.outbuf)
+		elif client.encoder is not None:
+			client.outbuf += client.encoder.encode(backlog, time.time())
+		else:
+			client.outbuf += self._backlog_encoder.encode(backlog)
+
+	def _write(self, client):
+		'''Writes as much of the client's buffer and pending events as the socket takes'''
+		outbuf = client.outbuf
+		limit = client.rate
+		while True:
+			if not outbuf:
+				if not client.pending:
+					break
+				ticked = False
+				if limit is None:
+					backlog = client.pending.take()
+				elif limit.due(time.time()):
+					backlog = client.pending.take()
+					ticked = True
+				else:
+					# Touches and releases do not wait for the next tick
+					backlog = client.pending.take_urgent()
+					if not backlog:
+						break
+				self._encode_backlog(client, backlog)
+				if ticked:
+					limit.tick(time.time(), len(outbuf),
+					           client.behind_since is None)
+			try:
+				written = client.conn.send(outbuf)
+			except _sockerror, e:
+				if e.args[0] == errno.EINTR:
+					continue
+				if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+					break
+				self._drop_client(client, 'error')
+				return
+			client.bytes += written
+			del outbuf[:written]
+			if self.tracer is not None:
+				self.tracer.trace(TRACE_WRITE, client.fd, written, len(outbuf))
+		if outbuf:
+			if client.behind_since is None:
+				client.behind_since = time.time()
+				if limit is not None:
+					limit.behind(client.bytes)
+			if not client.polling_out:
+				self._poller.modify(client.fd, _POLLIN | select.POLLOUT)
+				client.polling_out = True
+		else:
+			if client.behind_since is not None and limit is not None:
+				limit.caught_up(time.time() - client.behind_since,
+				                client.bytes)
+			client.behind_since = None
+			if client.captured is not None:
+				self._record_write(client.captured, client.name())
+				client.captured = None
+			if client.polling_out:
+				self._poller.modify(client.fd, _POLLIN)
+				client.polling_out = False
+
+	def _limit(self, client):
+		'''Applies the lag policy to a client with too much unsent data'''
+		if len(client.outbuf) + FRAME_SIZE*len(client.pending) <= \
+		   self.max_buffer:
+			return
+		if self.lag_policy == LAG_DISCONNECT:
+			debug_output('client %r is too slow, disconnecting' % (client.addr,))
+			self._drop_client(client, 'buffer')
+		else:
+			client.dropped += client.pending.drop_motion()
+
+	def counters(self):
+		'''
+		x.counters() -> dict
+		Returns the number of motion frames coalesced and dropped for
+		lagging clients since the start.
+		'''
+		with self._clients_lock:
+			coalesced, dropped = self._coalesced, self._dropped
+			for client in self._clients:
+				coalesced += client.pending.coalesced
+				dropped += client.dropped
+		return {'coalesced': coalesced, 'dropped': dropped}
+
+	def client_stats(self):
+		'''
+		x.client_stats() -> list of (name, frames, bytes, backlog)
+		See OutputThread.client_stats().
+		'''
+		with self._clients_lock:
+			return [(client.name(), client.frames, client.bytes,
+			         len(client.outbuf) + FRAME_SIZE*len(client.pending))
+			        for client in self._clients]
+
+	def disconnect_counts(self):
+		'''
+		x.disconnect_counts() -> dict
+		Returns how often clients were dropped, by reason: 'closed' by the
+		client, 'error' on the socket, 'buffer' or 'lag' by the lag policy.
+		'''
+		with self._clients_lock:
+			return dict(self._disconnects)
+
+	def _drop_client(self, client, reason):
+		'''Closes a client connection and forgets about it'''
+		with self._clients_lock:
+			if client not in self._clients:
+				return
+			self._disconnects[reason] = self._disconnects.get(reason, 0) + 1
+			self._clients.remove(client)
+			del self._fdmap[client.fd]
+			self._coalesced += client.pending.coalesced
+			self._dropped += client.dropped
+			self._router.unsubscribe(client)
+			if client.gestures:
+				self._count_gesture_clients()
+		if self.latency is not None:
+			self.latency.forget_client(client.name())
+		try:
+			self._poller.unregister(client.fd)
+		except KeyError:
+			pass
+		try:
+			client.conn.close()
+		except _sockerror:
+			pass
+		debug_output('client %r disconnected' % (client.addr,))
+
+	def _poll_timeout(self):
+		'''Returns the poll timeout in ms (None: wait for the next event)'''
+		timeout = None
+		if self.max_lag:
+			for client in self._clients:
+				if client.behind_since is not None:
+					timeout = min(self.max_lag, 100)
+					break
+		# Wake up for the next tick of clients with motion pending
+		now = time.time()
+		for client in self._clients:
+			if client.rate is not None and client.pending and \
+			   not client.outbuf:
+				wait = int(math.ceil(client.rate.timeout(now)*1000))
+				if timeout is None or wait < timeout:
+					timeout = wait
+		return timeout
+
+	def _check_lag(self):
+		'''Disconnects clients which have been behind for too long'''
+		if not self.max_lag:
+			return
+		limit = time.time() - self.max_lag/1000.0
+		for client in self._clients[:]:
+			if client.behind_since is not None and client.behind_since < limit:
+				debug_output('client %r stalled, disconnecting' % (client.addr,))
+				self._drop_client(client, 'lag')
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Shared memory ring buffer transport for clients on the same host.
+
+ The server writes the vinput frames into a file in /dev/shm which any
+ number of readers map into their address space. Nothing goes through the
+ socket stack; readers are woken through a futex in the shared header.
+
+ Layout (header in native byte order):
+  header (64 bytes): magic "#RB2", number of slots, slot size (6), width,
+                     height, 64-bit count of frames written, 32-bit futex,
+                     64-bit count of frames written once the current copy
+                     is done
+  slots: the 6 byte vinput frames, as on the wire
+
+ A batch goes into the ring with one copy (two where it wraps around),
+ readers take all new frames with one copy and decode them in bulk. The
+ writer never waits for readers. It announces the end of every copy
+ before it starts; a reader compares its copy with that and counts the
+ frames that were, or may have been, overwritten meanwhile as lost.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import ctypes, errno, mmap, os, platform, select, struct, time
+
+from vinputserver.common import debug_output
+from vinputserver.protocol import FRAME_SIZE, FrameEncoder, decode_frames
+from vinputserver.server import OutputThread, FLUSH_FRAME, DEF_MAX_BATCH_AGE
+
+########## Defaults ##########
+
+# Number of slots; has to be a power of two
+DEF_RING_SLOTS = 4096
+
+##############################
+
+SHM_DIR = '/dev/shm'
+RING_MAGIC = '#RB2'
+
+_HEADER = struct.Struct('=4sIIHH')
+_COUNT = struct.Struct('=Q')
+_FUTEX = struct.Struct('=I')
+HEADER_SIZE = 64
+SLOT_SIZE = FRAME_SIZE
+_COUNT_OFFSET = 16
+_FUTEX_OFFSET = 24
+_RESERVED_OFFSET = 32
+
+_POLLIN = select.POLLIN | select.POLLPRI
+
+# futex(2) is only reachable through syscall(2)
+_SYS_FUTEX = {'x86_64': 202, 'i386': 240, 'i686': 240, 'armv7l': 240,
+              'aarch64': 98}.get(platform.machine())
+_FUTEX_WAIT = 0
+_FUTEX_WAKE = 1
+_INT_MAX = 0x7fffffff
+
+class _Timespec(ctypes.Structure):
+	_fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+def _load_syscall():
+	'''Returns libc's syscall function or None if futexes are unavailable'''
+	if _SYS_FUTEX is None:
+		return None
+	try:
+		syscall = ctypes.CDLL(None, use_errno=True).syscall
+	except (OSError, AttributeError):
+		return None
+	syscall.argtypes = [ctypes.c_long, ctypes.c_void_p, ctypes.c_int,
+	                    ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p,
+	                    ctypes.c_int]
+	syscall.restype = ctypes.c_long
+	return syscall
+
+_syscall = _load_syscall()
+
+def ring_path(name):
+	'''Returns the file backing the ring buffer with the given name'''
+	return os.path.join(SHM_DIR, 'vinput-' + name)
+
+class _Ring(object):
+	'''Common part of ShmRingThread and ShmRingReader: the mapping'''
+
+	def _map(self, fd, size):
+		self._mm = mmap.mmap(fd, size)
+		if _syscall is not None:
+			self._futex = ctypes.c_uint32.from_buffer(self._mm, _FUTEX_OFFSET)
+			self._futex_addr = ctypes.addressof(self._futex)
+		else:
+			self._futex = self._futex_addr = None
+
+	def _count(self):
+		return _COUNT.unpack_from(self._mm, _COUNT_OFFSET)[0]
+
+	def _reserved(self):
+		return _COUNT.unpack_from(self._mm, _RESERVED_OFFSET)[0]
+
+class ShmRingThread(OutputThread, _Ring):
+	"""
+	ShmRingThread(announce_resolution, name, [slots], [flush_mode],
+	              [max_batch_age]) -> a Thread object writing the vinput
+	frames into a shared memory ring buffer.
+
+	 announce_resolution: resolution/range of the used coordinates; kept
+	                      in the ring header
+	 name: name of the ring buffer (see ring_path)
+	 slots: number of frames the ring holds (a power of two)
+	 flush_mode, max_batch_age: see OutputThread
+	"""
+
+	def __init__(self, announce_resolution, name, slots=DEF_RING_SLOTS,
+	             flush_mode=FLUSH_FRAME, max_batch_age=DEF_MAX_BATCH_AGE):
+		"""
+		constructor - initializes x
+		"""
+		super(ShmRingThread, self).__init__("Ring Buffer Loop", flush_mode,
+		                                    max_batch_age)
+		if slots <= 0 or slots & (slots - 1):
+			raise ValueError, 'number of slots must be a power of two'
+		self.resolution = announce_resolution
+		self.name = name
+		self.slots = slots
+		self._mm = None
+		self._written = 0
+		self._encoder = FrameEncoder()
+
+	def run(self):
+		"""
+		Contains the thread main loop - creates the ring buffer and writes
+		the queued events into it
+		NOTE: use x.start() to run the thread. x.run() is used internally.
+		"""
+		self._create_ring()
+		poller = select.poll()
+		poller.register(self._wakeup_r, _POLLIN)
+		while self._running:
+			try:
+				poller.poll()
+			except select.error, e:
+				if e.args[0] == errno.EINTR:
+					continue
+				raise
+			self._drain_wakeup()
+			events = self._take_events()
+			if events:
+				self._publish(events)
+				self._record_write(self._taken_captured)
+
+	def _create_ring(self):
+		'''Creates the ring buffer file and maps it'''
+		path = ring_path(self.name)
+		debug_output('creating ring buffer %s' % path)
+		size = HEADER_SIZE + self.slots*SLOT_SIZE
+		# Replace a stale ring atomically, readers still mapping the old one
+		# keep their copy
+		tmp = '%s.%i' % (path, os.getpid())
+		fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0644)
+		try:
+			os.ftruncate(fd, size)
+			self._map(fd, size)
+		finally:
+			os.close(fd)
+		_HEADER.pack_into(self._mm, 0, RING_MAGIC, self.slots, SLOT_SIZE,
+		                  *self.resolution)
+		os.rename(tmp, path)
+
+	def _publish(self, events):
+		'''Writes frames into the ring and wakes up the readers'''
+		mm, slots, written = self._mm, self.slots, self._written
+		# The resolution may be changed after start (mouse server)
+		struct.pack_into('=HH', mm, 12, *self.resolution)
+		data = self._encoder.encode(events)
+		count = len(events)
+		if count > slots:
+			# Only the last ring full survives anyway
+			written += count - slots
+			data = data[(count - slots)*SLOT_SIZE:]
+			count = slots
+		# Readers drop what they copied from the slots written from now on
+		_COUNT.pack_into(mm, _RESERVED_OFFSET, written + count)
+		start = written & (slots - 1)
+		first = min(count, slots - start)*SLOT_SIZE
+		offset = HEADER_SIZE + start*SLOT_SIZE
+		mm[offset:offset+first] = data[:first].tobytes()
+		if first < len(data):
+			mm[HEADER_SIZE:HEADER_SIZE+len(data)-first] = data[first:].tobytes()
+		written += count
+		self._written = written
+		_COUNT.pack_into(mm, _COUNT_OFFSET, written)
+		# Bump the futex word and wake all waiting readers
+		_FUTEX.pack_into(mm, _FUTEX_OFFSET,
+		                 (_FUTEX.unpack_from(mm, _FUTEX_OFFSET)[0] + 1) & 0xffffffff)
+		if _syscall is not None:
+			_syscall(_SYS_FUTEX, self._futex_addr, _FUTEX_WAKE, _INT_MAX,
+			         None, None, 0)
+
+	def close_clients(self):
+		'''
+		x.close_clients()
+		Readers are not known to the writer, so this does nothing.
+		'''
+		pass
+
+	def close(self):
+		'''
+		x.close()
+		Stops the thread and removes the ring buffer.
+		'''
+		self._stop()
+		if self._mm is not None:
+			try:
+				os.unlink(ring_path(self.name))
+			except OSError:
+				pass
+			self._futex = None
+			self._mm.close()
+			self._mm = None
+
+	def client_stats(self):
+		'''
+		x.client_stats() -> list of (name, frames, bytes, backlog)
+		See OutputThread.client_stats(); the ring counts as one client.
+		'''
+		return [('shm:' + self.name, self._written, self._written*SLOT_SIZE, 0)]
+
+	def counters(self):
+		'''
+		x.counters() -> dict
+		Returns the same counters as ServerSocketThread.counters(); the
+		writer never coalesces or drops, readers count their own losses.
+		'''
+		return {'coalesced': 0, 'dropped': 0}
+
+class ShmRingReader(_Ring):
+	'''
+	ShmRingReader(name, [from_start]) -> reader of a ring buffer written by
+	ShmRingThread.
+
+	read() returns the new frames as (opcode, pointer, x, y) tuples and
+	wait() sleeps until the writer publishes more. lost counts the frames
+	that were overwritten before they could be read. Reading starts with
+	the frames written from now on, or with the oldest frame still in the
+	ring if from_start is True.
+	'''
+
+	def __init__(self, name, from_start=False):
+		fd = os.open(ring_path(name), os.O_RDWR)
+		try:
+			size = os.fstat(fd).st_size
+			self._map(fd, size)
+		finally:
+			os.close(fd)
+		magic, self.slots, slot_size, width, height = \
+			_HEADER.unpack_from(self._mm, 0)
+		if magic != RING_MAGIC or slot_size != SLOT_SIZE:
+			self.close()
+			raise ValueError, 'not a vinput ring buffer: %s' % ring_path(name)
+		self.lost = 0
+		self._seq = self._count()
+		if from_start:
+			self._seq = max(0, self._seq - self.slots)
+
+	@property
+	def resolution(self):
+		'''The coordinate range announced by the writer'''
+		return struct.unpack_from('=HH', self._mm, 12)
+
+	def close(self):
+		self._futex = None
+		self._mm.close()
+
+	def read(self):
+		'''
+		x.read() -> list of (opcode, pointer, x, y)
+		Returns all frames written since the last call.
+		'''
+		mm, slots = self._mm, self.slots
+		count = self._count()
+		seq = self._seq
+		if count - seq > slots:
+			# The writer is more than a ring ahead
+			self.lost += count - slots - seq
+			seq = count - slots
+		if seq >= count:
+			return []
+		start = seq & (slots - 1)
+		first = min(count - seq, slots - start)
+		offset = HEADER_SIZE + start*SLOT_SIZE
+		data = mm[offset:offset+first*SLOT_SIZE]
+		if first < count - seq:
+			data += mm[HEADER_SIZE:HEADER_SIZE+(count - seq - first)*SLOT_SIZE]
+		# Slots the writer got to while we were copying hold newer frames
+		# now, or torn ones
+		overwritten = min(self._reserved() - slots - seq, count - seq)
+		self._seq = count
+		if overwritten > 0:
+			self.lost += overwritten
+			return decode_frames(data, overwritten*SLOT_SIZE)
+		return decode_frames(data)
+
+	def wait(self, timeout=None):
+		'''
+		x.wait([timeout])
+		Blocks until the writer published new frames (or timeout seconds
+		passed). Returns immediately if there are unread frames.
+		'''
+		futex = _FUTEX.unpack_from(self._mm, _FUTEX_OFFSET)[0]
+		if self._count() != self._seq:
+			return
+		if _syscall is None:
+			# No futex available, poll the header
+			deadline = None if timeout is None else time.time() + timeout
+			while self._count() == self._seq:
+				if deadline is not None and time.time() >= deadline:
+					return
+				time.sleep(0.001)
+			return
+		ts = None
+		if timeout is not None:
+			ts = _Timespec(int(timeout), int((timeout % 1)*1e9))
+		if _syscall(_SYS_FUTEX, self._futex_addr, _FUTEX_WAIT, futex,
+		            ctypes.byref(ts) if ts is not None else None, None, 0) == -1:
+			if ctypes.get_errno() not in (errno.EAGAIN, errno.EINTR,
+			                              errno.ETIMEDOUT):
+				raise OSError, (ctypes.get_errno(),
+				                os.strerror(ctypes.get_errno()))
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Turns the touches of an input source into vinput events.
+
+ TouchSender holds everything the libavg server does with a touch besides
+ receiving it, so it can be driven without libavg (see bench_load.py).
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import time
+
+from vinputserver.common import debug_output
+from vinputserver.cursorids import CursorIdAllocator
+from vinputserver.tracebuf import trace_point
+
+# The pointer number is -1 for touches which did not get one
+TRACE_DOWN = trace_point('down', 'touch %i at %ix%i: pointer %i')
+TRACE_UP = trace_point('up', 'touch %i at %ix%i: pointer %i')
+TRACE_RECLAIM = trace_point('reclaim', 'touch %i lost: pointer %i')
+
+class TouchSender(object):
+	'''
+	TouchSender(server, cursorcount, [touch_timeout], [motion_filter],
+	            [gestures])
+	-> maps touches onto pointer numbers and sends their events through
+	server.
+
+	 server: output thread (or anything with send() and flush())
+	 cursorcount: number of touches processed simultaneously
+	 touch_timeout: milliseconds after which the id of a touch that got
+	                no more events may be reclaimed for a new touch once
+	                all ids are in use (0 or None: never)
+	 motion_filter: filter stage the motion of every pointer goes through
+	                (see vinputserver.filters), None for raw positions
+	 gestures: GestureTracker (vinputserver.gestures) getting the pointers
+	           as sent; its gesture frames go to server.send_gesture() while
+	           server.gesture_clients is not 0. None disables gestures.
+
+	The input source calls down(), motion() and up() for every touch event
+	and frame() at the end of each of its frames.
+	'''
+
+	def __init__(self, server, cursorcount, touch_timeout=None,
+	             motion_filter=None, gestures=None):
+		self.server = server
+		self.motion_filter = motion_filter
+		self.gestures = gestures
+		self.cursorcount = cursorcount
+		self.cursorids = CursorIdAllocator(cursorcount,
+		                                   (touch_timeout or 0)/1000.0)
+
+	def down(self, touchid, xcoord, ycoord):
+		'''Handles a beginning touch'''
+		# Assign smallest free id to current cursor id. Lost touches are only
+		# reclaimed here, when the ids run out: a finger resting on an evdev
+		# device sends nothing for any time.
+		myid, reclaimed = self.cursorids.acquire(touchid)
+		self._release_lost(reclaimed)
+		tracer = self.server.tracer
+		if tracer is not None:
+			tracer.trace(TRACE_DOWN, touchid, xcoord, ycoord,
+			             -1 if myid is None else myid)
+		# If an id could be assigned, send events:
+		if myid is not None:
+			if self.motion_filter is not None:
+				self.motion_filter.down(myid, xcoord, ycoord, time.time())
+			self.server.send('.', myid, xcoord, ycoord)
+			self.server.send('d', myid, xcoord, ycoord)
+			if self.gestures is not None:
+				self.gestures.down(myid, xcoord, ycoord)
+		# If there is no free id, show a warning
+		else:
+			debug_output(('Ignoring pointer at %ix%i; maximum of %i '
+			             +'cursors reached.')
+			             % (xcoord, ycoord, self.cursorcount))
+
+	def up(self, touchid, xcoord, ycoord):
+		'''Handles an ending touch'''
+		myid = self.cursorids.release(touchid)
+		tracer = self.server.tracer
+		if tracer is not None:
+			tracer.trace(TRACE_UP, touchid, xcoord, ycoord,
+			             -1 if myid is None else myid)
+		if myid is not None:
+			if self.motion_filter is not None:
+				self.motion_filter.up(myid)
+			self.server.send('u', myid, xcoord, ycoord)
+			if self.gestures is not None:
+				self.gestures.up(myid)
+
+	def motion(self, touchid, xcoord, ycoord):
+		'''Handles a touch movement'''
+		myid = self.cursorids.lookup(touchid)
+		if myid is not None:
+			if self.motion_filter is not None:
+				xcoord, ycoord = self.motion_filter.filter(myid, xcoord, ycoord,
+				                                          time.time())
+				xcoord, ycoord = int(xcoord + 0.5), int(ycoord + 0.5)
+			self.server.send('.', myid, xcoord, ycoord)
+			if self.gestures is not None:
+				self.gestures.motion(myid, xcoord, ycoord)
+
+	def frame(self, now=None):
+		'''
+		x.frame([now])
+		Ends a frame of the input source: hands all events of the frame to
+		the server in one batch and then the gesture frame, if any.
+		'''
+		if now is None:
+			now = time.time()
+		self.server.flush()
+		gestures = self.gestures
+		if gestures is not None:
+			if self.server.gesture_clients:
+				gesture = gestures.frame(now)
+				if gesture is not None:
+					self.server.send_gesture(gesture)
+			else:
+				# Nobody listens: the next subscriber starts with a new gesture
+				gestures.idle()
+
+	def _release_lost(self, reclaimed):
+		'''Sends releases for touches which never got an up event'''
+		if reclaimed and self.server.latency is not None:
+			self.server.latency.capture()
+		tracer = self.server.tracer
+		for touchid, myid in reclaimed:
+			debug_output('Reclaiming id %i of lost touch %r' % (myid, touchid))
+			if tracer is not None:
+				tracer.trace(TRACE_RECLAIM, touchid, myid)
+			if self.motion_filter is not None:
+				self.motion_filter.up(myid)
+			self.server.send('u', myid, 0, 0)
+			if self.gestures is not None:
+				self.gestures.up(myid)
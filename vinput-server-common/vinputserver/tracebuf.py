@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Tracing of the hot path into an in-memory ring buffer.
+
+ Trace points are registered once with trace_point() and fired with
+ TraceBuffer.trace(). The servers keep their TraceBuffer in the tracer
+ attribute of the output thread; while it is None a trace point costs one
+ attribute check:
+
+	tracer = server.tracer
+	if tracer is not None:
+		tracer.trace(TRACE_SEND, ord(opcode), pointer, xcoord, ycoord)
+
+ Records are fixed-size binary structs (sequence number, time, trace point
+ and four integer arguments). Nothing is formatted until the buffer is
+ dumped, which the servers do on SIGUSR1 and at exit.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import itertools, struct, sys, time
+
+########## Defaults ##########
+
+# Number of records kept; has to be a power of two
+DEF_TRACE_RECORDS = 1 << 16
+
+##############################
+
+# Sequence number + 1 (0: never written), time, trace point, arguments
+_RECORD = struct.Struct('=QdIqqqq')
+RECORD_SIZE = _RECORD.size
+
+# Registered trace points: (name, fmt) by number
+_points = []
+
+def trace_point(name, fmt):
+	'''
+	trace_point(name, fmt) -> trace point number
+	Registers a trace point. fmt is applied to the integer arguments
+	of a record when the buffer is dumped (e.g. '%c pointer %i at %ix%i').
+	'''
+	_points.append((name, fmt))
+	return len(_points) - 1
+
+class TraceBuffer(object):
+	'''
+	TraceBuffer([records]) -> ring buffer holding the given number of
+	trace records; the oldest are overwritten.
+
+	trace() may be called from several threads at once; the sequence
+	numbers are handed out atomically, so each record gets its own slot.
+	'''
+
+	def __init__(self, records=DEF_TRACE_RECORDS):
+		if records <= 0 or records & (records - 1):
+			raise ValueError, 'number of records must be a power of two'
+		self.records = records
+		self._mask = records - 1
+		self._buffer = bytearray(records*RECORD_SIZE)
+		self._seq = itertools.count(1)
+
+	def trace(self, point, arg1=0, arg2=0, arg3=0, arg4=0):
+		'''x.trace(point, [arg1, [arg2, [arg3, [arg4]]]]) - stores a record'''
+		seq = self._seq.next()
+		_RECORD.pack_into(self._buffer, ((seq - 1) & self._mask)*RECORD_SIZE,
+		                  seq, time.time(), point, int(arg1), int(arg2),
+		                  int(arg3), int(arg4))
+
+	def entries(self):
+		'''
+		x.entries() -> list of (time, name, message)
+		Returns the records in the buffer, oldest first.
+		'''
+		unpack = _RECORD.unpack_from
+		records = [unpack(self._buffer, offset) for offset
+		           in xrange(0, len(self._buffer), RECORD_SIZE)]
+		records = [record for record in records if record[0]]
+		records.sort()
+		entries = []
+		for seq, stamp, point, arg1, arg2, arg3, arg4 in records:
+			try:
+				name, fmt = _points[point]
+				count = fmt.count('%') - 2*fmt.count('%%')
+				message = fmt % (arg1, arg2, arg3, arg4)[:count]
+			except (IndexError, TypeError, ValueError, OverflowError):
+				name, message = '?', 'invalid record %r' % ((point, arg1, arg2,
+				                                             arg3, arg4),)
+			entries.append((stamp, name, message))
+		return entries
+
+	def dump(self, stream):
+		'''
+		x.dump(stream)
+		Writes the records in the buffer as text lines to a file object.
+		'''
+		for stamp, name, message in self.entries():
+			stream.write('%s.%06i %-10s %s\n' % (time.strftime('%H:%M:%S',
+				time.localtime(stamp)), int(stamp % 1*1e6), name, message))
+		stream.flush()
+
+	def dump_file(self, path):
+		'''
+		x.dump_file(path)
+		Appends the records to a file ('-': standard error).
+		'''
+		if path == '-':
+			self.dump(sys.stderr)
+			return
+		with open(path, 'a') as stream:
+			self.dump(stream)
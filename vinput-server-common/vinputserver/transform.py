@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Per-client affine coordinate transforms.
+
+ A client may ask the server to transform the coordinates it gets, e.g. to
+ calibrate a projector or to use a rotated display, by sending a transform
+ request after connecting:
+
+  request: "#T", six 32-bit floats a, b, c, d, e, f, 16-bit output width
+           and height (0, 0: the resolution announced so far)
+
+ The server maps every point (x, y) to (a*x + b*y + c, d*x + e*y + f) and
+ answers at the next frame boundary with a new HELO (HELO2 for version 2
+ clients) announcing the output resolution. make_transform() builds the
+ matrix from scale, rotation, offset and a calibration matrix.
+
+ Transform.apply() works on all events of a batch at once, with NumPy if
+ it is installed and the batch is large enough to pay for the conversion.
+ The server applies each distinct transform once per batch, however many
+ clients use it.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import math, struct
+
+from vinputserver.protocol import MAX_COORD
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+TRANSFORM_MAGIC = '#T'
+
+_TRANSFORM_REQUEST = struct.Struct('!2s6fHH')
+TRANSFORM_REQUEST_SIZE = _TRANSFORM_REQUEST.size
+
+# Smallest batch transformed with NumPy; below, converting the batch to
+# arrays and back costs more than it saves
+NUMPY_MIN_EVENTS = 32
+
+def encode_transform_request(transform):
+	'''Returns the request a client sends to get its events transformed'''
+	return _TRANSFORM_REQUEST.pack(TRANSFORM_MAGIC,
+	                               *(transform.matrix
+	                                 + (transform.resolution or (0, 0))))
+
+def decode_transform_request(data, offset=0):
+	'''
+	decode_transform_request(data, [offset]) -> Transform
+	Raises ValueError if data is no valid transform request.
+	'''
+	fields = _TRANSFORM_REQUEST.unpack_from(data, offset)
+	if fields[0] != TRANSFORM_MAGIC:
+		raise ValueError, 'invalid transform request magic %r' % fields[0]
+	for value in fields[1:7]:
+		if math.isnan(value) or math.isinf(value):
+			raise ValueError, 'invalid transform matrix %r' % (fields[1:7],)
+	return Transform(fields[1:7], fields[7:] if any(fields[7:]) else None)
+
+def make_transform(scale=(1.0, 1.0), rotation=0.0, offset=(0.0, 0.0),
+                   calibration=None, resolution=None):
+	'''
+	make_transform([scale], [rotation], [offset], [calibration],
+	               [resolution]) -> Transform
+	Scales a point, rotates it by rotation degrees (counterclockwise around
+	the origin), moves it by offset and finally applies the calibration
+	matrix (a, b, c, d, e, f) if one is given.
+	'''
+	cos = math.cos(math.radians(rotation))
+	sin = math.sin(math.radians(rotation))
+	matrix = (cos*scale[0], -sin*scale[1], offset[0],
+	          sin*scale[0], cos*scale[1], offset[1])
+	if calibration is not None:
+		matrix = _compose(calibration, matrix)
+	return Transform(matrix, resolution)
+
+def _compose(outer, inner):
+	'''Returns the matrix applying inner first, then outer'''
+	a1, b1, c1, d1, e1, f1 = outer
+	a2, b2, c2, d2, e2, f2 = inner
+	return (a1*a2 + b1*d2, a1*b2 + b1*e2, a1*c2 + b1*f2 + c1,
+	        d1*a2 + e1*d2, d1*b2 + e1*e2, d1*c2 + e1*f2 + f1)
+
+class Transform(object):
+	'''
+	Transform(matrix, [resolution]) -> affine transform of the coordinates.
+
+	 matrix: (a, b, c, d, e, f) mapping (x, y) to
+	         (a*x + b*y + c, d*x + e*y + f)
+	 resolution: output resolution announced to the client (None: keep)
+
+	Transforms with the same matrix and resolution compare equal, so the
+	server can share the transformed batch between their clients.
+	'''
+
+	__slots__ = ('matrix', 'resolution', '_key')
+
+	def __init__(self, matrix, resolution=None):
+		if len(matrix) != 6:
+			raise ValueError, 'an affine matrix has six elements'
+		self.matrix = tuple([float(value) for value in matrix])
+		self.resolution = tuple(resolution) if resolution else None
+		self._key = (self.matrix, self.resolution)
+
+	def __eq__(self, other):
+		return isinstance(other, Transform) and self._key == other._key
+
+	def __ne__(self, other):
+		return not self == other
+
+	def __hash__(self):
+		return hash(self._key)
+
+	def __repr__(self):
+		return 'Transform(%r, %r)' % self._key
+
+	def point(self, xcoord, ycoord):
+		'''x.point(xcoord, ycoord) -> transformed (x, y), not clamped'''
+		a, b, c, d, e, f = self.matrix
+		return a*xcoord + b*ycoord + c, d*xcoord + e*ycoord + f
+
+	def apply(self, events):
+		'''
+		x.apply(events) -> list of (opcode, pointer, x, y)
+		Transforms the coordinates of a batch of (opcode, pointer, x, y)
+		tuples; the results are integers clamped to the protocol's range.
+		'''
+		if numpy is not None and len(events) >= NUMPY_MIN_EVENTS:
+			return self._apply_numpy(events)
+		a, b, c, d, e, f = self.matrix
+		result = []
+		append = result.append
+		for opcode, pointer, xcoord, ycoord in events:
+			newx = int(a*xcoord + b*ycoord + c)
+			newy = int(d*xcoord + e*ycoord + f)
+			append((opcode, pointer,
+			        newx if 0 <= newx <= MAX_COORD else min(max(newx, 0), MAX_COORD),
+			        newy if 0 <= newy <= MAX_COORD else min(max(newy, 0), MAX_COORD)))
+		return result
+
+	def _apply_numpy(self, events):
+		'''apply() for large batches'''
+		opcodes, pointers, xcoords, ycoords = zip(*events)
+		points = numpy.array((xcoords, ycoords), dtype=numpy.float64)
+		a, b, c, d, e, f = self.matrix
+		matrix = numpy.array(((a, b), (d, e)))
+		points = numpy.dot(matrix, points)
+		points[0] += c
+		points[1] += f
+		# Truncate towards zero like int() before clamping
+		points = numpy.clip(numpy.trunc(points), 0, MAX_COORD).astype(numpy.int64)
+		return zip(opcodes, pointers, points[0].tolist(), points[1].tolist())
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Reference client feeding the events of a vinput server into uinput.
+
+ Like the C++ client (vinput-client), UInputClient creates one absolute
+ pointer device per pointer number after the HELO and carries out the
+ frames of the server on them. Instead of one write() per input_event it
+ collects the input_event records of a whole batch (everything one recv()
+ returned) in a preallocated buffer per device and writes each device
+ once. Every action still ends with its own SYN_REPORT, so the input
+ subsystem sees the same sequence of reports.
+
+ The devices only need a file descriptor: open_uinput_device() creates a
+ real uinput device, any other function returning a descriptor (a pipe,
+ /dev/null) can stand in for it, e.g. to count the writes and bytes.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import os, errno, fcntl, struct, time
+
+from vinputserver.common import debug_output
+from vinputserver.protocol import FRAME_SIZE, HELO_MAGIC, decode_frame
+
+# Pointer devices created by default, like the C++ client
+DEF_POINTERS = 4
+# input_event records a device buffer holds before it has to grow
+DEF_BUFFER_EVENTS = 256
+
+# From linux/input.h
+EV_SYN = 0x00
+EV_KEY = 0x01
+EV_ABS = 0x03
+SYN_REPORT = 0
+ABS_X = 0x00
+ABS_Y = 0x01
+ABS_PRESSURE = 0x18
+BTN_LEFT = 0x110
+BTN_TOOL_PEN = 0x140
+BTN_TOUCH = 0x14a
+BUS_USB = 0x03
+
+# struct input_event: struct timeval, __u16 type, __u16 code, __s32 value
+_INPUT_EVENT = struct.Struct('@llHHi')
+INPUT_EVENT_SIZE = _INPUT_EVENT.size
+
+# From linux/uinput.h
+UINPUT_MAX_NAME_SIZE = 80
+ABS_CNT = 0x40
+# struct uinput_user_dev: name, struct input_id, ff_effects_max, absmax,
+# absmin, absfuzz, absflat
+_USER_DEV = struct.Struct('@%isHHHHI%ii' % (UINPUT_MAX_NAME_SIZE, 4*ABS_CNT))
+
+def _ioc(direction, number, size):
+	'''Returns the request number of a uinput ioctl'''
+	return direction << 30 | size << 16 | ord('U') << 8 | number
+
+UI_DEV_CREATE = _ioc(0, 1, 0)
+UI_DEV_DESTROY = _ioc(0, 2, 0)
+UI_SET_EVBIT = _ioc(1, 100, 4)
+UI_SET_KEYBIT = _ioc(1, 101, 4)
+UI_SET_ABSBIT = _ioc(1, 103, 4)
+
+def open_uinput_device(name, width, height, path='/dev/uinput'):
+	'''
+	open_uinput_device(name, width, height, [path]) -> file descriptor
+	Creates an absolute pointer device with the same setup as the C++
+	client's UInputAbsPointer.
+	'''
+	fd = os.open(path, os.O_WRONLY | os.O_NDELAY)
+	try:
+		fcntl.ioctl(fd, UI_SET_EVBIT, EV_ABS)
+		fcntl.ioctl(fd, UI_SET_EVBIT, EV_KEY)
+		for code in (ABS_X, ABS_Y, ABS_PRESSURE):
+			fcntl.ioctl(fd, UI_SET_ABSBIT, code)
+		# The X server needs BTN_TOOL_PEN to take the coordinates as
+		# absolute ones
+		for code in (BTN_TOUCH, BTN_LEFT, BTN_TOOL_PEN):
+			fcntl.ioctl(fd, UI_SET_KEYBIT, code)
+		absmax, absmin = [0]*ABS_CNT, [0]*ABS_CNT
+		absmax[ABS_X], absmax[ABS_Y], absmax[ABS_PRESSURE] = width, height, 1
+		_write_all(fd, _USER_DEV.pack(name[:UINPUT_MAX_NAME_SIZE], BUS_USB, 0,
+		                              0, 4, 0, *(absmax + absmin + [0]*ABS_CNT
+		                                         + [0]*ABS_CNT)))
+		fcntl.ioctl(fd, UI_DEV_CREATE)
+	except:
+		os.close(fd)
+		raise
+	return fd
+
+def _write_all(fd, data):
+	'''Writes all of data, however many writes it takes; returns their number'''
+	view = memoryview(data)
+	writes = 0
+	while len(view):
+		try:
+			written = os.write(fd, view)
+		except OSError, e:
+			if e.errno == errno.EINTR:
+				continue
+			raise
+		writes += 1
+		view = view[written:]
+	return writes
+
+class PointerDevice(object):
+	'''
+	PointerDevice(fd, [capacity]) -> an absolute pointer fed through fd.
+
+	move(), press() and release() only add input_event records to the
+	buffer; flush() writes them all at once. writes and bytes count what
+	went to fd so far.
+	'''
+
+	def __init__(self, fd, capacity=DEF_BUFFER_EVENTS):
+		self.fd = fd
+		self._buffer = bytearray(capacity*INPUT_EVENT_SIZE)
+		self._size = 0
+		# Timestamp of the records of the current batch
+		self._sec = self._usec = 0
+		self.writes = 0
+		self.bytes = 0
+
+	def _add(self, type_, code, value):
+		'''Adds an input_event record to the buffer'''
+		if self._size + INPUT_EVENT_SIZE > len(self._buffer):
+			self._buffer.extend(bytearray(len(self._buffer)))
+		_INPUT_EVENT.pack_into(self._buffer, self._size, self._sec,
+		                       self._usec, type_, code, value)
+		self._size += INPUT_EVENT_SIZE
+
+	def stamp(self, now):
+		'''Sets the time of the records added from now on (seconds)'''
+		self._sec = int(now)
+		self._usec = int((now - self._sec)*1e6)
+
+	def move(self, xcoord, ycoord):
+		'''Moves the pointer'''
+		self._add(EV_ABS, ABS_X, xcoord)
+		self._add(EV_ABS, ABS_Y, ycoord)
+		self._add(EV_SYN, SYN_REPORT, 0)
+
+	def press(self):
+		'''Presses the button'''
+		self._add(EV_KEY, BTN_LEFT, 1)
+		self._add(EV_ABS, ABS_PRESSURE, 1)
+		self._add(EV_SYN, SYN_REPORT, 0)
+
+	def release(self):
+		'''Releases the button'''
+		self._add(EV_KEY, BTN_LEFT, 0)
+		self._add(EV_ABS, ABS_PRESSURE, 0)
+		self._add(EV_SYN, SYN_REPORT, 0)
+
+	def flush(self):
+		'''Writes the buffered records with a single write'''
+		if self._size:
+			self.writes += _write_all(self.fd,
+			                          memoryview(self._buffer)[:self._size])
+			self.bytes += self._size
+			self._size = 0
+
+	def close(self):
+		'''Destroys a uinput device and closes fd'''
+		try:
+			fcntl.ioctl(self.fd, UI_DEV_DESTROY)
+		except IOError:
+			# Not a uinput device
+			pass
+		os.close(self.fd)
+
+class UInputClient(object):
+	'''
+	UInputClient(sock, [pointers], [open_device]) -> client carrying out
+	the frames a vinput server sends on sock.
+
+	 pointers: number of pointer devices; frames for higher pointer
+	           numbers are ignored
+	 open_device: open_device(name, width, height) -> file descriptor of
+	              a new device (default: open_uinput_device)
+
+	run() reads until the server closes the connection; feed() takes data
+	received elsewhere. frames and batches count what was carried out.
+	'''
+
+	# Class of the devices, wrapping the descriptors of open_device
+	device_class = PointerDevice
+
+	def __init__(self, sock, pointers=DEF_POINTERS,
+	             open_device=open_uinput_device):
+		self.sock = sock
+		self.pointers = pointers
+		self.open_device = open_device
+		self.devices = None
+		self.resolution = None
+		self.frames = 0
+		self.batches = 0
+		self._buffer = ''
+
+	def run(self):
+		'''Receives and carries out frames until the connection is closed'''
+		while True:
+			try:
+				data = self.sock.recv(65536)
+			except IOError, e:
+				if e.errno == errno.EINTR:
+					continue
+				raise
+			if not data:
+				break
+			self.feed(data)
+
+	def feed(self, data):
+		'''Carries out the complete frames of data as one batch'''
+		data = self._buffer + data
+		end = len(data) - len(data) % FRAME_SIZE
+		self._buffer = data[end:]
+		if not end:
+			return
+		offset = 0
+		if self.devices is None:
+			if data[:2] != HELO_MAGIC:
+				raise ValueError, 'received invalid HELO'
+			self._helo(decode_frame(data)[2:])
+			offset = FRAME_SIZE
+		devices = self.devices
+		now = time.time()
+		for device in devices:
+			device.stamp(now)
+		touched = set()
+		for offset in xrange(offset, end, FRAME_SIZE):
+			opcode, pointer, xcoord, ycoord = decode_frame(data, offset)
+			if opcode == '#':
+				debug_output('ignoring new resolution %ix%i' % (xcoord, ycoord))
+				continue
+			if pointer >= len(devices) or opcode not in '.dDuU!':
+				continue
+			device = devices[pointer]
+			if opcode in '.DU!':
+				device.move(xcoord, ycoord)
+			if opcode in 'dD!':
+				device.press()
+			if opcode in 'uU!':
+				device.release()
+			touched.add(device)
+			self.frames += 1
+		for device in touched:
+			device.flush()
+		self.batches += 1
+
+	def _helo(self, resolution):
+		'''Creates the devices for the announced resolution'''
+		self.resolution = resolution
+		debug_output('server resolution %ix%i' % resolution)
+		self.devices = []
+		for index in xrange(self.pointers):
+			fd = self.open_device('MTC Touchpoint %i' % index, *resolution)
+			self.devices.append(self.device_class(fd))
+
+	def close(self):
+		'''Destroys the devices'''
+		for device in self.devices or ():
+			device.close()
+		self.devices = None
+
+	def stats(self):
+		'''
+		x.stats() -> (frames, batches, writes, bytes)
+		Returns what was carried out and written to the devices so far.
+		'''
+		devices = self.devices or ()
+		return (self.frames, self.batches,
+		        sum([device.writes for device in devices]),
+		        sum([device.bytes for device in devices]))
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+"""
+ Socket fan-out in a separate worker process.
+
+ The input process only writes the frames into a shared memory ring buffer
+ (see shmring.py). A worker process reads them and runs the
+ ServerSocketThread, which accepts the clients, sends the HELO, writes to
+ every client and evicts the slow ones. Socket work thus never competes
+ with rendering and touch tracking for the GIL of the input process.
+ Counting and recording the events, and the metrics of the clients, are
+ the worker's as well; the input process only publishes the batches.
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import multiprocessing, os, signal, time
+
+from vinputserver.common import debug_output
+from vinputserver.server import ServerSocketThread, FLUSH_FRAME, \
+                                DEF_MAX_BATCH_AGE
+from vinputserver.shmring import ShmRingThread, ShmRingReader
+from vinputserver.metrics import MetricsServer
+
+# Ring buffer slots between input and worker process
+DEF_WORKER_SLOTS = 1 << 16
+# Seconds the worker tries to write the remaining frames when stopped
+_DRAIN_TIMEOUT = 1.0
+
+def _worker_main(ring, stop, server_args, server_kwargs, recorder,
+                 metrics_addr):
+	'''Main function of the worker process'''
+	# The input process handles these
+	for signum in (signal.SIGINT, signal.SIGUSR1, signal.SIGUSR2):
+		signal.signal(signum, signal.SIG_IGN)
+	reader = ShmRingReader(ring, from_start=True)
+	server = ServerSocketThread(reader.resolution, *server_args,
+	                            **server_kwargs)
+	server.recorder = recorder
+	metrics = None
+	if metrics_addr is not None:
+		metrics = MetricsServer(server, *metrics_addr)
+		metrics.start()
+	server.start()
+	try:
+		while not stop.is_set():
+			reader.wait(0.5)
+			frames = reader.read()
+			if frames:
+				# The mouse server changes its resolution after start
+				server.resolution = reader.resolution
+				for frame in frames:
+					server.send(*frame)
+				server.flush()
+		# Deliver what the input process wrote before it stopped us
+		for frame in reader.read():
+			server.send(*frame)
+		server.flush()
+		deadline = time.time() + _DRAIN_TIMEOUT
+		while (server.queue_depth() or
+		       sum([stats[3] for stats in server.client_stats()])) and \
+		      time.time() < deadline:
+			time.sleep(0.01)
+	finally:
+		if metrics is not None:
+			metrics.close()
+		server.close()
+		if recorder is not None:
+			recorder.close()
+		reader.close()
+		debug_output('worker: %(coalesced)i motion frames coalesced, '
+		             '%(dropped)i dropped' % server.counters())
+		debug_output('worker: %i frames lost in the ring buffer' % reader.lost)
+
+class WorkerServer(ShmRingThread):
+	"""
+	WorkerServer(announce_resolution, sock_addr, sock_family,
+	             [sock_type, [sock_protocol]], [slots], [flush_mode],
+	             [max_batch_age], [metrics_addr], **server_kwargs)
+	-> a ShmRingThread whose frames a worker process sends to the socket
+	clients.
+
+	No thread is started in the input process: flush() writes the batch
+	into the ring itself, which costs less than handing it to a thread.
+
+	 slots: size of the ring buffer between the processes
+	 flush_mode, max_batch_age: see OutputThread
+	 metrics_addr: (sock_addr, sock_family) of a MetricsServer the worker
+	               runs for its clients, or None; it cannot see the id
+	               allocation of the input source
+	 The other arguments are passed to the ServerSocketThread of the
+	 worker (max_buffer, lag_policy, max_lag).
+
+	A recorder set before start() records in the worker. The counters of
+	the socket clients are only known to the worker, which prints them at
+	exit in debug mode.
+	"""
+
+	def __init__(self, announce_resolution, sock_addr, sock_family,
+	             sock_type=None, sock_protocol=0, slots=DEF_WORKER_SLOTS,
+	             flush_mode=FLUSH_FRAME, max_batch_age=DEF_MAX_BATCH_AGE,
+	             metrics_addr=None, **server_kwargs):
+		"""
+		constructor - initializes x
+		"""
+		super(WorkerServer, self).__init__(announce_resolution,
+		                                   'worker-%i' % os.getpid(), slots,
+		                                   flush_mode, max_batch_age)
+		self._server_args = (sock_addr, sock_family)
+		if sock_type is not None:
+			self._server_args += (sock_type, sock_protocol)
+		# The worker already batches everything it reads at once
+		server_kwargs['flush_mode'] = FLUSH_FRAME
+		server_kwargs['max_batch_age'] = 0
+		self._server_kwargs = server_kwargs
+		self.metrics_addr = metrics_addr
+		self._stop_worker = multiprocessing.Event()
+		self._process = None
+
+	def start(self):
+		'''
+		x.start()
+		Creates the ring buffer and starts the worker process, which takes
+		over the recorder set so far.
+		'''
+		self._create_ring()
+		# The forked worker gets the open recording; the input process
+		# never writes to its copy
+		self._process = multiprocessing.Process(target=_worker_main,
+			name='vinput transport worker',
+			args=(self.name, self._stop_worker, self._server_args,
+			      self._server_kwargs, self.recorder, self.metrics_addr))
+		self._process.daemon = True
+		self._process.start()
+
+	def _wakeup(self):
+		'''
+		Publishes the queued batches instead of waking up a thread; the
+		worker counts and records them
+		'''
+		events = self._take_batches()
+		if events and self._mm is not None:
+			self._publish(events)
+			self._record_write(self._taken_captured)
+
+	def close(self):
+		'''
+		x.close()
+		Stops the worker process once it has written the remaining frames
+		and removes the ring buffer.
+		'''
+		self._stop_worker.set()
+		if self._process is not None and self._process.is_alive():
+			self._process.join(_DRAIN_TIMEOUT + 1.0)
+			if self._process.is_alive():
+				self._process.terminate()
+		super(WorkerServer, self).close()
+
+	def close_clients(self):
+		'''
+		x.close_clients()
+		The clients belong to the worker; they are closed when it stops.
+		'''
+		pass
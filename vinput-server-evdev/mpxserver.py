@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ This program implements a headless server: it reads the touches of a
+ Linux evdev touch device (/dev/input/eventN) directly and sends them to
+ its clients, without libavg, GTK or a display.
+
+ The device is read in large chunks, decoded in bulk and the touches of
+ every report go through the same id mapping and send path as those of
+ the libavg server. A file or pipe with input_event records (e.g. saved
+ with "cat /dev/input/eventN > touches") can stand in for the device.
+
+ Usage: mpxserver.py [options] DEVICE
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+
+ License:
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+########## Defaults ##########
+
+DEBUG = False
+DEF_CURSORCOUNT = 4
+# Milliseconds after which a touch without release counts as lost
+# once all cursor ids are in use
+DEF_TOUCH_TIMEOUT = 10000
+DEF_LISTEN_ADDR = '::'
+DEF_PORT = 1243
+DEF_RESOLUTION = (1280, 720)
+DEF_GRAB = False
+
+##############################
+
+import os, sys
+
+from vinputserver import common
+from vinputserver.common import debug_output
+from vinputserver.options import ServerOptions
+from vinputserver.touches import TouchSender
+from vinputserver.filters import parse_filters
+from vinputserver.gestures import GestureTracker
+from vinputserver.evdev import EvdevSource, DEF_READ_EVENTS
+
+def main():
+	'''main program - creates a server reading an evdev device and runs it'''
+	common.DEBUG = DEBUG
+	# Process parameters; every report of the device ends a frame
+	options = ServerOptions(DEF_RESOLUTION, (DEF_LISTEN_ADDR, DEF_PORT),
+	                        DEF_CURSORCOUNT, flush=False)
+	touch_timeout = DEF_TOUCH_TIMEOUT
+	motion_filter = None
+	grab, read_events = DEF_GRAB, DEF_READ_EVENTS
+	gestures = False
+	device = None
+	args = sys.argv[1:]
+	try:
+		while len(args) > 0:
+			if args[0].startswith('--touch-timeout='):
+				touch_timeout = int(args[0][16:])
+				args.pop(0)
+			elif args[0].startswith('--filter='):
+				motion_filter = parse_filters(args[0][9:])
+				args.pop(0)
+			elif args[0] == '--gestures':
+				gestures = True
+				args.pop(0)
+			elif args[0] == '--grab':
+				grab = True
+				args.pop(0)
+			elif args[0].startswith('--read-events='):
+				read_events = int(args[0][14:])
+				if read_events <= 0:
+					raise ValueError, 'invalid number of records'
+				args.pop(0)
+			elif options.parse(args):
+				pass
+			elif args[0].startswith('-') or device is not None:
+				print >> sys.stderr, 'Unknown parameter "%s". Aborted.' \
+				                     % args[0]
+				sys.exit(1)
+			else:
+				device = args[0]
+				args.pop(0)
+	except IndexError:
+		print >> sys.stderr, 'Parameter "%s" needs an argument. Aborted.' \
+		                     % args[0]
+		sys.exit(1)
+	except ValueError:
+		print >> sys.stderr, 'Invalid syntax for parameter "%s". Aborted.' \
+		                     % args[0]
+		sys.exit(1)
+	if device is None:
+		print >> sys.stderr, 'No input device given. Aborted.'
+		sys.exit(1)
+	if gestures:
+		# Gesture frames go to the clients subscribed to them
+		if not options.stream_output():
+			print >> sys.stderr, 'Gestures need a stream socket without a worker. Aborted.'
+			sys.exit(1)
+		try:
+			gestures = GestureTracker(options.cursorcount)
+		except ImportError:
+			print >> sys.stderr, 'Gesture recognition needs NumPy. Aborted.'
+			sys.exit(1)
+	else:
+		gestures = None
+	try:
+		fd = os.open(device, os.O_RDONLY)
+	except OSError, e:
+		print >> sys.stderr, 'Cannot open device "%s": %s. Aborted.' \
+		                     % (device, e.strerror)
+		sys.exit(1)
+	server = options.create_output()
+	server.start()
+	touches = TouchSender(server, options.cursorcount, touch_timeout,
+	                      motion_filter, gestures)
+	source = EvdevSource(fd, touches, options.resolution, grab, read_events)
+	if options.handoff is not None:
+		# Quit once a new server took over the clients
+		server.on_handoff = source.stop
+	metrics = options.start_metrics(server, touches.cursorids)
+	# Read the device until it is gone or interrupted
+	debug_output('reading %s' % device)
+	try:
+		source.run()
+	except KeyboardInterrupt:
+		pass
+	debug_output('terminating')
+	os.close(fd)
+	debug_output('%i records in %i reads, %i reports, %i dropped'
+	             % (source.records, source.reads, source.decoder.reports,
+	                source.decoder.dropped))
+	options.finish(server, metrics)
+if __name__ == '__main__':
+	main()
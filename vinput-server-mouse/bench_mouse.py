@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ Measures how many motion events per second the GTK mouse server's
+ handlers take in the normal, --lean and --headless modes.
+
+ Synthetic motion events are fed into MouseWindow.motion_notify_event,
+ several per main loop iteration, followed by the idle callbacks GTK would
+ run. The events go through a ServerSocketThread to a forked client. With
+ PyGTK and a display, the label is a real gtk.Label; otherwise only the
+ formatting of its text is measured. X server round trips of
+ get_pointer() in the normal (motion hint) mode are not included, so the
+ real difference is larger.
+
+ Usage: bench_mouse.py [events] [events per main loop iteration]
+
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+ License: GNU GPL version 3 or later, see vinputserver/__init__.py
+"""
+
+import os, sys, time, socket
+
+from vinputserver.server import ServerSocketThread, FLUSH_FRAME
+from mpxserver import MouseWindow, DISPLAY_EVENT, DISPLAY_IDLE, DISPLAY_NONE
+
+MODES = (('normal', DISPLAY_EVENT), ('lean', DISPLAY_IDLE),
+         ('headless', DISPLAY_NONE))
+
+class _Label(object):
+	'''Stands in for gtk.Label without a display'''
+	def set_text(self, text):
+		self.text = text
+
+class _Window(object):
+	'''The gtk.gdk.Window of a hint event, answering get_pointer()'''
+	def __init__(self, event):
+		self.event = event
+	def get_pointer(self):
+		return self.event.x, self.event.y, 0
+
+class _MotionEvent(object):
+	def __init__(self, x, y, is_hint):
+		self.type = 3
+		self.x, self.y, self.state = x, y, 0
+		self.is_hint = is_hint
+		self.window = _Window(self)
+
+class _BenchWindow(MouseWindow):
+	'''MouseWindow running its idle callbacks when told to'''
+	def __init__(self, *args, **kwargs):
+		MouseWindow.__init__(self, *args, **kwargs)
+		self.idle = []
+	def idle_add(self, callback):
+		self.idle.append(callback)
+	def run_idle(self):
+		idle, self.idle = self.idle, []
+		for callback in idle:
+			callback()
+
+def make_label():
+	'''Returns a gtk.Label if a display is available'''
+	try:
+		import gtk
+		if gtk.gdk.display_get_default() is not None:
+			window = gtk.Window()
+			label = gtk.Label('Coordinates')
+			window.add(label)
+			window.show_all()
+			return label
+	except (ImportError, RuntimeError):
+		pass
+	return _Label()
+
+def reader(address):
+	'''Client process: reads until the server closes the connection'''
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	sock.connect(address)
+	while sock.recv(65536):
+		pass
+	os._exit(0)
+
+def run(name, display, count, per_iteration, label):
+	address = '\0vinput-bench-mouse-%i-%s' % (os.getpid(), name)
+	server = ServerSocketThread((400, 400), address, socket.AF_UNIX,
+	                            flush_mode=FLUSH_FRAME)
+	server.start()
+	time.sleep(0.1)
+	pid = os.fork()
+	if pid == 0:
+		reader(address)
+	time.sleep(0.1)
+	window = _BenchWindow((400, 400), server, False, display)
+	if display != DISPLAY_NONE:
+		window.label = label
+	# Only the normal mode asks for motion hints
+	events = [_MotionEvent(i % 400, i//400 % 400, display == DISPLAY_EVENT)
+	          for i in xrange(count)]
+	cpu = os.times()
+	start = time.time()
+	for index in xrange(0, count, per_iteration):
+		for event in events[index:index+per_iteration]:
+			window.motion_notify_event(None, event)
+		window.run_idle()
+	elapsed = time.time() - start
+	cpu = sum(os.times()[:2]) - sum(cpu[:2])
+	server.close()
+	os.waitpid(pid, 0)
+	print '%-9s %9.0f events/s  %6.2f us CPU/event' % (name, count/elapsed,
+	                                                  cpu/count*1e6)
+	return count/elapsed
+
+def main():
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+	per_iteration = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+	label = make_label()
+	print '%i motion events, %i per main loop iteration, %s label' % (count,
+		per_iteration, 'GTK' if not isinstance(label, _Label) else 'no')
+	rates = [run(name, display, count, per_iteration, label)
+	         for name, display in MODES]
+	for (name, display), rate in zip(MODES[1:], rates[1:]):
+		print '%s: %.2fx the events/s of normal' % (name, rate/rates[0])
+
+if __name__ == '__main__':
+	main()
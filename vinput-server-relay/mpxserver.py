@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ This program implements a relay server: it connects as a client to
+ several vinput device servers and sends their merged events to its own
+ clients, so one set of clients can use the tables or cameras of several
+ machines.
+
+ Pointer numbers are mapped into one space without collisions and the
+ coordinates are scaled from each upstream's resolution to the output
+ resolution.
+
+ Usage: mpxserver.py [options] UPSTREAM...
+        UPSTREAM is the address of a device server, written like the
+        stream addresses of -l
+ 
+ It is written for the vinput Linux virtual input project.
+ Copyright (C) 2009 Christoph Grenz, Niklas Hambüchen
+
+ License:
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+########## Defaults ##########
+
+DEBUG = False
+DEF_CURSORCOUNT = 16
+# Milliseconds after which a pointer without events is released (0: never)
+DEF_POINTER_TIMEOUT = 0
+DEF_LISTEN_ADDR = '::'
+# The device servers use 1243
+DEF_PORT = 1244
+DEF_RESOLUTION = (1280, 720)
+
+##############################
+
+import sys
+from socket import SOCK_STREAM as _SOCK_STREAM
+
+from vinputserver import common
+from vinputserver.common import debug_output, parse_addr, SHM_FAMILY
+from vinputserver.options import ServerOptions
+from vinputserver.relay import Relay
+
+def main():
+	'''main program - creates a relay and runs it'''
+	common.DEBUG = DEBUG
+	# Process parameters; the relay flushes once per poll round
+	options = ServerOptions(DEF_RESOLUTION, (DEF_LISTEN_ADDR, DEF_PORT),
+	                        DEF_CURSORCOUNT, flush=False, latency=False)
+	pointer_timeout = DEF_POINTER_TIMEOUT
+	upstreams = []
+	args = sys.argv[1:]
+	try:
+		while len(args) > 0:
+			if args[0].startswith('--pointer-timeout='):
+				pointer_timeout = int(args[0][18:])
+				args.pop(0)
+			elif options.parse(args):
+				pass
+			elif args[0].startswith('-'):
+				print >> sys.stderr, 'Unknown parameter "%s". Aborted.' \
+				                     % args[0]
+				sys.exit(1)
+			else:
+				family, type_, _, upstream = parse_addr(args[0])
+				# Upstreams send a HELO and a frame stream
+				if family == SHM_FAMILY or type_ != _SOCK_STREAM:
+					raise ValueError, 'upstreams need a stream socket'
+				upstreams.append((upstream, family))
+				args.pop(0)
+	except IndexError:
+		print >> sys.stderr, 'Parameter "%s" needs an argument. Aborted.' \
+		                     % args[0]
+		sys.exit(1)
+	except ValueError:
+		print >> sys.stderr, 'Invalid syntax for parameter "%s". Aborted.' \
+		                     % args[0]
+		sys.exit(1)
+	if not upstreams:
+		print >> sys.stderr, 'No upstream server given. Aborted.'
+		sys.exit(1)
+	server = options.create_output()
+	server.start()
+	relay = Relay(server, upstreams, options.cursorcount, pointer_timeout)
+	if options.handoff is not None:
+		# Quit once a new relay took over the clients
+		server.on_handoff = relay.stop
+	metrics = options.start_metrics(server, relay.cursorids)
+	# Run the relay until interrupted
+	debug_output('relaying %i upstreams' % len(upstreams))
+	try:
+		relay.run()
+	except KeyboardInterrupt:
+		pass
+	debug_output('terminating')
+	for upstream in relay.upstreams:
+		upstream.close()
+		debug_output('%s: %i frames, %i connects' % (upstream.name(),
+		             upstream.frames, upstream.connects))
+	options.finish(server, metrics)
+if __name__ == '__main__':
+	main()